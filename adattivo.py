@@ -0,0 +1,137 @@
+# adattivo.py - Soglia d per blocco adattata al contenuto (budget di coefficienti o PSNR obiettivo)
+import sys
+import numpy as np
+from compressione import forward_blocks, blocks_to_image, resolve_backend, round_clip, CoefficientCache
+from metriche import psnr, PEAK
+
+def block_diagonal_energies(coeffs):
+    """Energia di ogni anti-diagonale k + l = t per ogni blocco: (righe, colonne, 2F - 1)."""
+    rows, cols, F, _ = coeffs.shape
+    diagonal = np.add.outer(np.arange(F), np.arange(F)).ravel()
+    one_hot = (diagonal[:, None] == np.arange(2 * F - 1)[None, :]).astype(np.float64)
+    squares = np.square(coeffs, dtype=np.float64).reshape(rows * cols, F * F)
+    return (squares @ one_hot).reshape(rows, cols, 2 * F - 1)
+
+def _rate_distortion(coeffs):
+    """
+    Per ogni blocco e per d = 0..2F-1: errore previsto (energia delle diagonali
+    scartate, matrice blocchi × d) e coefficienti mantenuti (vettore per d).
+    """
+    F = coeffs.shape[-1]
+    energies = block_diagonal_energies(coeffs).reshape(-1, 2 * F - 1)
+    tail = np.zeros((energies.shape[0], 2 * F))
+    tail[:, :-1] = np.cumsum(energies[:, ::-1], axis=1)[:, ::-1]
+    t = np.arange(2 * F - 1)
+    kept = np.concatenate([[0], np.cumsum(np.minimum(t + 1, 2 * F - 1 - t))])
+    return tail, kept
+
+def _allocate(tail, kept, lam):
+    """d di ogni blocco che minimizza errore + λ · coefficienti (a parità il d più piccolo)."""
+    return np.argmin(tail + lam * kept, axis=1)
+
+def _search_lambda(tail, kept, feasible, feasible_above, iterations=60):
+    """
+    Bisezione in scala logaritmica sul moltiplicatore λ. `feasible(d)` è
+    monotona in λ: con feasible_above vale per λ grandi (budget di
+    coefficienti) e si cerca il λ più piccolo, altrimenti vale per λ piccoli
+    (qualità) e si cerca il più grande. Se il vincolo è irraggiungibile
+    restituisce l'allocazione che gli si avvicina di più.
+    """
+    lam_max = float(tail[:, 0].max()) + 1.0  # con λ >= lam_max ogni blocco ha d = 0
+    edge = _allocate(tail, kept, 0.0 if feasible_above else lam_max)
+    if feasible(edge):
+        return edge
+    good, bad = (lam_max, lam_max * 1e-15) if feasible_above else (lam_max * 1e-15, lam_max)
+    if not feasible(_allocate(tail, kept, good)):
+        return _allocate(tail, kept, good)
+    for _ in range(iterations):
+        mid = np.sqrt(good * bad)
+        if feasible(_allocate(tail, kept, mid)):
+            good = mid
+        else:
+            bad = mid
+    return _allocate(tail, kept, good)
+
+def allocate_d(coeffs, budget=None, target_psnr=None):
+    """
+    Mappa (righe, colonne) delle soglie d per blocco, in [0, 2F - 1].
+
+    Ogni blocco sceglie il d che minimizza errore previsto + λ · coefficienti
+    mantenuti (Lagrangiano, vettorizzato su tutti i blocchi); λ è cercato per
+    bisezione in modo che il totale dei coefficienti mantenuti non superi
+    `budget`, oppure che il PSNR previsto (Parseval, prima di round/clip)
+    raggiunga `target_psnr`. Va indicato esattamente uno dei due vincoli.
+    """
+    if (budget is None) == (target_psnr is None):
+        raise ValueError("Indicare esattamente uno tra budget e target_psnr")
+    rows, cols, F, _ = coeffs.shape
+    tail, kept = _rate_distortion(coeffs)
+
+    if budget is not None:
+        d = _search_lambda(tail, kept, lambda d: kept[d].sum() <= budget, feasible_above=True)
+    else:
+        max_sse = rows * cols * F * F * PEAK**2 / 10 ** (target_psnr / 10)
+        blocks = np.arange(tail.shape[0])
+        d = _search_lambda(tail, kept, lambda d: tail[blocks, d].sum() <= max_sse, feasible_above=False)
+    return d.reshape(rows, cols)
+
+def adaptive_mask(F, d_map):
+    """Maschere (righe, colonne, F, F) con k + l < d del proprio blocco."""
+    diagonal = np.add.outer(np.arange(F), np.arange(F))
+    return diagonal < d_map[..., None, None]
+
+def reconstruct_adaptive(coeffs, d_map, backend=None):
+    """Come reconstruct_blocks, ma con una soglia d diversa per ogni blocco."""
+    F = coeffs.shape[-1]
+    _, inverse = resolve_backend(backend, F, coeffs.shape[0] * coeffs.shape[1], coeffs.dtype)
+    rec = inverse(coeffs * adaptive_mask(F, d_map))
+    return blocks_to_image(round_clip(rec)).astype(np.uint8)
+
+def compress_adaptive(image, F, budget=None, target_psnr=None, backend=None, coeffs=None):
+    """
+    Compressione con d per blocco. Restituisce (immagine compressa, mappa dei d).
+    Con target_psnr la scelta è confermata sulla ricostruzione vera: se
+    round/clip la portano sotto l'obiettivo si alza di poco la qualità prevista.
+    """
+    if coeffs is None:
+        coeffs = forward_blocks(image, F, backend)
+    if budget is not None:
+        d_map = allocate_d(coeffs, budget=budget)
+        return reconstruct_adaptive(coeffs, d_map, backend), d_map
+
+    goal = target_psnr
+    for _ in range(5):
+        d_map = allocate_d(coeffs, target_psnr=goal)
+        compressed = reconstruct_adaptive(coeffs, d_map, backend)
+        actual = psnr(image, compressed)
+        if actual >= target_psnr:
+            break
+        goal += target_psnr - actual + 0.05
+    return compressed, d_map
+
+if __name__ == "__main__":
+    # Confronto a parità di PSNR: coefficienti mantenuti con d globale e con d per blocco
+    import os
+    from cache_immagini import load_gray
+    print("=" * 60)
+    print("SOGLIA d ADATTIVA PER BLOCCO")
+    print("=" * 60)
+    names = sys.argv[1:] or sorted(f for f in os.listdir('immagini') if f.endswith('.bmp'))
+    F = 8
+    for name in names:
+        path = name if os.path.exists(name) else os.path.join('immagini', name)
+        image = load_gray(path)
+        if min(image.shape) < F:
+            continue
+        cache = CoefficientCache()
+        coeffs = cache.get(image, F)
+        n_blocks = coeffs.shape[0] * coeffs.shape[1]
+        print(f"\n {os.path.basename(path)} {image.shape[1]}x{image.shape[0]}")
+        for target in [30, 40]:
+            d, _, global_psnr = cache.compress_to_psnr(image, F, target)
+            compressed, d_map = compress_adaptive(image, F, target_psnr=target, coeffs=coeffs)
+            kept_global = n_blocks * int((np.add.outer(np.arange(F), np.arange(F)) < d).sum())
+            kept_adaptive = int(adaptive_mask(F, d_map).sum())
+            print(f"   PSNR >= {target} dB: d globale={d:2d} -> {kept_global:8d} coeff. ({global_psnr:5.2f} dB)"
+                  f"  |  d per blocco -> {kept_adaptive:8d} coeff. ({psnr(image, compressed):5.2f} dB)"
+                  f"  {100 * (1 - kept_adaptive / kept_global):5.1f}% in meno")
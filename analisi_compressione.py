@@ -1,37 +1,14 @@
 # analisi_compressione.py 
 import numpy as np
 import matplotlib.pyplot as plt
-from PIL import Image
-from utils import dct2_fast, idct2_fast
+from compressione import compress_blocks, CoefficientCache, rate_distortion_curve
+from metriche import quality_report
+from cache_immagini import load_gray
 import os
 
 def compress_image_dct(image, F, d):
-    """Funzione di compressione DCT con gestione dimensioni"""
-    h, w = image.shape
-    num_blocks_v = h // F
-    num_blocks_h = w // F
-    
-    # Crea immagine compressa con dimensioni ridotte (scarta avanzi)
-    h_new = num_blocks_v * F
-    w_new = num_blocks_h * F
-    compressed = np.zeros((h_new, w_new))
-    
-    for i in range(num_blocks_v):
-        for j in range(num_blocks_h):
-            
-            block = image[i*F:(i+1)*F, j*F:(j+1)*F].astype(np.float64)
-            dct_block = dct2_fast(block)
-            
-            # Elimina frequenze alte
-            for k in range(F):
-                for l in range(F):
-                    if k + l >= d:
-                        dct_block[k, l] = 0
-            
-            idct_block = idct2_fast(dct_block)
-            compressed[i*F:(i+1)*F, j*F:(j+1)*F] = np.clip(np.round(idct_block), 0, 255)
-    
-    return compressed.astype(np.uint8)
+    """Funzione di compressione DCT con gestione dimensioni (scarta avanzi)"""
+    return compress_blocks(image, F, d)
 
 def analyze_compression_effects():
     """Analizza gli effetti della compressione su diverse immagini"""
@@ -74,14 +51,16 @@ def analyze_compression_effects():
     if len(available_images) == 1:
         axes = axes.reshape(1, -1)
     
+    # La DCT in avanti di ogni immagine viene calcolata una sola volta per tutti i d
+    cache = CoefficientCache()
+    
     for img_idx, img_name in enumerate(available_images):
         img_path = f'immagini/{img_name}'
         print(f" Elaborando {img_name}...")
         
         try:
-            # Carica immagine
-            img = Image.open(img_path).convert('L')
-            img_array = np.array(img)
+            # Carica immagine (pixel dalla cache .npy dopo il primo avvio)
+            img_array = load_gray(img_path)
             
             # Mostra originale
             axes[img_idx, 0].imshow(img_array, cmap='gray')
@@ -93,15 +72,10 @@ def analyze_compression_effects():
                 print(f"    Compressione con d={d}...")
                 
                 # Comprimi
-                compressed = compress_image_dct(img_array, F, d)
+                compressed = cache.compress(img_array, F, d)
                 
-                # Per calcolo MSE, usa solo la parte dell'immagine che è stata compressa
-                h_comp, w_comp = compressed.shape
-                img_cropped = img_array[:h_comp, :w_comp]
-                
-                # Calcola metriche
-                mse = np.mean((img_cropped.astype(float) - compressed.astype(float)) ** 2)
-                psnr = 10 * np.log10(255**2 / mse) if mse > 0 else float('inf')
+                # Calcola metriche (solo sulla parte dell'immagine che è stata compressa)
+                quality = quality_report(img_array, compressed)
                 
                 # Calcola compressione
                 kept = sum(1 for k in range(F) for l in range(F) if k+l < d)
@@ -110,7 +84,7 @@ def analyze_compression_effects():
                 # Mostra immagine compressa
                 axes[img_idx, d_idx + 1].imshow(compressed, cmap='gray')
                 axes[img_idx, d_idx + 1].set_title(
-                    f'd={d}\nComp:{compression:.0f}%\nPSNR:{psnr:.1f}dB',
+                    f'd={d}\nComp:{compression:.0f}%\nPSNR:{quality["psnr"]:.1f}dB SSIM:{quality["ssim"]:.3f}',
                     fontsize=9
                 )
                 axes[img_idx, d_idx + 1].axis('off')
@@ -171,6 +145,40 @@ def plot_frequency_spectrum():
     
     plt.show()
 
+def plot_rate_distortion():
+    """PSNR previsto nel dominio DCT (Parseval) ed effettivo per ogni d, con una sola DCT per immagine"""
+    print(" Generando curve tasso-distorsione...")
+    
+    F = 8
+    test_images = [name for name in ['bridge.bmp', 'cathedral.bmp', 'gradient.bmp', '640x640.bmp']
+                   if os.path.exists(f'immagini/{name}')]
+    if not test_images:
+        print(" Nessuna immagine trovata nella cartella 'immagini/'")
+        return
+    
+    fig, axes = plt.subplots(1, len(test_images), figsize=(5 * len(test_images), 4), squeeze=False)
+    fig.suptitle(f'PSNR al variare di d (F={F}): previsione e misura', fontsize=14)
+    for ax, img_name in zip(axes[0], test_images):
+        img_array = load_gray(f'immagini/{img_name}')
+        curve = rate_distortion_curve(img_array, F, exact=True)
+        ax.plot(curve['d'], curve['psnr'], 's--', label='previsto (Parseval)')
+        ax.plot(curve['d'], curve['psnr_exact'], 'o-', label='effettivo (round/clip)')
+        ax.set_title(img_name)
+        ax.set_xlabel('d')
+        ax.set_ylabel('PSNR (dB)')
+        ax.grid(True, alpha=0.3)
+        ax.legend()
+    
+    plt.tight_layout()
+    
+    try:
+        plt.savefig('risultati/curve_tasso_distorsione.png', dpi=150, bbox_inches='tight')
+        print(" Curve salvate in: risultati/curve_tasso_distorsione.png")
+    except Exception as e:
+        print(f" Errore nel salvare le curve: {e}")
+    
+    plt.show()
+
 if __name__ == "__main__":
     print("=" * 60)
     print("ANALISI AVANZATA COMPRESSIONE DCT")
@@ -190,6 +198,9 @@ if __name__ == "__main__":
     print("\n Fase 2: Analisi effetti compressione")
     analyze_compression_effects()
     
+    print("\n Fase 3: Curve tasso-distorsione")
+    plot_rate_distortion()
+    
     print("\n Analisi completata!")
     print(" Per continuare, premi ENTER nel terminale...")
     input()  # Pausa finale per vedere tutti i messaggi
\ No newline at end of file
@@ -0,0 +1,112 @@
+# autotuning.py - Scelta automatica del backend DCT più veloce su questa macchina
+import json
+import os
+import time
+import numpy as np
+from utils import DCT_BACKENDS, HAVE_SCIPY, get_backend
+
+# Profilo locale (uno per macchina): si può spostare con la variabile DCT_PROFILE
+PROFILE_PATH = os.environ.get(
+    'DCT_PROFILE', os.path.join(os.path.expanduser('~'), '.dct_backend_profile.json'))
+
+# Backend usato se l'autotuning è disattivato o non può scrivere il profilo
+# (senza SciPy la DCT via FFT di NumPy dà gli stessi coefficienti)
+DEFAULT_BACKEND = 'scipy' if HAVE_SCIPY else 'numpy_fft'
+
+_profile_cache = {}
+
+def batch_bucket(n_blocks):
+    """
+    Arrotonda il numero di blocchi alla potenza di 2 superiore (tra 64 e 4096):
+    oltre qualche migliaio di blocchi la classifica dei backend non cambia più
+    e misurare lotti più grandi renderebbe lento l'autotuning al primo uso.
+    """
+    n = 64
+    while n < n_blocks and n < 4096:
+        n *= 2
+    return n
+
+def _profile_key(F, batch, dtype=np.float64):
+    key = f"F={F},batch={batch}"
+    if np.dtype(dtype) != np.float64:
+        key += f",{np.dtype(dtype).name}"
+    return key
+
+def time_backend(name, F, batch, repeats=5, dtype=np.float64):
+    """Miglior tempo (s) di un giro DCT2 + IDCT2 su `batch` blocchi F×F."""
+    forward, inverse = get_backend(name)
+    blocks = np.random.default_rng(0).uniform(0, 255, size=(batch, F, F)).astype(dtype)
+    inverse(forward(blocks, dtype=dtype))  # warm-up (cache delle basi, piani FFT)
+    best = float('inf')
+    for _ in range(repeats):
+        start = time.perf_counter()
+        inverse(forward(blocks, dtype=dtype))
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def load_profile(path=None):
+    """Legge il profilo salvato ({chiave: {"backend": ..., "timings": {...}}})."""
+    path = path or PROFILE_PATH
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_profile(profile, path=None):
+    path = path or PROFILE_PATH
+    tmp = f"{path}.tmp"
+    with open(tmp, 'w') as f:
+        json.dump(profile, f, indent=2, sort_keys=True)
+    os.replace(tmp, path)
+
+def autotune(F, batch=1024, repeats=5, backends=None, path=None, save=True, dtype=np.float64):
+    """
+    Misura tutti i backend registrati per blocchi F×F e lotti di `batch`
+    blocchi, salva il vincitore nel profilo e lo restituisce.
+    """
+    batch = batch_bucket(batch)
+    names = backends or list(DCT_BACKENDS)
+    timings = {name: time_backend(name, F, batch, repeats, dtype) for name in names}
+    winner = min(timings, key=timings.get)
+
+    key = _profile_key(F, batch, dtype)
+    _profile_cache[(path or PROFILE_PATH, key)] = winner
+    if save:
+        profile = load_profile(path)
+        profile[key] = {'backend': winner, 'timings': timings}
+        try:
+            save_profile(profile, path)
+        except OSError as e:
+            print(f" Impossibile salvare il profilo DCT ({e})")
+    return winner, timings
+
+def best_backend(F, n_blocks=1024, path=None, tune=True, dtype=np.float64):
+    """
+    Backend più veloce per (F, numero di blocchi) secondo il profilo locale.
+    Se manca la voce e `tune` è vero esegue un autotuning rapido e lo salva.
+    """
+    key = _profile_key(F, batch_bucket(n_blocks), dtype)
+    cache_key = (path or PROFILE_PATH, key)
+    name = _profile_cache.get(cache_key)
+    if name is None:
+        entry = load_profile(path).get(key)
+        if entry and entry.get('backend') in DCT_BACKENDS:
+            name = entry['backend']
+        elif tune:
+            name, _ = autotune(F, n_blocks, repeats=3, path=path, dtype=dtype)
+        else:
+            name = DEFAULT_BACKEND
+        _profile_cache[cache_key] = name
+    return name
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("AUTOTUNING BACKEND DCT")
+    print("=" * 60)
+    for F in [4, 8, 16, 32]:
+        for batch in [64, 512, 4096]:
+            winner, timings = autotune(F, batch)
+            details = "  ".join(f"{n}={t * 1e3:.2f}ms" for n, t in timings.items())
+            print(f" F={F:2d} blocchi={batch:6d} -> {winner:10s} ({details})")
+    print(f"\n Profilo salvato in: {PROFILE_PATH}")
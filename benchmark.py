@@ -0,0 +1,192 @@
+# benchmark.py - Benchmark ripetibili dei backend DCT e della compressione completa
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+import numpy as np
+from utils import DCT_BACKENDS, get_backend
+from compressione import compress_blocks
+
+# Moduli usati come punto d'ingresso (script, GUI, worker): ne misuriamo l'avvio a freddo
+ENTRY_POINTS = ['utils', 'compressione', 'codifica', 'streaming', 'parallelo', 'griglia',
+                'parte2_compressor', 'esperimenti_finali', 'analisi_compressione', 'benchmark', 'lotto']
+
+def time_function(func, *args, warmup=2, min_time=0.2, min_reps=5, max_reps=1000):
+    """
+    Cronometra func(*args) con perf_counter_ns: qualche esecuzione di
+    riscaldamento, poi ripetizioni finché non si raggiungono sia `min_reps`
+    campioni sia `min_time` secondi totali (al massimo `max_reps`).
+    Restituisce le statistiche robuste dei tempi in secondi.
+    """
+    for _ in range(warmup):
+        func(*args)
+
+    samples = []
+    total = 0
+    while len(samples) < max_reps and (len(samples) < min_reps or total < min_time * 1e9):
+        start = time.perf_counter_ns()
+        func(*args)
+        elapsed = time.perf_counter_ns() - start
+        samples.append(elapsed)
+        total += elapsed
+
+    s = np.array(samples) / 1e9
+    q1, median, q3 = np.percentile(s, [25, 50, 75])
+    return {'median': median, 'q1': q1, 'q3': q3, 'iqr': q3 - q1,
+            'min': s.min(), 'reps': len(s)}
+
+def peak_memory(func, *args):
+    """Picco di memoria allocata (byte, via tracemalloc) durante una esecuzione di func."""
+    tracemalloc.start()
+    try:
+        func(*args)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak
+
+def synthetic_image(size, seed=0):
+    """Immagine sintetica size×size: gradiente + texture + rumore (uint8)."""
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:size, 0:size].astype(np.float32) / size
+    image = 128 + 60 * np.sin(12 * x) * np.cos(9 * y) + 50 * (x - y)
+    image += rng.normal(0, 12, size=(size, size)).astype(np.float32)
+    return np.clip(image, 0, 255).astype(np.uint8)
+
+def bench_backends(F_values, batch, min_time):
+    """DCT2 + IDCT2 di `batch` blocchi F×F per ogni backend registrato."""
+    results = []
+    for name in DCT_BACKENDS:
+        forward, inverse = get_backend(name)
+        for F in F_values:
+            blocks = np.random.default_rng(0).uniform(0, 255, size=(batch, F, F))
+            stats = time_function(lambda: inverse(forward(blocks)), min_time=min_time)
+            stats.update({
+                'key': f"backend/{name}/F={F}/batch={batch}",
+                'blocks_per_s': batch / stats['median'],
+                'peak_bytes': peak_memory(lambda: inverse(forward(blocks))),
+            })
+            results.append(stats)
+            print(f"   {name:10s} F={F:2d}: {stats['median'] * 1e3:8.3f} ms "
+                  f"(IQR {stats['iqr'] * 1e3:.3f} ms, {stats['reps']} rip.)")
+    return results
+
+def bench_compression(sizes, F_values, min_time, backend=None):
+    """Compressione completa (compress_blocks) su immagini sintetiche, in megapixel/s."""
+    results = []
+    for size in sizes:
+        image = synthetic_image(size)
+        for F in F_values:
+            for d in sorted({1, F, 2 * F - 2}):
+                stats = time_function(compress_blocks, image, F, d, backend,
+                                      warmup=1, min_time=min_time, min_reps=3)
+                stats.update({
+                    'key': f"compress/{size}x{size}/F={F}/d={d}",
+                    'megapixels_per_s': size * size / 1e6 / stats['median'],
+                    'peak_bytes': peak_memory(compress_blocks, image, F, d, backend),
+                })
+                results.append(stats)
+                print(f"   {size:5d}x{size:<5d} F={F:2d} d={d:2d}: "
+                      f"{stats['megapixels_per_s']:8.2f} MP/s  "
+                      f"(mediana {stats['median'] * 1e3:.1f} ms, IQR {stats['iqr'] * 1e3:.1f} ms, "
+                      f"picco {stats['peak_bytes'] / 2**20:.0f} MiB)")
+    return results
+
+def bench_startup(modules, repeats=5):
+    """
+    Avvio a freddo: tempo di un nuovo interprete che importa solo il modulo
+    (come una invocazione breve da CLI o un processo worker appena creato).
+    """
+    here = os.path.dirname(os.path.abspath(__file__))
+    results = []
+    for module in modules:
+        cmd = [sys.executable, '-c', f'import {module}']
+        stats = time_function(lambda: subprocess.run(cmd, cwd=here, check=True),
+                              warmup=1, min_time=0.0, min_reps=repeats, max_reps=repeats)
+        stats['key'] = f"startup/{module}"
+        results.append(stats)
+        print(f"   {module:22s} {stats['median'] * 1e3:7.1f} ms (IQR {stats['iqr'] * 1e3:.1f} ms)")
+    return results
+
+def compare_with_baseline(results, baseline, threshold=0.10):
+    """
+    Confronta le mediane con quelle di un benchmark salvato: è una regressione
+    un caso più lento di oltre `threshold` e oltre il rumore (IQR) di entrambe le misure.
+    """
+    old = {r['key']: r for r in baseline['results']}
+    regressions = []
+    for r in results:
+        b = old.get(r['key'])
+        if b is None:
+            continue
+        ratio = r['median'] / b['median']
+        noise = (r['iqr'] + b['iqr']) / b['median']
+        r['baseline_ratio'] = ratio
+        if ratio > 1 + max(threshold, noise):
+            regressions.append((r['key'], ratio))
+    return regressions
+
+def machine_info():
+    return {
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'processor': platform.processor(),
+        'cpu_count': os.cpu_count(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark DCT e compressione")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[512, 2048, 4096, 8192],
+                        help="lati delle immagini sintetiche (default fino a 8K)")
+    parser.add_argument('--F', type=int, nargs='+', default=[4, 8, 16], dest='F_values')
+    parser.add_argument('--batch', type=int, default=4096, help="blocchi per il test dei backend")
+    parser.add_argument('--min-time', type=float, default=0.5, help="secondi minimi per misura")
+    parser.add_argument('--backend', default=None, help="backend per la compressione (default autotuning)")
+    parser.add_argument('--quick', action='store_true', help="solo immagini piccole e misure brevi")
+    parser.add_argument('--output', default='risultati/benchmark.json')
+    parser.add_argument('--baseline', help="JSON di un benchmark precedente da confrontare")
+    parser.add_argument('--threshold', type=float, default=0.10, help="rallentamento tollerato (0.10 = 10%%)")
+    args = parser.parse_args(argv)
+    if args.quick:
+        args.sizes = [s for s in args.sizes if s <= 1024] or [512]
+        args.min_time = min(args.min_time, 0.1)
+
+    print("=" * 60)
+    print("BENCHMARK DCT E COMPRESSIONE")
+    print("=" * 60)
+    print("\n Avvio a freddo (import in un nuovo interprete):")
+    results = bench_startup(ENTRY_POINTS, repeats=3 if args.quick else 5)
+    print("\n Backend DCT (DCT2 + IDCT2):")
+    results += bench_backends(args.F_values + [32], args.batch, args.min_time)
+    print("\n Compressione completa:")
+    results += bench_compression(args.sizes, args.F_values, args.min_time, args.backend)
+
+    report = {'machine': machine_info(), 'results': results}
+    status = 0
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare_with_baseline(results, baseline, args.threshold)
+        print(f"\n Confronto con {args.baseline}:")
+        if regressions:
+            for key, ratio in regressions:
+                print(f"   REGRESSIONE {key}: ×{ratio:.2f} più lento")
+            status = 1
+        else:
+            print("   Nessuna regressione")
+        report['regressions'] = [{'key': k, 'ratio': r} for k, r in regressions]
+
+    os.makedirs(os.path.dirname(args.output) or '.', exist_ok=True)
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2, default=float)
+    print(f"\n Risultati salvati in: {args.output}")
+    return status
+
+if __name__ == "__main__":
+    sys.exit(main())
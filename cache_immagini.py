@@ -0,0 +1,144 @@
+# cache_immagini.py - Cache su disco delle immagini decodificate (.npy mappati in memoria)
+import hashlib
+import os
+import threading
+import numpy as np
+from profilo import stage
+
+# Cartella e dimensione massima di default; DCT_IMAGE_CACHE=off disattiva la cache
+DEFAULT_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'dct_immagini')
+DEFAULT_MAX_BYTES = 2 * 1024**3
+
+def _decode(path, color):
+    """Decodifica con PIL: scala di grigi come convert('L'), oppure come colore.load_image."""
+    if color:
+        from colore import load_image
+        return load_image(path)
+    from PIL import Image
+    with Image.open(path) as img:
+        return np.array(img.convert('L'))
+
+class ImageCache:
+    """
+    Pixel decodificati salvati come .npy e riaperti con np.load(mmap_mode='r'):
+    dal secondo caricamento in poi nessuna decodifica e nessuna copia, le
+    pagine sono lette dal disco (o dalla page cache) solo quando servono.
+
+    La chiave è (percorso assoluto, dimensione, mtime, modalità): un file
+    modificato viene decodificato di nuovo. La cartella resta sotto
+    `max_bytes` eliminando le voci usate meno di recente (l'mtime della voce
+    è aggiornato a ogni uso). Le scritture sono atomiche (file temporaneo +
+    rename), quindi più processi possono condividere la stessa cartella.
+    Le immagini restituite dalla cache sono in sola lettura.
+    """
+
+    def __init__(self, directory=None, max_bytes=DEFAULT_MAX_BYTES):
+        directory = directory or os.environ.get('DCT_IMAGE_CACHE') or DEFAULT_DIR
+        self.enabled = directory.lower() not in ('off', '0', 'no')
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, path, color=False):
+        st = os.stat(path)
+        ident = f"{os.path.abspath(path)}|{st.st_size}|{st.st_mtime_ns}|{'auto-grey' if color else 'L'}"
+        return hashlib.sha1(ident.encode()).hexdigest()
+
+    def load(self, path, color=False):
+        """Immagine uint8 (h, w) in grigio o, con `color`, (h, w, 3) se a colori."""
+        with stage('load'):
+            return self._load(path, color)
+
+    def _load(self, path, color):
+        if not self.enabled:
+            return _decode(path, color)
+        entry = os.path.join(self.directory, self.key(path, color) + '.npy')
+        try:
+            image = np.load(entry, mmap_mode='r')
+            os.utime(entry)
+            self.hits += 1
+            return image
+        except (OSError, ValueError):
+            pass  # voce assente (o illeggibile): si decodifica e la si riscrive
+
+        self.misses += 1
+        image = _decode(path, color)
+        if image.nbytes <= self.max_bytes:
+            try:
+                self._store(entry, image)
+                self._evict(keep=entry)
+            except OSError:
+                pass  # cartella non scrivibile o disco pieno: si lavora senza cache
+        return image
+
+    def _store(self, entry, image):
+        os.makedirs(self.directory, exist_ok=True)
+        tmp = f"{entry}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, 'wb') as f:
+            np.save(f, image)
+        os.replace(tmp, entry)
+
+    def _entries(self):
+        """(mtime, byte, percorso) delle voci della cartella."""
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith('.npy'):
+                path = os.path.join(self.directory, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue  # rimossa nel frattempo da un altro processo
+                entries.append((st.st_mtime, st.st_size, path))
+        return entries
+
+    def size(self):
+        """Byte occupati dalla cache su disco."""
+        return sum(size for _, size, _ in self._entries()) if os.path.isdir(self.directory) else 0
+
+    def _evict(self, keep=None):
+        entries = self._entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+
+    def clear(self):
+        if os.path.isdir(self.directory):
+            for _, _, path in self._entries():
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+_default_cache = None
+
+def default_cache():
+    """Cache condivisa del processo (cartella da DCT_IMAGE_CACHE o ~/.cache/dct_immagini)."""
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = ImageCache()
+    return _default_cache
+
+def load_gray(path):
+    """Carica un'immagine in scala di grigi come array uint8 (dalla cache se già decodificata)."""
+    return default_cache().load(path)
+
+def load_image(path):
+    """Come colore.load_image (RGB se a colori, grigio altrimenti), dalla cache se già decodificata."""
+    return default_cache().load(path, color=True)
+
+if __name__ == "__main__":
+    import sys
+    cache = default_cache()
+    if sys.argv[1:] == ['--clear']:
+        cache.clear()
+    print(f"Cache immagini: {cache.directory} ({cache.size() / 2**20:.1f} MiB, "
+          f"massimo {cache.max_bytes / 2**20:.0f} MiB)")
@@ -0,0 +1,385 @@
+# codifica.py - Codifica entropica dei coefficienti DCT (file .dctz) e decodifica
+import os
+import struct
+import sys
+import time
+import zlib
+import numpy as np
+from compressione import forward_blocks, blocks_to_image, resolve_backend, round_clip, IncrementalReconstructor
+from metriche import psnr
+from adattivo import adaptive_mask, compress_adaptive
+from profilo import stage
+
+MAGIC = b'DCTZ'
+VERSION = 2
+# I tipi di corse e valori sono salvati come dtype.str little-endian (es. b'<i2')
+_HEADER = struct.Struct('<4sBHHIIfQQ3s3sQQ')
+
+def zigzag_order(F):
+    """
+    Indici lineari (k*F + l) dei coefficienti F×F in ordine zig-zag.
+    L'ordine procede per anti-diagonali k + l = 0, 1, 2, ...: i coefficienti
+    mantenuti con soglia d (k + l < d) sono sempre un prefisso di questo ordine.
+    """
+    k, l = np.divmod(np.arange(F * F), F)
+    s = k + l
+    return np.lexsort((np.where(s % 2 == 1, k, -k), s))
+
+def kept_count(F, d):
+    """Numero di coefficienti con k + l < d in un blocco F×F."""
+    k = np.arange(F)[:, None]
+    l = np.arange(F)[None, :]
+    return int(((k + l) < d).sum())
+
+def _smallest_dtype(arr, signed):
+    """
+    Il tipo intero più piccolo che contiene tutti i valori di `arr`, in
+    little-endian: i file hanno lo stesso formato su ogni piattaforma.
+    """
+    candidates = [np.int8, np.int16, np.int32] if signed else [np.uint8, np.uint16, np.uint32]
+    lo = int(arr.min()) if arr.size else 0
+    hi = int(arr.max()) if arr.size else 0
+    for dtype in candidates:
+        info = np.iinfo(dtype)
+        if info.min <= lo and hi <= info.max:
+            return np.dtype(dtype).newbyteorder('<')
+    return np.dtype(np.int64 if signed else np.uint64).newbyteorder('<')
+
+def _rle_zeros(stream):
+    """
+    Run-length delle sequenze di zeri (vettorizzato): per ogni valore non
+    nullo la lunghezza della corsa di zeri che lo precede e il valore stesso.
+    Gli zeri finali sono impliciti (si conosce la lunghezza totale).
+    """
+    nz = np.flatnonzero(stream)
+    runs = np.diff(nz, prepend=-1) - 1
+    return runs, stream[nz]
+
+def _unrle_zeros(runs, values, n):
+    stream = np.zeros(n, dtype=np.int64)
+    positions = np.cumsum(runs.astype(np.int64) + 1) - 1
+    stream[positions] = values
+    return stream
+
+def encode_coefficients(coeffs, d, q=1.0, level=6):
+    """
+    Codifica i coefficienti DCT dei blocchi (righe, colonne, F, F):
+      1) tiene i coefficienti con k + l < d (prefisso zig-zag) e li quantizza con passo q
+      2) il DC è codificato come differenza col blocco precedente
+      3) flusso ordinato per coefficiente (tutti i DC, poi il 2° coefficiente zig-zag, ...)
+      4) run-length degli zeri + DEFLATE (LZ77 + Huffman, zlib) di corse e valori
+    """
+    rows, cols, F, _ = coeffs.shape
+    n_kept = kept_count(F, d)
+    zz = zigzag_order(F)[:n_kept]
+
+    with stage('encode'):
+        kept = coeffs.reshape(rows * cols, F * F)[:, zz]
+        quantized = np.round(kept / q).astype(np.int64)
+        if n_kept:
+            quantized[:, 0] = np.diff(quantized[:, 0], prepend=0)
+
+        stream = quantized.T.ravel()
+        runs, values = _rle_zeros(stream)
+        runs_dtype = _smallest_dtype(runs, signed=False)
+        values_dtype = _smallest_dtype(values, signed=True)
+        runs_payload = zlib.compress(runs.astype(runs_dtype).tobytes(), level)
+        values_payload = zlib.compress(values.astype(values_dtype).tobytes(), level)
+
+    header = _HEADER.pack(MAGIC, VERSION, F, d, rows, cols, q, stream.size, values.size,
+                          runs_dtype.str.encode(), values_dtype.str.encode(),
+                          len(runs_payload), len(values_payload))
+    return header + runs_payload + values_payload
+
+def decode_coefficients(data):
+    """Inverso di encode_coefficients: coefficienti dequantizzati (righe, colonne, F, F)."""
+    (magic, version, F, d, rows, cols, q, n, nnz, runs_dtype, values_dtype,
+     len_runs, len_values) = _HEADER.unpack_from(data)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError("Formato .dctz non riconosciuto")
+
+    offset = _HEADER.size
+    runs = np.frombuffer(zlib.decompress(data[offset:offset + len_runs]), dtype=runs_dtype.decode())
+    offset += len_runs
+    values = np.frombuffer(zlib.decompress(data[offset:offset + len_values]), dtype=values_dtype.decode())
+
+    n_kept = kept_count(F, d)
+    quantized = _unrle_zeros(runs, values, n).reshape(n_kept, rows * cols).T
+    if n_kept:
+        quantized[:, 0] = np.cumsum(quantized[:, 0])
+
+    flat = np.zeros((rows * cols, F * F), dtype=np.float64)
+    flat[:, zigzag_order(F)[:n_kept]] = quantized * q
+    return flat.reshape(rows, cols, F, F), d
+
+def encode_image(image, F, d, q=1.0, backend=None, level=6):
+    """Comprime l'immagine (DCT a blocchi + taglio frequenze) in un flusso di byte .dctz."""
+    return encode_coefficients(forward_blocks(image, F, backend), d, q, level)
+
+def decode_image(data, backend=None):
+    """Decodifica un flusso .dctz nell'immagine uint8 ricostruita (ritagliata a multipli di F)."""
+    coeffs, _ = decode_coefficients(data)
+    rows, cols, F, _ = coeffs.shape
+    _, inverse = resolve_backend(backend, F, rows * cols)
+    rec = inverse(coeffs)
+    return blocks_to_image(round_clip(rec)).astype(np.uint8)
+
+def save_dctz(path, image, F, d, q=1.0, backend=None):
+    """Salva l'immagine compressa in formato .dctz e restituisce la dimensione in byte."""
+    data = encode_image(image, F, d, q, backend)
+    with stage('save'), open(path, 'wb') as f:
+        f.write(data)
+    return len(data)
+
+def load_dctz(path, backend=None):
+    with open(path, 'rb') as f:
+        return decode_image(f.read(), backend)
+
+# ---------- Soglia d per blocco (file .dcta, vedi adattivo.py) ----------
+ADAPTIVE_MAGIC = b'DCTA'
+_ADAPTIVE_HEADER = struct.Struct('<4sBIII')
+
+def encode_adaptive(coeffs, d_map, q=1.0, level=6):
+    """
+    Codifica con un d diverso per ogni blocco: la mappa dei d (uint8, DEFLATE)
+    seguita da un flusso .dctz con d = max(d_map) in cui i coefficienti oltre
+    la soglia del proprio blocco sono azzerati (costano solo corse di zeri).
+    """
+    rows, cols, F, _ = coeffs.shape
+    d_payload = zlib.compress(np.asarray(d_map, dtype=np.uint8).tobytes(), level)
+    d_max = int(d_map.max()) if d_map.size else 0
+    payload = encode_coefficients(coeffs * adaptive_mask(F, d_map), d_max, q, level)
+    return _ADAPTIVE_HEADER.pack(ADAPTIVE_MAGIC, VERSION, rows, cols, len(d_payload)) + d_payload + payload
+
+def decode_adaptive(data, backend=None):
+    """Inverso di encode_adaptive: (immagine uint8 ricostruita, mappa dei d)."""
+    magic, version, rows, cols, len_d = _ADAPTIVE_HEADER.unpack_from(data)
+    if magic != ADAPTIVE_MAGIC or version != VERSION:
+        raise ValueError("Formato .dcta non riconosciuto")
+    offset = _ADAPTIVE_HEADER.size
+    d_map = np.frombuffer(zlib.decompress(data[offset:offset + len_d]), dtype=np.uint8).reshape(rows, cols)
+    return decode_image(data[offset + len_d:], backend), d_map
+
+def save_dcta(path, image, F, budget=None, target_psnr=None, q=1.0, backend=None):
+    """Salva l'immagine compressa con d per blocco (.dcta); restituisce (byte, mappa dei d)."""
+    coeffs = forward_blocks(image, F, backend)
+    _, d_map = compress_adaptive(image, F, budget, target_psnr, backend, coeffs=coeffs)
+    data = encode_adaptive(coeffs, d_map, q)
+    with stage('save'), open(path, 'wb') as f:
+        f.write(data)
+    return len(data), d_map
+
+def load_dcta(path, backend=None):
+    with open(path, 'rb') as f:
+        return decode_adaptive(f.read(), backend)
+
+# ---------- Contenitore a tile con indice (decodifica di regioni) ----------
+TILED_MAGIC = b'DCTT'
+_TILED_HEADER = struct.Struct('<4sBHHIIfHII')
+
+def save_tiled(path, image, F, d, q=1.0, tile_blocks=32, backend=None):
+    """
+    Salva l'immagine compressa come contenitore a tile: i blocchi F×F sono
+    raggruppati in tile di tile_blocks×tile_blocks blocchi, ognuna codificata
+    come flusso .dctz indipendente. L'intestazione contiene l'indice degli
+    offset delle tile, così decode_region legge solo le tile necessarie.
+    L'immagine viene elaborata una riga di tile alla volta (va bene anche un
+    array mappato in memoria). Restituisce la dimensione del file in byte.
+    """
+    h, w = image.shape
+    rows, cols = h // F, w // F
+    n_tiles_v = -(-rows // tile_blocks)
+    n_tiles_h = -(-cols // tile_blocks)
+    index_size = 8 * (n_tiles_v * n_tiles_h + 1)
+
+    with open(path, 'wb') as f:
+        f.write(_TILED_HEADER.pack(TILED_MAGIC, VERSION, F, d, rows, cols, q,
+                                   tile_blocks, n_tiles_v, n_tiles_h))
+        f.seek(_TILED_HEADER.size + index_size)
+
+        offsets = [0]
+        for ty in range(n_tiles_v):
+            r0, r1 = ty * tile_blocks, min((ty + 1) * tile_blocks, rows)
+            strip = forward_blocks(image[r0 * F:r1 * F, :cols * F], F, backend)
+            for tx in range(n_tiles_h):
+                c0, c1 = tx * tile_blocks, min((tx + 1) * tile_blocks, cols)
+                payload = encode_coefficients(strip[:, c0:c1], d, q)
+                f.write(payload)
+                offsets.append(offsets[-1] + len(payload))
+
+        f.seek(_TILED_HEADER.size)
+        f.write(np.asarray(offsets, dtype='<u8').tobytes())
+        return _TILED_HEADER.size + index_size + offsets[-1]
+
+class TiledReader:
+    """Lettura di un contenitore a tile: decodifica solo le tile che servono."""
+
+    def __init__(self, path, backend=None):
+        self.path = path
+        self.backend = backend
+        self._file = open(path, 'rb')
+        header = self._file.read(_TILED_HEADER.size)
+        (magic, version, self.F, self.d, self.rows, self.cols, self.q,
+         self.tile_blocks, self.n_tiles_v, self.n_tiles_h) = _TILED_HEADER.unpack(header)
+        if magic != TILED_MAGIC or version != VERSION:
+            raise ValueError("Formato a tile non riconosciuto")
+        n_offsets = self.n_tiles_v * self.n_tiles_h + 1
+        self.offsets = np.frombuffer(self._file.read(8 * n_offsets), dtype='<u8')
+        self._data_start = _TILED_HEADER.size + 8 * n_offsets
+
+    @property
+    def shape(self):
+        """Dimensioni (h, w) dell'immagine ricostruita."""
+        return self.rows * self.F, self.cols * self.F
+
+    def decode_tile(self, ty, tx):
+        """Pixel (uint8) della tile (ty, tx)."""
+        i = ty * self.n_tiles_h + tx
+        self._file.seek(self._data_start + int(self.offsets[i]))
+        data = self._file.read(int(self.offsets[i + 1] - self.offsets[i]))
+        return decode_image(data, self.backend)
+
+    def decode_region(self, x, y, w, h):
+        """
+        Regione [y, y+h) × [x, x+w) dell'immagine ricostruita (limitata ai
+        bordi): vengono lette e invertite solo le tile che la intersecano.
+        """
+        H, W = self.shape
+        x0, y0 = max(0, x), max(0, y)
+        x1, y1 = min(W, x + w), min(H, y + h)
+        region = np.zeros((max(0, y1 - y0), max(0, x1 - x0)), dtype=np.uint8)
+        if region.size == 0:
+            return region
+
+        tile_px = self.tile_blocks * self.F
+        for ty in range(y0 // tile_px, (y1 - 1) // tile_px + 1):
+            for tx in range(x0 // tile_px, (x1 - 1) // tile_px + 1):
+                tile = self.decode_tile(ty, tx)
+                ty0, tx0 = ty * tile_px, tx * tile_px
+                # Intersezione tra tile e regione, in coordinate dell'immagine
+                a0, a1 = max(y0, ty0), min(y1, ty0 + tile.shape[0])
+                b0, b1 = max(x0, tx0), min(x1, tx0 + tile.shape[1])
+                region[a0 - y0:a1 - y0, b0 - x0:b1 - x0] = tile[a0 - ty0:a1 - ty0, b0 - tx0:b1 - tx0]
+        return region
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+# ---------- Flusso progressivo (un segmento per anti-diagonale) ----------
+PROGRESSIVE_MAGIC = b'DCTP'
+_PROGRESSIVE_HEADER = struct.Struct('<4sBHHIIf')
+_SEGMENT_HEADER = struct.Struct('<3s3sII')
+
+def _diagonal_indices(F, t):
+    """Indici (k, l) dell'anti-diagonale k + l = t in un blocco F×F."""
+    ks = np.arange(max(0, t - F + 1), min(t, F - 1) + 1)
+    return ks, t - ks
+
+def encode_progressive(coeffs, d, q=1.0, level=6):
+    """
+    Come encode_coefficients, ma con un segmento indipendente per ogni
+    anti-diagonale k + l = 0, 1, ..., d-1 (stesso ordine della decodifica
+    progressiva). Un prefisso del file basta per un'anteprima: il primo
+    segmento contiene i soli DC.
+    """
+    rows, cols, F, _ = coeffs.shape
+    segments = []
+    for t in range(min(d, 2 * F - 1)):
+        ks, ls = _diagonal_indices(F, t)
+        quantized = np.round(coeffs[..., ks, ls].reshape(rows * cols, len(ks)) / q).astype(np.int64)
+        if t == 0:
+            quantized[:, 0] = np.diff(quantized[:, 0], prepend=0)
+        runs, values = _rle_zeros(quantized.T.ravel())
+        runs_dtype = _smallest_dtype(runs, signed=False)
+        values_dtype = _smallest_dtype(values, signed=True)
+        runs_payload = zlib.compress(runs.astype(runs_dtype).tobytes(), level)
+        values_payload = zlib.compress(values.astype(values_dtype).tobytes(), level)
+        segments.append(_SEGMENT_HEADER.pack(runs_dtype.str.encode(), values_dtype.str.encode(),
+                                             len(runs_payload), len(values_payload))
+                        + runs_payload + values_payload)
+
+    header = _PROGRESSIVE_HEADER.pack(PROGRESSIVE_MAGIC, VERSION, F, d, rows, cols, q)
+    offsets = np.cumsum([0] + [len(s) for s in segments]).astype('<u8')
+    return header + offsets.tobytes() + b''.join(segments)
+
+def decode_progressive(data, backend=None):
+    """
+    Genera (d, immagine uint8) man mano che i segmenti delle anti-diagonali
+    sono decodificati: prima l'anteprima solo-DC, poi i raffinamenti.
+    Funziona anche su dati troncati (si ferma all'ultimo segmento completo).
+    """
+    magic, version, F, d, rows, cols, q = _PROGRESSIVE_HEADER.unpack_from(data)
+    if magic != PROGRESSIVE_MAGIC or version != VERSION:
+        raise ValueError("Formato progressivo non riconosciuto")
+    n_segments = min(d, 2 * F - 1)
+    offsets_start = _PROGRESSIVE_HEADER.size
+    offsets = np.frombuffer(data, dtype='<u8', count=n_segments + 1, offset=offsets_start)
+    data_start = offsets_start + 8 * (n_segments + 1)
+
+    # I coefficienti arrivano una diagonale alla volta: il ricostruttore
+    # incrementale legge solo le diagonali già riempite
+    coeffs = np.zeros((rows, cols, F, F), dtype=np.float64)
+    rec = IncrementalReconstructor(coeffs, backend)
+    for t in range(n_segments):
+        start = data_start + int(offsets[t])
+        if data_start + int(offsets[t + 1]) > len(data):
+            return
+        runs_dtype, values_dtype, len_runs, len_values = _SEGMENT_HEADER.unpack_from(data, start)
+        start += _SEGMENT_HEADER.size
+        runs = np.frombuffer(zlib.decompress(data[start:start + len_runs]), dtype=runs_dtype.decode())
+        start += len_runs
+        values = np.frombuffer(zlib.decompress(data[start:start + len_values]), dtype=values_dtype.decode())
+
+        ks, ls = _diagonal_indices(F, t)
+        quantized = _unrle_zeros(runs, values, len(ks) * rows * cols).reshape(len(ks), rows * cols).T
+        if t == 0:
+            quantized[:, 0] = np.cumsum(quantized[:, 0])
+        coeffs[..., ks, ls] = (quantized * q).reshape(rows, cols, len(ks))
+        yield t + 1, rec.set_d(t + 1)
+
+def codec_stats(image, F, d, q=1.0, backend=None):
+    """
+    Misura reale della codifica: byte prodotti, bit per pixel, rapporto
+    rispetto agli 8 bpp originali, velocità di codifica/decodifica (MB/s
+    di pixel) e PSNR della ricostruzione decodificata.
+    """
+    start = time.perf_counter()
+    data = encode_image(image, F, d, q, backend)
+    t_encode = time.perf_counter() - start
+
+    start = time.perf_counter()
+    decoded = decode_image(data, backend)
+    t_decode = time.perf_counter() - start
+
+    h, w = decoded.shape
+    pixels = h * w
+    return {
+        'bytes': len(data),
+        'bpp': 8 * len(data) / pixels if pixels else 0.0,
+        'ratio': pixels / len(data),
+        'encode_MBps': pixels / 1e6 / t_encode if t_encode > 0 else float('inf'),
+        'decode_MBps': pixels / 1e6 / t_decode if t_decode > 0 else float('inf'),
+        'psnr': psnr(image, decoded),
+    }
+
+if __name__ == "__main__":
+    from PIL import Image
+    print("=" * 60)
+    print("CODIFICA ENTROPICA .dctz")
+    print("=" * 60)
+    names = sys.argv[1:] or sorted(f for f in os.listdir('immagini') if f.endswith('.bmp'))
+    for name in names:
+        path = name if os.path.exists(name) else os.path.join('immagini', name)
+        image = np.array(Image.open(path).convert('L'))
+        print(f"\n {os.path.basename(path)} {image.shape[1]}x{image.shape[0]}")
+        for F, d in [(8, 4), (8, 8), (8, 14)]:
+            s = codec_stats(image, F, d)
+            print(f"   F={F} d={d:2d}: {s['bytes']:8d} byte  {s['bpp']:5.2f} bpp  "
+                  f"×{s['ratio']:5.1f}  PSNR {s['psnr']:5.2f} dB  "
+                  f"enc {s['encode_MBps']:6.1f} MB/s  dec {s['decode_MBps']:6.1f} MB/s")
@@ -0,0 +1,198 @@
+# colore.py - Immagini a colori: YCbCr, sottocampionamento della crominanza, DCT a blocchi dei tre piani
+import os
+import sys
+import numpy as np
+from compressione import image_to_blocks, blocks_to_image, resolve_backend, round_clip, compress_blocks
+from adattivo import adaptive_mask
+from metriche import psnr, mse as compute_mse, psnr_from_mse, diagonal_energies
+from profilo import stage
+
+# Conversione JPEG/JFIF (ITU-R BT.601 a escursione piena): Cb e Cr centrati su 128
+_RGB_TO_YCBCR = np.array([[0.299, 0.587, 0.114],
+                          [-0.168736, -0.331264, 0.5],
+                          [0.5, -0.418688, -0.081312]])
+_YCBCR_TO_RGB = np.linalg.inv(_RGB_TO_YCBCR)
+_OFFSET = np.array([0.0, 128.0, 128.0])
+
+# Fattori di sottocampionamento della crominanza (verticale, orizzontale)
+SUBSAMPLING = {'4:4:4': (1, 1), '4:2:2': (1, 2), '4:2:0': (2, 2)}
+
+def rgb_to_ycbcr(rgb, dtype=np.float64):
+    """Immagine (h, w, 3) RGB -> (h, w, 3) YCbCr in virgola mobile."""
+    return rgb.astype(dtype) @ _RGB_TO_YCBCR.T.astype(dtype) + _OFFSET.astype(dtype)
+
+def ycbcr_to_rgb(ycbcr):
+    """Inverso di rgb_to_ycbcr, arrotondato (vedi round_clip) e limitato a uint8."""
+    return round_clip((ycbcr - _OFFSET) @ _YCBCR_TO_RGB.T).astype(np.uint8)
+
+def subsample(plane, factors):
+    """Media su celle fy×fx (bordi replicati se le dimensioni non sono multiple)."""
+    fy, fx = factors
+    if (fy, fx) == (1, 1):
+        return plane
+    h, w = plane.shape
+    padded = np.pad(plane, ((0, -h % fy), (0, -w % fx)), mode='edge')
+    return padded.reshape(padded.shape[0] // fy, fy, padded.shape[1] // fx, fx).mean(axis=(1, 3))
+
+def upsample(plane, factors, shape):
+    """Replica ogni campione su fy×fx pixel e ritaglia alle dimensioni `shape`."""
+    fy, fx = factors
+    h, w = shape
+    return np.repeat(np.repeat(plane[:-(-h // fy), :-(-w // fx)], fy, axis=0), fx, axis=1)[:h, :w]
+
+def _pad_to_blocks(plane, F):
+    """Estende il piano (bordi replicati) a multipli di F: la crominanza è codificata tutta."""
+    h, w = plane.shape
+    return np.pad(plane, ((0, -h % F), (0, -w % F)), mode='edge')
+
+def forward_color(image, F, subsampling='4:2:0', backend=None, dtype=np.float64):
+    """
+    Conversione in YCbCr, sottocampionamento di Cb e Cr e DCT2 dei blocchi
+    F×F dei tre piani in un unico lotto. Restituisce (coefficienti (n, F, F),
+    layout), con layout = ((h, w) ritagliate, sottocampionamento, forme delle
+    griglie di blocchi dei tre piani): da passare a reconstruct_color.
+    """
+    factors = SUBSAMPLING[subsampling]
+    h, w = image.shape[0] // F * F, image.shape[1] // F * F
+    with stage('crop'):
+        ycbcr = rgb_to_ycbcr(image[:h, :w], dtype)
+        planes = [ycbcr[..., 0]] + [_pad_to_blocks(subsample(ycbcr[..., c], factors), F) for c in (1, 2)]
+        grids = [image_to_blocks(p, F) for p in planes]
+        batch = np.concatenate([g.reshape(-1, F, F) for g in grids])
+
+    forward, _ = resolve_backend(backend, F, len(batch), dtype)
+    with stage('forward'):
+        coeffs = forward(batch, dtype=dtype)
+    return coeffs, ((h, w), subsampling, [g.shape for g in grids])
+
+def reconstruct_color(coeffs, layout, d, d_chroma=None, backend=None):
+    """
+    Taglio k + l >= d sulla luminanza e k + l >= d_chroma sulla crominanza,
+    IDCT2, crominanza riportata a piena risoluzione e ritorno in RGB (uint8).
+    Non modifica `coeffs` (riutilizzabili per altri d).
+    """
+    if d_chroma is None:
+        d_chroma = d
+    (h, w), subsampling, shapes = layout
+    F = coeffs.shape[-1]
+    counts = [rows * cols for rows, cols, _, _ in shapes]
+    _, inverse = resolve_backend(backend, F, len(coeffs), coeffs.dtype)
+    thresholds = np.repeat([d, d_chroma, d_chroma], counts)
+    with stage('mask'):
+        masked = coeffs * adaptive_mask(F, thresholds)
+    with stage('inverse'):
+        rec = inverse(masked, dtype=coeffs.dtype)
+
+    with stage('round_clip'):
+        out = np.empty((h, w, 3), dtype=coeffs.dtype)
+        start = 0
+        for c, shape in enumerate(shapes):
+            plane = blocks_to_image(rec[start:start + counts[c]].reshape(shape))
+            start += counts[c]
+            out[..., c] = plane if c == 0 else upsample(plane, SUBSAMPLING[subsampling], (h, w))
+        return ycbcr_to_rgb(out)
+
+def compress_color(image, F, d, d_chroma=None, subsampling='4:2:0', backend=None, dtype=np.float64):
+    """
+    Compressione DCT di un'immagine RGB (h, w, 3):
+      1) conversione in YCbCr e sottocampionamento di Cb e Cr (`subsampling`)
+      2) i blocchi F×F dei tre piani in un unico lotto: una sola DCT2/IDCT2
+      3) taglio k + l >= d sulla luminanza e k + l >= d_chroma sulla crominanza
+      4) crominanza riportata a piena risoluzione e ritorno in RGB (uint8)
+    Come per il grigio l'immagine è ritagliata a multipli di F. Con 4:2:0 i
+    blocchi da trasformare sono la metà di quelli di tre piani interi.
+    Un'immagine in scala di grigi (h, w) passa direttamente a compress_blocks.
+    """
+    if image.ndim == 2:
+        return compress_blocks(image, F, d, backend, dtype)
+    coeffs, layout = forward_color(image, F, subsampling, backend, dtype)
+    return reconstruct_color(coeffs, layout, d, d_chroma, backend)
+
+def _truncation_mse(coeffs, layout):
+    """
+    Errore RGB previsto dal taglio k + l >= d, per d = 0..2F-1, senza IDCT:
+    energia delle diagonali scartate di ogni piano (Parseval), pesata con la
+    norma della colonna di YCbCr -> RGB e, per la crominanza, con i pixel
+    coperti da ogni campione (fy·fx). I canali sono supposti indipendenti.
+    """
+    (h, w), subsampling, shapes = layout
+    F = coeffs.shape[-1]
+    fy, fx = SUBSAMPLING[subsampling]
+    weights = np.sum(_YCBCR_TO_RGB ** 2, axis=0) * [1, fy * fx, fy * fx]
+    tail = np.zeros(2 * F)
+    start = 0
+    for c, (rows, cols, _, _) in enumerate(shapes):
+        energies = diagonal_energies(coeffs[start:start + rows * cols])
+        start += rows * cols
+        tail[:-1] += weights[c] * np.cumsum(energies[::-1])[::-1]
+    return tail / (3 * h * w)
+
+def color_d_for_target_psnr(image, F, target_psnr, subsampling='4:2:0', backend=None, transform=None):
+    """
+    Il più piccolo d (uguale per luminanza e crominanza) con PSNR RGB >=
+    target_psnr, con una sola DCT in avanti (forward_color; `transform`
+    permette di riusare (coefficienti, layout) già calcolati). Come
+    d_for_target_psnr per il grigio, il d di partenza viene dall'errore
+    previsto nel dominio DCT (più quello di conversione e sottocampionamento,
+    misurato con tutti i coefficienti); poche ricostruzioni vere lo
+    confermano scendendo o salendo di un passo alla volta. Restituisce
+    (d, immagine compressa, PSNR); se l'obiettivo è irraggiungibile d = 2F - 2.
+    """
+    coeffs, layout = transform if transform is not None else forward_color(image, F, subsampling, backend)
+    d_max = 2 * F - 2
+
+    def compress(d):
+        compressed = reconstruct_color(coeffs, layout, d, backend=backend)
+        return compressed, psnr(image, compressed)
+
+    base = compute_mse(image, compress(2 * F - 1)[0])
+    predicted = [psnr_from_mse(base + t) for t in _truncation_mse(coeffs, layout)[:d_max + 1]]
+    d = next((d for d, value in enumerate(predicted) if value >= target_psnr), d_max)
+
+    compressed, value = compress(d)
+    if value >= target_psnr:
+        while d > 0:
+            lower = compress(d - 1)
+            if lower[1] < target_psnr:
+                break
+            d, (compressed, value) = d - 1, lower
+    else:
+        while value < target_psnr and d < d_max:
+            d += 1
+            compressed, value = compress(d)
+    return d, compressed, value
+
+def load_image(path):
+    """
+    Immagine come array: (h, w, 3) RGB se a colori, (h, w) se in scala di
+    grigi, anche quando il grigio è salvato in RGB (es. BMP a 24 bit con
+    R == G == B): così passa per il percorso in grigio, più economico.
+    """
+    from PIL import Image
+    with Image.open(path) as img:
+        if img.mode in ('L', '1', 'I', 'I;16', 'F'):
+            return np.array(img.convert('L'))
+        rgb = np.array(img.convert('RGB'))
+    if np.array_equal(rgb[..., 0], rgb[..., 1]) and np.array_equal(rgb[..., 1], rgb[..., 2]):
+        return np.ascontiguousarray(rgb[..., 0])
+    return rgb
+
+if __name__ == "__main__":
+    # Confronto dei sottocampionamenti sulle immagini a colori
+    import time
+    print("=" * 60)
+    print("COMPRESSIONE A COLORI (YCbCr)")
+    print("=" * 60)
+    names = sys.argv[1:] or sorted(f for f in os.listdir('immagini') if f.endswith('.bmp'))
+    F, d = 8, 8
+    for name in names:
+        path = name if os.path.exists(name) else os.path.join('immagini', name)
+        image = load_image(path)
+        if image.ndim == 2:
+            continue
+        print(f"\n {os.path.basename(path)} {image.shape[1]}x{image.shape[0]}  F={F} d={d}")
+        for mode in SUBSAMPLING:
+            start = time.perf_counter()
+            compressed = compress_color(image, F, d, subsampling=mode)
+            elapsed = time.perf_counter() - start
+            print(f"   {mode}: PSNR {psnr(image, compressed):5.2f} dB  {elapsed * 1e3:7.1f} ms")
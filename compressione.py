@@ -0,0 +1,399 @@
+# compressione.py - Motore di compressione DCT vettorizzato (condiviso da GUI e script)
+import hashlib
+from collections import OrderedDict
+import numpy as np
+from utils import get_backend, _dct_matrix
+from autotuning import best_backend
+from metriche import diagonal_energies, predicted_mse, psnr, psnr_from_mse, mse as compute_mse
+from profilo import stage
+
+def image_to_blocks(image: np.ndarray, F: int) -> np.ndarray:
+    """
+    Ritaglia l'immagine a multipli di F (scarta gli avanzi) e la vede come
+    tensore di blocchi (righe, colonne, F, F). Nessuna copia: è una vista.
+    """
+    h, w = image.shape
+    num_blocks_v = h // F
+    num_blocks_h = w // F
+    cropped = image[:num_blocks_v * F, :num_blocks_h * F]
+    return cropped.reshape(num_blocks_v, F, num_blocks_h, F).swapaxes(1, 2)
+
+def blocks_to_image(blocks: np.ndarray) -> np.ndarray:
+    """Operazione inversa di image_to_blocks: (righe, colonne, F, F) -> (righe*F, colonne*F)."""
+    rows, cols, F, _ = blocks.shape
+    return blocks.swapaxes(1, 2).reshape(rows * F, cols * F)
+
+def frequency_mask(F: int, d: int) -> np.ndarray:
+    """Maschera booleana F×F delle frequenze mantenute (k + l < d)."""
+    k = np.arange(F)[:, None]
+    l = np.arange(F)[None, :]
+    return (k + l) < d
+
+# Distanza da x.5 entro cui un valore conta come pareggio: i backend (e la
+# ricostruzione incrementale) differiscono di pochi ulp, e molti pixel cadono
+# esattamente a metà (es. medie di 64 interi). I pareggi vanno sempre per difetto.
+TIE_TOLERANCE = {np.dtype(np.float64): 1e-6, np.dtype(np.float32): 1e-3}
+
+def round_clip(rec: np.ndarray) -> np.ndarray:
+    """
+    Arrotondamento all'intero più vicino (pareggi x.5 per difetto, con
+    tolleranza TIE_TOLERANCE) e limitazione a [0, 255], in place su `rec`.
+    Regola unica per tutte le ricostruzioni: l'uscita non dipende dal
+    backend, dal numero di blocchi né dal percorso (completo o incrementale).
+    """
+    rec += 0.5 - TIE_TOLERANCE.get(rec.dtype, 1e-6)
+    np.floor(rec, out=rec)
+    np.clip(rec, 0, 255, out=rec)
+    return rec
+
+def resolve_backend(backend, F, n_blocks, dtype=np.float64):
+    """
+    Coppia (DCT2, IDCT2) da usare: quella indicata per nome oppure, se
+    `backend` è None, la più veloce su questa macchina (vedi autotuning.py).
+    """
+    if backend is None:
+        backend = best_backend(F, n_blocks, dtype=dtype)
+    return get_backend(backend)
+
+def forward_blocks(image: np.ndarray, F: int, backend=None, dtype=np.float64,
+                   progress=None) -> np.ndarray:
+    """
+    DCT2 di tutti i blocchi F×F dell'immagine: tensore (righe, colonne, F, F).
+    `dtype` è la precisione del calcolo: float64 (default) oppure float32,
+    che dimezza memoria e banda ed è sufficiente per immagini a 8 bit.
+    Con `progress` il calcolo procede a strisce di righe di blocchi e dopo
+    ognuna chiama progress(righe fatte, righe totali); se la callback solleva
+    un'eccezione il calcolo si interrompe (annullamento).
+    """
+    blocks = image_to_blocks(image, F)
+    rows, cols = blocks.shape[:2]
+    forward, _ = resolve_backend(backend, F, rows * cols, dtype)
+    if progress is None:
+        with stage('crop'):
+            blocks = blocks.astype(dtype)
+        with stage('forward'):
+            return forward(blocks, dtype=dtype)
+
+    coeffs = np.empty(blocks.shape, dtype=dtype)
+    step = max(1, 4096 // max(cols, 1))  # circa 4096 blocchi per striscia
+    for start in range(0, rows, step):
+        stop = min(start + step, rows)
+        with stage('crop'):
+            strip = blocks[start:stop].astype(dtype)
+        with stage('forward'):
+            coeffs[start:stop] = forward(strip, dtype=dtype)
+        progress(stop, rows)
+    return coeffs
+
+def reconstruct_blocks(coeffs: np.ndarray, d: int, backend=None, out=None) -> np.ndarray:
+    """
+    Taglio frequenze (k + l >= d) -> IDCT2 -> round/clip a partire dai
+    coefficienti DCT dei blocchi. Non modifica `coeffs` (riutilizzabili per altri d).
+    Il calcolo avviene nella precisione dei coefficienti (float64 o float32).
+    Se `out` (uint8, righe*F × colonne*F) è dato, il risultato è scritto lì.
+    """
+    F = coeffs.shape[-1]
+    _, inverse = resolve_backend(backend, F, coeffs.shape[0] * coeffs.shape[1], coeffs.dtype)
+
+    # Elimina le frequenze alte in tutti i blocchi con un'unica maschera
+    with stage('mask'):
+        masked = coeffs * frequency_mask(F, d)
+    with stage('inverse'):
+        rec = inverse(masked)
+
+    # Arrotondamento e limitazione dei valori
+    with stage('round_clip'):
+        round_clip(rec)
+        if out is None:
+            return blocks_to_image(rec).astype(np.uint8)
+        np.copyto(image_to_blocks(out, F), rec, casting='unsafe')
+    return out
+
+def compress_blocks(image: np.ndarray, F: int, d: int, backend=None, dtype=np.float64,
+                    out=None, workspace=None) -> np.ndarray:
+    """
+    Compressione DCT su tutta l'immagine in poche chiamate vettorizzate:
+    blocchi -> DCT2 -> taglio frequenze (k + l >= d) -> IDCT2 -> round/clip.
+    Restituisce l'immagine ritagliata a multipli di F, in uint8.
+    `backend` è il nome di un backend registrato in utils (None = autotuning),
+    `dtype` la precisione del calcolo (np.float64 o np.float32).
+    Con `out` il risultato è scritto nell'array uint8 indicato; con `workspace`
+    (CompressionWorkspace) non viene fatta nessuna allocazione grande: il
+    workspace deve corrispondere a forma, F e dtype (ValueError altrimenti) e
+    calcola come il backend 'gemm'.
+    """
+    if workspace is not None:
+        if not workspace.matches(image.shape, F, dtype):
+            raise ValueError(f"Workspace per forma {workspace.shape}, F={workspace.F}, {workspace.dtype}: "
+                             f"non adatto a forma {image.shape}, F={F}, {np.dtype(dtype)}")
+        if backend not in (None, 'gemm'):
+            raise ValueError(f"Il workspace usa il backend 'gemm', non {backend!r}")
+        return workspace.compress(image, d, out)
+    return reconstruct_blocks(forward_blocks(image, F, backend, dtype), d, backend, out)
+
+def d_for_target_psnr(coeffs, original, target_psnr, d_max=None, backend=None, reconstruct=None):
+    """
+    Più piccolo d la cui compressione ha PSNR >= target_psnr (dB).
+
+    La ricerca binaria su d in [0, d_max] (default 2F - 2) usa il PSNR previsto
+    nel dominio DCT dalle energie per anti-diagonale, senza nessuna IDCT;
+    poi una sola ricostruzione conferma la scelta (round/clip possono
+    peggiorare di poco l'errore: in quel caso si prova il d successivo).
+    `reconstruct(d)` sostituisce reconstruct_blocks (es. IncrementalReconstructor.set_d).
+    Restituisce (d, immagine compressa, PSNR effettivo); se l'obiettivo non è
+    raggiungibile il d è d_max.
+    """
+    F = coeffs.shape[-1]
+    d_max = 2 * F - 2 if d_max is None else d_max
+    energies = diagonal_energies(coeffs)
+    n_pixels = coeffs.shape[0] * coeffs.shape[1] * F * F
+
+    lo, hi = 0, d_max
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if psnr_from_mse(predicted_mse(energies, mid, n_pixels)) >= target_psnr:
+            hi = mid
+        else:
+            lo = mid + 1
+
+    if reconstruct is None:
+        reconstruct = lambda d: reconstruct_blocks(coeffs, d, backend)
+    d = lo
+    while True:
+        compressed = reconstruct(d)
+        actual = psnr(original, compressed)
+        if actual >= target_psnr or d >= d_max:
+            return d, compressed, actual
+        d += 1
+
+def rate_distortion_curve(image, F, backend=None, dtype=np.float64, exact=False, coeffs=None):
+    """
+    Curva tasso-distorsione per tutti i d da 0 a 2F - 2 con una sola DCT in avanti.
+
+    Con la DCT ortonormale l'errore prima di round/clip per la soglia d è
+    l'energia delle anti-diagonali k + l >= d: dalle energie cumulate per
+    diagonale si ottiene l'intera curva senza nessuna IDCT. Con exact=True
+    si misura anche l'errore vero (con round/clip) ricostruendo in modo
+    incrementale una diagonale alla volta (IncrementalReconstructor).
+    `coeffs` permette di riusare coefficienti già calcolati (es. dalla cache).
+    Restituisce un dizionario di array, un valore per d: 'd', 'kept'
+    (coefficienti mantenuti per blocco), 'compression' (% scartata), 'mse' e
+    'psnr' previsti e, con exact=True, 'mse_exact' e 'psnr_exact'.
+    """
+    if coeffs is None:
+        coeffs = forward_blocks(image, F, backend, dtype)
+    d = np.arange(2 * F - 1)
+    lengths = np.minimum(d + 1, 2 * F - 1 - d)  # coefficienti sull'anti-diagonale t
+    kept = np.concatenate([[0], np.cumsum(lengths)[:-1]])
+    n_pixels = coeffs.shape[0] * coeffs.shape[1] * F * F
+    # Errore previsto per d: energia delle diagonali t >= d (somme cumulate dalla fine)
+    energies = diagonal_energies(coeffs)
+    mse = np.cumsum(energies[::-1])[::-1][:len(d)] / n_pixels
+
+    curve = {
+        'd': d,
+        'kept': kept,
+        'compression': (1 - kept / (F * F)) * 100,
+        'mse': mse,
+        'psnr': np.array([psnr_from_mse(m) for m in mse]),
+    }
+    if exact:
+        rec = IncrementalReconstructor(coeffs, backend)
+        curve['mse_exact'] = np.array([compute_mse(image, rec.set_d(t)) for t in d])
+        curve['psnr_exact'] = np.array([psnr_from_mse(m) for m in curve['mse_exact']])
+    return curve
+
+class CompressionWorkspace:
+    """
+    Buffer preallocati per una forma di immagine e un F: blocchi, coefficienti
+    e intermedi della DCT vengono riusati a ogni compressione, e il risultato
+    è scritto direttamente in un array uint8 (del chiamante o interno).
+    Usa la DCT a matrici con base in cache (np.matmul con out=), per cui
+    l'uscita coincide bit a bit con il backend 'gemm'.
+    """
+
+    def __init__(self, shape, F, dtype=np.float64):
+        h, w = shape
+        self.shape = (h, w)
+        self.F = F
+        self.dtype = np.dtype(dtype)
+        rows, cols = h // F, w // F
+        self.coeffs = np.empty((rows, cols, F, F), dtype=self.dtype)
+        self._work = np.empty_like(self.coeffs)
+        self._tmp = np.empty_like(self.coeffs)
+        self.out = np.empty((rows * F, cols * F), dtype=np.uint8)
+        self._D = _dct_matrix(F, self.dtype)
+        self._masks = {}
+
+    def matches(self, shape, F, dtype=np.float64):
+        """Vero se il workspace è adatto a (forma, F, dtype)."""
+        return tuple(shape) == self.shape and F == self.F and np.dtype(dtype) == self.dtype
+
+    def _mask(self, d):
+        mask = self._masks.get(d)
+        if mask is None:
+            mask = self._masks[d] = frequency_mask(self.F, d).astype(self.dtype)
+        return mask
+
+    def forward(self, image):
+        """DCT2 dei blocchi di `image` in self.coeffs (nessuna allocazione grande)."""
+        with stage('crop'):
+            np.copyto(self._work, image_to_blocks(image, self.F), casting='unsafe')
+        with stage('forward'):
+            np.matmul(self._D, self._work, out=self._tmp)
+            np.matmul(self._tmp, self._D.T, out=self.coeffs)
+        return self.coeffs
+
+    def reconstruct(self, d, out=None):
+        """Taglio frequenze + IDCT2 + round/clip dei coefficienti correnti, scritti in `out`."""
+        with stage('mask'):
+            np.multiply(self.coeffs, self._mask(d), out=self._work)
+        with stage('inverse'):
+            np.matmul(self._D.T, self._work, out=self._tmp)
+            np.matmul(self._tmp, self._D, out=self._work)
+        with stage('round_clip'):
+            round_clip(self._work)
+            out = self.out if out is None else out
+            np.copyto(image_to_blocks(out, self.F), self._work, casting='unsafe')
+        return out
+
+    def compress(self, image, d, out=None):
+        """forward + reconstruct: compressione completa senza allocazioni grandi."""
+        self.forward(image)
+        return self.reconstruct(d, out)
+
+def image_key(image: np.ndarray) -> str:
+    """Chiave di contenuto dell'immagine (hash di pixel, forma e tipo)."""
+    image = np.ascontiguousarray(image)
+    h = hashlib.sha1()
+    h.update(f"{image.shape}{image.dtype}".encode())
+    h.update(image.data)
+    return h.hexdigest()
+
+class CoefficientCache:
+    """
+    Cache LRU dei coefficienti DCT per (hash immagine, F).
+
+    La DCT in avanti viene calcolata una sola volta: ogni d successivo costa
+    solo maschera + IDCT. Quando la memoria occupata supera `max_bytes`
+    vengono eliminate le voci usate meno di recente.
+    """
+
+    def __init__(self, max_bytes=512 * 1024**2, backend=None, dtype=np.float64):
+        self.max_bytes = max_bytes
+        self.backend = backend
+        self.dtype = dtype
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, image, F, progress=None):
+        """
+        Coefficienti DCT dei blocchi di `image` (calcolati solo alla prima richiesta).
+        `progress` è passata a forward_blocks quando il calcolo è necessario.
+        """
+        key = (image_key(image), F)
+        coeffs = self._entries.get(key)
+        if coeffs is not None:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return coeffs
+
+        self.misses += 1
+        coeffs = forward_blocks(image, F, self.backend, self.dtype, progress)
+        coeffs.flags.writeable = False
+        self._entries[key] = coeffs
+        self.nbytes += coeffs.nbytes
+        self._evict()
+        return coeffs
+
+    def compress(self, image, F, d):
+        """Come compress_blocks, ma riusa i coefficienti in cache."""
+        return reconstruct_blocks(self.get(image, F), d, self.backend)
+
+    def compress_to_psnr(self, image, F, target_psnr, d_max=None):
+        """Compressione con il più piccolo d che raggiunge target_psnr: (d, immagine, PSNR)."""
+        return d_for_target_psnr(self.get(image, F), image, target_psnr, d_max, self.backend)
+
+    def clear(self):
+        self._entries.clear()
+        self.nbytes = 0
+
+    def _evict(self):
+        # Tiene sempre almeno l'ultima voce inserita, anche se da sola supera il limite
+        while self.nbytes > self.max_bytes and len(self._entries) > 1:
+            _, old = self._entries.popitem(last=False)
+            self.nbytes -= old.nbytes
+
+class IncrementalReconstructor:
+    """
+    Ricostruzione incrementale per diagonali (la IDCT è lineare).
+
+    La ricostruzione con soglia d+1 è quella con soglia d più il contributo
+    della sola anti-diagonale k + l = d: spostare d di un passo costa il
+    contributo di una diagonale invece di una compressione completa.
+    Gli errori di arrotondamento accumulati sono assorbiti dalla regola dei
+    pareggi di round_clip: il risultato coincide con reconstruct_blocks.
+    """
+
+    def __init__(self, coeffs, backend=None):
+        self.coeffs = coeffs
+        self.F = coeffs.shape[-1]
+        self.d = 0
+        self.partial = np.zeros(coeffs.shape, dtype=coeffs.dtype)
+
+        self._D = _dct_matrix(self.F, coeffs.dtype)
+        _, self._inverse = resolve_backend(backend, self.F, coeffs.shape[0] * coeffs.shape[1],
+                                           coeffs.dtype)
+
+    @property
+    def d_max(self):
+        """Soglia oltre la quale tutti i coefficienti sono mantenuti."""
+        return 2 * self.F - 1
+
+    def diagonal_contribution(self, t):
+        """
+        Contributo nel dominio dei pixel della sola anti-diagonale k + l = t:
+        somma di n_t prodotti esterni D[k]ᵀ·D[l], senza una IDCT completa.
+        """
+        ks = np.arange(max(0, t - self.F + 1), min(t, self.F - 1) + 1)
+        ls = t - ks
+        vals = self.coeffs[..., ks, ls]                      # (..., n_t)
+        left = vals[..., :, None] * self._D[ks]               # (..., n_t, F)
+        return np.swapaxes(left, -1, -2) @ self._D[ls]        # (..., F, F)
+
+    def set_d(self, d):
+        """Porta la ricostruzione parziale alla soglia d e restituisce l'immagine uint8."""
+        d = min(max(int(d), 0), self.d_max)
+
+        if d == 0:
+            self.partial[...] = 0
+        elif abs(d - self.d) > d:
+            # Più economico ripartire da zero che sommare/sottrarre tante diagonali
+            self.partial = self._inverse(self.coeffs * frequency_mask(self.F, d))
+        else:
+            for t in range(self.d, d):
+                self.partial += self.diagonal_contribution(t)
+            for t in range(d, self.d):
+                self.partial -= self.diagonal_contribution(t)
+        self.d = d
+        return self.image()
+
+    def image(self):
+        """Round/clip della ricostruzione parziale corrente -> immagine uint8."""
+        return blocks_to_image(round_clip(self.partial.copy())).astype(np.uint8)
+
+def progressive_reconstructions(coeffs, d_max=None, backend=None):
+    """
+    Decodifica progressiva per selezione spettrale: genera (d, immagine uint8)
+    per d = 1, 2, ..., d_max aggiungendo un'anti-diagonale alla volta.
+    Il primo risultato è l'anteprima con il solo DC (media di ogni blocco).
+    """
+    rec = IncrementalReconstructor(coeffs, backend)
+    d_max = rec.d_max if d_max is None else min(d_max, rec.d_max)
+    for d in range(1, d_max + 1):
+        yield d, rec.set_d(d)
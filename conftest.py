@@ -0,0 +1,20 @@
+# conftest.py - Impostazioni comuni ai test (pytest)
+import atexit
+import os
+import shutil
+import tempfile
+import pytest
+
+# Il profilo dell'autotuning misurato dai test resta in una cartella temporanea
+# invece di ~/.dct_backend_profile.json: la variabile va impostata prima che
+# autotuning venga importato (conftest.py è caricato prima dei moduli di test)
+_PROFILE_DIR = tempfile.mkdtemp(prefix='dct_test_')
+os.environ['DCT_PROFILE'] = os.path.join(_PROFILE_DIR, 'profile.json')
+atexit.register(shutil.rmtree, _PROFILE_DIR, True)
+
+@pytest.fixture(autouse=True)
+def _image_cache(tmp_path_factory, monkeypatch):
+    """Cache delle immagini decodificate (load_gray, run_grid) in una cartella temporanea, non in ~/.cache"""
+    import cache_immagini
+    monkeypatch.setenv('DCT_IMAGE_CACHE', str(tmp_path_factory.mktemp('cache_immagini')))
+    monkeypatch.setattr(cache_immagini, '_default_cache', None)
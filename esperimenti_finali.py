@@ -1,94 +1,82 @@
 # esperimenti_finali.py - VERSIONE CORRETTA
 import os
 import numpy as np
-from PIL import Image
-from utils import dct2_fast, idct2_fast
-import pandas as pd
+from compressione import compress_blocks, rate_distortion_curve
+from griglia import ResultStore, run_grid
+from cache_immagini import load_gray
+import profilo
 
 def compress_image(image, F, d):
-    """Comprimi immagine con DCT gestendo dimensioni"""
-    h, w = image.shape
-    num_blocks_v = h // F
-    num_blocks_h = w // F
-    
-    # Dimensioni finali dopo scarto avanzi
-    h_new = num_blocks_v * F
-    w_new = num_blocks_h * F
-    compressed = np.zeros((h_new, w_new))
-    
-    for i in range(num_blocks_v):
-        for j in range(num_blocks_h):
-            block = image[i*F:(i+1)*F, j*F:(j+1)*F].astype(np.float64)
-            dct_block = dct2_fast(block)
-            
-            for k in range(F):
-                for l in range(F):
-                    if k + l >= d:
-                        dct_block[k, l] = 0
-            
-            idct_block = idct2_fast(dct_block)
-            compressed[i*F:(i+1)*F, j*F:(j+1)*F] = np.clip(np.round(idct_block), 0, 255)
-    
-    return compressed.astype(np.uint8)
+    """Comprimi immagine con DCT gestendo dimensioni (scarta avanzi)"""
+    return compress_blocks(image, F, d)
+
+D_PERCENTAGES = [0.25, 0.5, 0.75, 1.0]  # Percentuale di d_max
+
+def d_for(F, d_perc):
+    d = int(d_perc * (2 * F - 2))
+    return d if d > 0 else 1
+
+def table_rows(store, hashes, F_values, d_percentages=D_PERCENTAGES):
+    """
+    Righe della tabella degli esperimenti lette dall'archivio. Le celle senza
+    risultato (job fallito, es. ritaglio più piccolo della finestra SSIM)
+    sono segnalate e saltate: la tabella contiene le altre.
+    """
+    results = []
+    for img_name, image_hash in hashes.items():
+        for F in F_values:
+            for d_perc in d_percentages:
+                r = store.get(image_hash, F, d_for(F, d_perc))
+                if r is None or r['ssim'] is None:
+                    print(f"   {img_name} F={F} d={d_for(F, d_perc)}: nessun risultato, skip...")
+                    continue
+                psnr = r['psnr']
+                compression_ratio = (1 - r['kept'] / (F * F)) * 100
+                
+                # Calcola pixel scartati
+                pixels_total = r['height'] * r['width']
+                pixels_lost = pixels_total - r['height_comp'] * r['width_comp']
+                pixels_lost_perc = (pixels_lost / pixels_total) * 100
+                
+                results.append({
+                    'Immagine': img_name.replace('.bmp', ''),
+                    'Dim. Orig.': f"{r['height']}x{r['width']}",
+                    'F': F,
+                    'd': r['d'],
+                    'd/d_max': f"{d_perc:.0%}",
+                    'Compressione %': f"{compression_ratio:.1f}",
+                    'PSNR (dB)': f"{psnr:.2f}",
+                    'SSIM': f"{r['ssim']:.4f}",
+                    'Pixel Scartati %': f"{pixels_lost_perc:.1f}",
+                    'Qualità': 'Eccellente' if psnr > 40 else 'Buona' if psnr > 30 else 'Accettabile' if psnr > 20 else 'Scarsa'
+                })
+    return results
 
-def run_experiments():
+def run_experiments(workers=None):
     """Esegui esperimenti sistematici per la relazione"""
+    import pandas as pd  # importato solo qui: è il modulo più lento da caricare
     
     # Crea cartella risultati se non esiste
     os.makedirs('risultati', exist_ok=True)
     
     images = ['bridge.bmp', 'cathedral.bmp', 'gradient.bmp', '640x640.bmp', 'shoe.bmp']
     F_values = [4, 8, 16]
-    d_percentages = [0.25, 0.5, 0.75, 1.0]  # Percentuale di d_max
-    
-    results = []
+    d_percentages = D_PERCENTAGES
     
-    for img_name in images:
-        try:
-            img = Image.open(f'immagini/{img_name}').convert('L')
-            img_array = np.array(img)
-            print(f"\nProcessando {img_name} - Dimensioni: {img_array.shape}")
-            
-            for F in F_values:
-                d_max = 2 * F - 2
-                
-                for d_perc in d_percentages:
-                    d = int(d_perc * d_max)
-                    if d == 0:
-                        d = 1
-                    
-                    # Comprimi
-                    compressed = compress_image(img_array, F, d)
-                    
-                    # Calcola MSE usando solo la parte compressa
-                    h_comp, w_comp = compressed.shape
-                    img_cropped = img_array[:h_comp, :w_comp]
-                    
-                    mse = np.mean((img_cropped.astype(float) - compressed.astype(float)) ** 2)
-                    psnr = 10 * np.log10(255**2 / mse) if mse > 0 else 100
-                    
-                    kept = sum(1 for k in range(F) for l in range(F) if k+l < d)
-                    compression_ratio = (1 - kept/(F*F)) * 100
-                    
-                    # Calcola pixel scartati
-                    pixels_lost = (img_array.shape[0] * img_array.shape[1]) - (h_comp * w_comp)
-                    pixels_lost_perc = (pixels_lost / (img_array.shape[0] * img_array.shape[1])) * 100
-                    
-                    results.append({
-                        'Immagine': img_name.replace('.bmp', ''),
-                        'Dim. Orig.': f"{img_array.shape[0]}x{img_array.shape[1]}",
-                        'F': F,
-                        'd': d,
-                        'd/d_max': f"{d_perc:.0%}",
-                        'Compressione %': f"{compression_ratio:.1f}",
-                        'PSNR (dB)': f"{psnr:.2f}",
-                        'Pixel Scartati %': f"{pixels_lost_perc:.1f}",
-                        'Qualità': 'Eccellente' if psnr > 40 else 'Buona' if psnr > 30 else 'Accettabile' if psnr > 20 else 'Scarsa'
-                    })
-                    
-        except FileNotFoundError:
-            print(f"   File {img_name} non trovato, skip...")
-            continue
+    # I risultati numerici finiscono nell'archivio man mano che sono calcolati:
+    # rieseguendo lo script si calcolano solo le celle mancanti
+    with ResultStore() as store:
+        hashes, new_results = run_grid(
+            [(img_name, f'immagini/{img_name}') for img_name in images],
+            F_values,
+            lambda F: [d_for(F, p) for p in d_percentages],
+            store,
+            workers=workers,
+        )
+        print(f" Nuovi risultati calcolati: {new_results}")
+        
+        # Le tabelle vengono generate dall'archivio
+        results = table_rows(store, hashes, F_values, d_percentages)
     
     # Crea DataFrame e salva
     df = pd.DataFrame(results)
@@ -104,14 +92,68 @@ def run_experiments():
     # Mostra alcune righe significative
     print("\n Esempi con F=8 (standard JPEG):")
     df_f8 = df[df['F'] == 8]
-    print(df_f8[['Immagine', 'd', 'Compressione %', 'PSNR (dB)', 'Qualità']].to_string(index=False))
+    print(df_f8[['Immagine', 'd', 'Compressione %', 'PSNR (dB)', 'SSIM', 'Qualità']].to_string(index=False))
     
     print("\n Statistiche Generali:")
     print(f"  - Numero totale esperimenti: {len(df)}")
-    print(f"  - PSNR medio: {df['PSNR (dB)'].apply(lambda x: float(x)).mean():.2f} dB")
-    print(f"  - Migliore PSNR: {df['PSNR (dB)'].apply(lambda x: float(x)).max():.2f} dB")
-    print(f"  - Peggiore PSNR: {df['PSNR (dB)'].apply(lambda x: float(x)).min():.2f} dB")
+    # PSNR infinito = ricostruzione identica all'originale: escluso dalle medie
+    psnr_values = df['PSNR (dB)'].apply(lambda x: float(x))
+    finite = psnr_values[np.isfinite(psnr_values)]
+    print(f"  - PSNR medio: {finite.mean():.2f} dB")
+    print(f"  - Migliore PSNR: {finite.max():.2f} dB")
+    print(f"  - Peggiore PSNR: {finite.min():.2f} dB")
+    print(f"  - Ricostruzioni identiche all'originale: {len(psnr_values) - len(finite)}")
+    
+    return df
+
+def run_rate_distortion(images=None, F_values=(4, 8, 16)):
+    """
+    Curve tasso-distorsione complete (tutti i d da 0 a 2F-2) con una sola DCT
+    per immagine e F: PSNR previsto (Parseval) ed effettivo (con round/clip).
+    Salva la tabella in risultati/curve_rd.csv e il grafico in risultati/curve_rd.png.
+    """
+    import pandas as pd
+    import matplotlib.pyplot as plt
+    
+    os.makedirs('risultati', exist_ok=True)
+    images = images or ['bridge.bmp', 'cathedral.bmp', 'gradient.bmp', '640x640.bmp', 'shoe.bmp']
+    rows = []
+    fig, axes = plt.subplots(1, len(F_values), figsize=(6 * len(F_values), 5), squeeze=False)
+    for img_name in images:
+        try:
+            image = load_gray(f'immagini/{img_name}')
+        except FileNotFoundError:
+            print(f"   File {img_name} non trovato, skip...")
+            continue
+        for ax, F in zip(axes[0], F_values):
+            curve = rate_distortion_curve(image, F, exact=True)
+            for i, d in enumerate(curve['d']):
+                rows.append({
+                    'Immagine': img_name.replace('.bmp', ''),
+                    'F': F,
+                    'd': int(d),
+                    'Coefficienti': f"{curve['kept'][i]}/{F * F}",
+                    'Compressione %': round(curve['compression'][i], 1),
+                    'PSNR previsto (dB)': round(curve['psnr'][i], 2),
+                    'PSNR (dB)': round(curve['psnr_exact'][i], 2),
+                })
+            finite = np.isfinite(curve['psnr_exact'])
+            ax.plot(curve['compression'][finite], curve['psnr_exact'][finite], 'o-',
+                    markersize=3, label=img_name.replace('.bmp', ''))
+    
+    for ax, F in zip(axes[0], F_values):
+        ax.set_title(f'Curva tasso-distorsione (F={F})')
+        ax.set_xlabel('Coefficienti scartati (%)')
+        ax.set_ylabel('PSNR (dB)')
+        ax.grid(True, alpha=0.3)
+        ax.legend()
+    plt.tight_layout()
+    plt.savefig('risultati/curve_rd.png', dpi=150, bbox_inches='tight')
+    plt.close(fig)
     
+    df = pd.DataFrame(rows)
+    df.to_csv('risultati/curve_rd.csv', index=False)
+    print(f" Curve tasso-distorsione: {len(df)} punti in risultati/curve_rd.csv e risultati/curve_rd.png")
     return df
 
 if __name__ == "__main__":
@@ -126,4 +168,8 @@ if __name__ == "__main__":
         import pandas as pd
     
     df = run_experiments()
-    print("\n Esperimenti completati! Risultati salvati in risultati/tabella_esperimenti.csv")
\ No newline at end of file
+    run_rate_distortion()
+    print("\n Esperimenti completati! Risultati salvati in risultati/tabella_esperimenti.csv")
+    if profilo.is_enabled():  # DCT_STAGE_PROFILE=1 python esperimenti_finali.py
+        profilo.print_report()
+        print(" Profilo salvato in: " + ", ".join(profilo.save('risultati/profilo_esperimenti')))
\ No newline at end of file
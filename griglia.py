@@ -0,0 +1,157 @@
+# griglia.py - Griglia di esperimenti (immagine, F, d) parallela e riprendibile
+import os
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from compressione import CompressionWorkspace, frequency_mask, image_key
+from metriche import mse as compute_mse, psnr_from_mse, ssim as compute_ssim
+from cache_immagini import load_gray
+import profilo
+
+STORE_PATH = 'risultati/esperimenti.sqlite'
+
+_COLUMNS = ['image_hash', 'image', 'F', 'd', 'height', 'width',
+            'height_comp', 'width_comp', 'kept', 'mse', 'psnr', 'ssim']
+
+class ResultStore:
+    """
+    Archivio su disco dei risultati numerici, con chiave (hash immagine, F, d).
+    Ogni risultato viene salvato appena calcolato: un'interruzione non perde
+    il lavoro fatto e una nuova esecuzione salta le celle già presenti.
+    """
+
+    def __init__(self, path=STORE_PATH):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            " image_hash TEXT, image TEXT, F INTEGER, d INTEGER,"
+            " height INTEGER, width INTEGER, height_comp INTEGER, width_comp INTEGER,"
+            " kept INTEGER, mse REAL, psnr REAL, ssim REAL,"
+            " PRIMARY KEY (image_hash, F, d))")
+        # Archivi creati prima dell'SSIM: si aggiunge la colonna e le vecchie
+        # righe (senza SSIM) risultano mancanti, quindi vengono ricalcolate
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(results)")}
+        if 'ssim' not in columns:
+            self.conn.execute("ALTER TABLE results ADD COLUMN ssim REAL")
+        self.conn.commit()
+
+    def done(self, image_hash, F):
+        """Valori di d già calcolati per (immagine, F)."""
+        cur = self.conn.execute(
+            "SELECT d FROM results WHERE image_hash = ? AND F = ? AND ssim IS NOT NULL",
+            (image_hash, F))
+        return {d for (d,) in cur}
+
+    def add(self, row):
+        self.conn.execute(
+            f"INSERT OR REPLACE INTO results ({', '.join(_COLUMNS)}) "
+            f"VALUES ({', '.join('?' * len(_COLUMNS))})",
+            [row[c] for c in _COLUMNS])
+        self.conn.commit()
+
+    def get(self, image_hash, F, d):
+        cur = self.conn.execute(
+            f"SELECT {', '.join(_COLUMNS)} FROM results "
+            "WHERE image_hash = ? AND F = ? AND d = ?", (image_hash, F, d))
+        row = cur.fetchone()
+        return dict(zip(_COLUMNS, row)) if row else None
+
+    def rows(self):
+        cur = self.conn.execute(f"SELECT {', '.join(_COLUMNS)} FROM results ORDER BY image, F, d")
+        return [dict(zip(_COLUMNS, row)) for row in cur]
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def _run_job(path, image_hash, name, F, d_values):
+    """
+    Worker: una sola DCT in avanti per (immagine, F), poi maschera + IDCT per
+    ogni d richiesto. Restituisce i risultati numerici, uno per d.
+    """
+    image = load_gray(path)
+    # Buffer riusati per tutti i d: nessuna allocazione grande per cella
+    workspace = CompressionWorkspace(image.shape, F)
+    workspace.forward(image)
+    results = []
+    for d in d_values:
+        compressed = workspace.reconstruct(d)
+        h_comp, w_comp = compressed.shape
+        mse = compute_mse(image, compressed)
+        results.append({
+            'image_hash': image_hash, 'image': name, 'F': F, 'd': d,
+            'height': image.shape[0], 'width': image.shape[1],
+            'height_comp': h_comp, 'width_comp': w_comp,
+            'kept': int(frequency_mask(F, d).sum()), 'mse': mse, 'psnr': float(psnr_from_mse(mse)),
+            'ssim': float(compute_ssim(image, compressed)),
+        })
+    return results
+
+def run_grid(images, F_values, d_values_for, store, workers=None):
+    """
+    Esegue la griglia immagini × F × d saltando le celle già nell'archivio.
+    `images` è una lista di (nome, percorso), `d_values_for(F)` i d da provare.
+    I job (uno per immagine e F, con i soli d mancanti) vanno a un pool di
+    processi e i risultati sono salvati man mano che arrivano.
+    Un'immagine illeggibile o un job che fallisce (es. ritaglio troppo
+    piccolo per l'SSIM) viene segnalato e saltato: il resto della griglia
+    prosegue e le celle mancanti restano da calcolare alla prossima esecuzione.
+    Restituisce {nome: hash} delle immagini caricate e il numero di nuovi risultati.
+    """
+    hashes = {}
+    jobs = []
+    for name, path in images:
+        try:
+            hashes[name] = image_key(load_gray(path))
+        except FileNotFoundError:
+            print(f"   File {name} non trovato, skip...")
+            continue
+        except Exception as e:
+            print(f"   File {name} illeggibile ({e}), skip...")
+            continue
+        for F in F_values:
+            missing = [d for d in d_values_for(F) if d not in store.done(hashes[name], F)]
+            if missing:
+                jobs.append((path, hashes[name], name, F, missing))
+
+    print(f" Job da eseguire: {len(jobs)} ({sum(len(j[-1]) for j in jobs)} celle mancanti)")
+    new_results = 0
+    if workers == 1:
+        for job in jobs:
+            try:
+                rows = _run_job(*job)
+            except Exception as e:
+                print(f"   {job[2]} F={job[3]} fallito: {e}")
+                continue
+            for row in rows:
+                store.add(row)
+                new_results += 1
+        return hashes, new_results
+
+    # Con la profilazione attiva i worker restituiscono anche i propri tempi per stadio
+    profiled = profilo.is_enabled()
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as executor:
+        if profiled:
+            futures = {executor.submit(profilo.run_profiled, _run_job, *job): job for job in jobs}
+        else:
+            futures = {executor.submit(_run_job, *job): job for job in jobs}
+        for future in as_completed(futures):
+            _, _, name, F, _ = futures[future]
+            try:
+                rows = future.result()
+            except Exception as e:
+                print(f"   {name} F={F} fallito: {e}")
+                continue
+            if profiled:
+                rows, profile = rows
+                profilo.merge(profile)
+            for row in rows:
+                store.add(row)
+                new_results += 1
+            print(f"   {name} F={F} completato")
+    return hashes, new_results
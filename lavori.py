@@ -0,0 +1,144 @@
+# lavori.py - Compressione in un thread di sottofondo con avanzamento e annullamento
+import queue
+import threading
+from compressione import CoefficientCache, IncrementalReconstructor, d_for_target_psnr
+from colore import forward_color, reconstruct_color, color_d_for_target_psnr
+
+class JobCancelled(Exception):
+    """Il lavoro è stato annullato o sostituito da una richiesta più recente."""
+
+class CompressionWorker:
+    """
+    Thread di sottofondo che esegue le compressioni richieste dalla GUI.
+
+    submit(image, F, d) accoda un lavoro e ne restituisce il numero
+    (submit_target cerca invece il più piccolo d con un PSNR obiettivo); ogni
+    nuova richiesta (o cancel()) rende superate quelle precedenti, che si
+    interrompono alla prima striscia di blocchi utile. I messaggi per il
+    thread principale arrivano sulla coda `results` (thread-safe), da leggere
+    per esempio con after() di Tk:
+
+        ('progress', job, righe fatte, righe totali)  DCT in avanti a strisce
+        ('preview', job, d, immagine)                  anteprima progressiva
+        ('done', job, F, d, immagine)                  risultato finale
+        ('error', job, eccezione)
+
+    Coefficienti e ricostruttore incrementale sono usati solo da questo
+    thread: cambiare soltanto d riparte dallo stato dell'ultimo lavoro.
+    Per le immagini a colori (h, w, 3) i coefficienti di forward_color
+    restano in memoria per (immagine, F, sottocampionamento): un nuovo d
+    costa solo reconstruct_color. L'avanzamento è per stadi (2 = DCT in
+    avanti e ricostruzione) e l'annullamento è controllato tra uno e l'altro.
+    """
+
+    def __init__(self, cache=None, preview=True):
+        self.cache = cache if cache is not None else CoefficientCache()
+        self.preview = preview
+        self.results = queue.Queue()
+        self._requests = queue.Queue()
+        self._generation = 0
+        self._lock = threading.Lock()
+        self._closed = False
+        self._image = None
+        self._reconstructor = None
+        self._color = None  # (immagine, F, sottocampionamento, coefficienti, layout)
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, image, F, d, subsampling='4:2:0'):
+        """Accoda la compressione di `image` con (F, d) e restituisce il numero del lavoro."""
+        with self._lock:
+            self._generation += 1
+            job = self._generation
+        self._requests.put((job, image, F, d, None, subsampling))
+        return job
+
+    def submit_target(self, image, F, target_psnr, subsampling='4:2:0'):
+        """Come submit, ma con il più piccolo d che raggiunge target_psnr (dB)."""
+        with self._lock:
+            self._generation += 1
+            job = self._generation
+        self._requests.put((job, image, F, None, target_psnr, subsampling))
+        return job
+
+    def cancel(self):
+        """Annulla il lavoro in corso e quelli in coda."""
+        with self._lock:
+            self._generation += 1
+
+    def close(self):
+        """Ferma il thread (dopo aver annullato il lavoro in corso)."""
+        self._closed = True
+        self.cancel()
+        self._requests.put(None)
+        self._thread.join()
+
+    def _check(self, job):
+        if job != self._generation:
+            raise JobCancelled
+
+    def _run(self):
+        while not self._closed:
+            request = self._requests.get()
+            # Tra più richieste in coda conta solo la più recente
+            while request is not None:
+                try:
+                    request = self._requests.get_nowait()
+                except queue.Empty:
+                    break
+            if request is None:
+                continue
+            job = request[0]
+            try:
+                self._process(*request)
+            except JobCancelled:
+                pass
+            except Exception as e:
+                self.results.put(('error', job, e))
+
+    def _process(self, job, image, F, d, target_psnr, subsampling):
+        self._check(job)
+        if image.ndim == 3:
+            # Colore: i tre piani YCbCr in un solo lotto di blocchi, DCT solo se
+            # cambiano immagine, F o sottocampionamento
+            cached = self._color
+            if cached is None or cached[0] is not image or cached[1:3] != (F, subsampling):
+                self._color = None
+                self.results.put(('progress', job, 0, 2))
+                coeffs, layout = forward_color(image, F, subsampling)
+                self._color = cached = (image, F, subsampling, coeffs, layout)
+            _, _, _, coeffs, layout = cached
+            self._check(job)
+            self.results.put(('progress', job, 1, 2))
+            if target_psnr is not None:
+                d, compressed, _ = color_d_for_target_psnr(image, F, target_psnr, subsampling,
+                                                           transform=(coeffs, layout))
+            else:
+                compressed = reconstruct_color(coeffs, layout, d)
+            self._check(job)
+            self.results.put(('done', job, F, d, compressed))
+            return
+
+        def progress(done, total):
+            self._check(job)
+            self.results.put(('progress', job, done, total))
+
+        rec = self._reconstructor
+        if rec is None or rec.F != F or self._image is not image:
+            self._reconstructor = None
+            coeffs = self.cache.get(image, F, progress)
+            rec = IncrementalReconstructor(coeffs)
+            self._reconstructor, self._image = rec, image
+            if self.preview and d is not None:
+                # Anteprima solo-DC e poi un'anti-diagonale alla volta fino a d
+                for t in range(1, d):
+                    self._check(job)
+                    self.results.put(('preview', job, t, rec.set_d(t)))
+
+        self._check(job)
+        if target_psnr is not None:
+            # Ricerca nel dominio DCT, una sola ricostruzione (incrementale) di conferma
+            _, compressed, _ = d_for_target_psnr(rec.coeffs, image, target_psnr, reconstruct=rec.set_d)
+        else:
+            compressed = rec.set_d(d)
+        self.results.put(('done', job, F, rec.d, compressed))
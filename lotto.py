@@ -0,0 +1,317 @@
+# lotto.py - Compressione a riga di comando di molte immagini: lettura, calcolo e scrittura in pipeline
+import argparse
+import glob
+import os
+import queue
+import sys
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from compressione import forward_blocks, d_for_target_psnr
+from colore import SUBSAMPLING, compress_color, color_d_for_target_psnr, load_image
+from codifica import encode_coefficients, decode_image
+from metriche import psnr
+import profilo
+from profilo import stage
+
+EXTENSIONS = ('.bmp', '.png', '.jpg', '.jpeg', '.tif', '.tiff', '.gif', '.webp', '.ppm', '.pgm')
+FORMATS = ('png', 'bmp', 'dctz')
+
+def collect_inputs(patterns, recursive=False):
+    """File immagine indicati da cartelle o pattern glob, senza duplicati e in ordine."""
+    paths = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            if recursive:
+                found = (os.path.join(root, f) for root, _, files in os.walk(pattern) for f in files)
+            else:
+                found = (os.path.join(pattern, f) for f in os.listdir(pattern))
+        else:
+            found = glob.glob(pattern, recursive=recursive)
+        paths += [p for p in found if os.path.isfile(p) and p.lower().endswith(EXTENSIONS)]
+    return sorted(set(paths))
+
+def output_paths(paths, output_dir, fmt):
+    """
+    Percorsi di uscita: la struttura relativa alla radice comune degli ingressi
+    è mantenuta e l'estensione diventa quella del formato. Se più ingressi
+    darebbero lo stesso nome (es. a.bmp e a.png) questi conservano anche
+    l'estensione di origine (a.bmp.png, a.png.png): nessuno sovrascrive l'altro.
+    Se restano nomi uguali (caso patologico) solleva ValueError prima di iniziare.
+    """
+    if not paths:
+        return []
+    root = os.path.commonpath([os.path.dirname(os.path.abspath(p)) for p in paths])
+    relative = [os.path.relpath(os.path.abspath(p), root) for p in paths]
+    stems = [os.path.splitext(r)[0] for r in relative]
+    counts = Counter(os.path.normcase(s) for s in stems)
+    outputs = [os.path.join(output_dir, (r if counts[os.path.normcase(s)] > 1 else s) + '.' + fmt)
+               for r, s in zip(relative, stems)]
+    clashes = [p for p, n in Counter(os.path.normcase(p) for p in outputs).items() if n > 1]
+    if clashes:
+        raise ValueError(f"Più ingressi con la stessa uscita: {', '.join(clashes)}")
+    return outputs
+
+def compress_image(image, F, d=None, target_psnr=None, fmt='png', subsampling='4:2:0',
+                   backend=None, measure=True):
+    """
+    Stadio di calcolo per una immagine (funzione di modulo: eseguibile anche
+    in un processo separato). Restituisce (dati, d, PSNR): i byte del flusso
+    .dctz oppure l'immagine compressa uint8 da scrivere in bmp/png. Il PSNR è
+    None se `measure` è falso (e non serve per la ricerca di d).
+    """
+    if min(image.shape[:2]) < F:
+        raise ValueError(f"Immagine più piccola di F={F}")
+    if fmt == 'dctz':
+        if image.ndim == 3:
+            raise ValueError("Il formato .dctz è solo per immagini in scala di grigi (usare --grey)")
+        coeffs = forward_blocks(image, F, backend)
+        value = None
+        if target_psnr is not None:
+            # PSNR confermato sul file decodificato (coefficienti quantizzati), non sui coefficienti esatti
+            d, _, value = d_for_target_psnr(coeffs, image, target_psnr, backend=backend,
+                                            reconstruct=lambda d: decode_image(encode_coefficients(coeffs, d), backend))
+        data = encode_coefficients(coeffs, d)
+        if measure and value is None:
+            value = psnr(image, decode_image(data, backend))
+        return data, d, value
+
+    if target_psnr is not None:
+        if image.ndim == 3:
+            d, compressed, value = color_d_for_target_psnr(image, F, target_psnr, subsampling, backend)
+        else:
+            d, compressed, value = d_for_target_psnr(forward_blocks(image, F, backend), image, target_psnr,
+                                                     backend=backend)
+        return compressed, d, value
+    compressed = compress_color(image, F, d, subsampling=subsampling, backend=backend)
+    return compressed, d, psnr(image, compressed) if measure else None
+
+def _write(path, data, fmt):
+    """Scrittura atomica (file temporaneo + rename): un file presente è sempre completo."""
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp = path + '.tmp'
+    with stage('save'):
+        if fmt == 'dctz':
+            with open(tmp, 'wb') as f:
+                f.write(data)
+        else:
+            from PIL import Image
+            Image.fromarray(data).save(tmp, format=fmt.upper())
+        os.replace(tmp, path)
+
+class _Stats:
+    """Contatori condivisi dai thread della pipeline."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.busy = {'read': 0.0, 'compute': 0.0, 'write': 0.0}
+        self.done = []
+        self.failed = []
+
+    def add_time(self, stage, seconds):
+        with self.lock:
+            self.busy[stage] += seconds
+
+    def fail(self, path, exc):
+        with self.lock:
+            self.failed.append((path, f"{type(exc).__name__}: {exc}"))
+
+def run_batch(paths, output_dir, F, d=None, target_psnr=None, fmt='png', subsampling='4:2:0',
+              grey=False, readers=2, workers=None, writers=2, queue_size=8, processes=False,
+              skip_existing=False, measure=True, backend=None, verbose=False):
+    """
+    Comprime `paths` in `output_dir` con una pipeline a tre stadi collegati
+    da code limitate (`queue_size` elementi, memoria costante qualunque sia
+    il numero di file): `readers` thread decodificano, `workers` thread
+    comprimono (con `processes` ognuno affida il calcolo a un processo di un
+    ProcessPoolExecutor, per aggirare il GIL sui calcoli non numpy) e
+    `writers` thread codificano e scrivono. Gli errori di un file non
+    fermano gli altri. Restituisce il riepilogo (conteggi, tempi, throughput).
+    """
+    if (d is None) == (target_psnr is None):
+        raise ValueError("Indicare esattamente uno tra d e target_psnr")
+    if fmt not in FORMATS:
+        raise ValueError(f"Formato non supportato: {fmt!r} (disponibili: {', '.join(FORMATS)})")
+    workers = workers or os.cpu_count() or 1
+    jobs = list(zip(paths, output_paths(paths, output_dir, fmt)))
+    skipped = 0
+    if skip_existing:
+        pending = [(p, out) for p, out in jobs if not os.path.exists(out)]
+        skipped = len(jobs) - len(pending)
+        jobs = pending
+
+    todo = queue.Queue()
+    decoded = queue.Queue(maxsize=queue_size)
+    encoded = queue.Queue(maxsize=queue_size)
+    for job in jobs:
+        todo.put(job)
+    stats = _Stats()
+    executor = ProcessPoolExecutor(max_workers=workers) if processes else None
+
+    def read():
+        while True:
+            try:
+                path, out = todo.get_nowait()
+            except queue.Empty:
+                return
+            start = time.perf_counter()
+            try:
+                with stage('load'):
+                    if grey:
+                        from PIL import Image
+                        with Image.open(path) as img:
+                            image = np.asarray(img.convert('L'))
+                    else:
+                        image = load_image(path)
+                size = os.path.getsize(path)
+            except Exception as e:
+                stats.fail(path, e)
+                continue
+            finally:
+                stats.add_time('read', time.perf_counter() - start)
+            decoded.put((path, out, image, size))
+
+    def compute():
+        while True:
+            item = decoded.get()
+            if item is None:
+                return
+            path, out, image, size = item
+            start = time.perf_counter()
+            try:
+                args = (image, F, d, target_psnr, fmt, subsampling, backend, measure)
+                if executor is not None and profilo.is_enabled():
+                    (data, used_d, value), profile = executor.submit(profilo.run_profiled, compress_image,
+                                                                     *args).result()
+                    profilo.merge(profile)
+                elif executor is not None:
+                    data, used_d, value = executor.submit(compress_image, *args).result()
+                else:
+                    data, used_d, value = compress_image(*args)
+            except Exception as e:
+                stats.fail(path, e)
+                continue
+            finally:
+                stats.add_time('compute', time.perf_counter() - start)
+            encoded.put((path, out, data, used_d, value, image.shape, size))
+
+    def write():
+        while True:
+            item = encoded.get()
+            if item is None:
+                return
+            path, out, data, used_d, value, shape, size = item
+            start = time.perf_counter()
+            try:
+                _write(out, data, fmt)
+                record = {'path': path, 'output': out, 'd': int(used_d), 'psnr': value,
+                          'pixels': shape[0] * shape[1], 'bytes_in': size, 'bytes_out': os.path.getsize(out)}
+                with stats.lock:
+                    stats.done.append(record)
+                if verbose:
+                    quality = f"  PSNR {value:5.2f} dB" if value is not None else ""
+                    print(f"   {path} -> {out}  d={used_d}{quality}")
+            except Exception as e:
+                stats.fail(path, e)
+            finally:
+                stats.add_time('write', time.perf_counter() - start)
+
+    start = time.perf_counter()
+    stages = [[threading.Thread(target=target, daemon=True) for _ in range(n)]
+              for target, n in ((read, readers), (compute, workers), (write, writers))]
+    for threads in stages:
+        for thread in threads:
+            thread.start()
+    # Ogni stadio finito chiude il successivo con un segnale di fine per thread
+    try:
+        for threads, next_queue, consumers in zip(stages, (decoded, encoded, None), (workers, writers, 0)):
+            for thread in threads:
+                thread.join()
+            for _ in range(consumers):
+                next_queue.put(None)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    elapsed = time.perf_counter() - start
+
+    pixels = sum(r['pixels'] for r in stats.done)
+    finite = [r['psnr'] for r in stats.done if r['psnr'] is not None and r['psnr'] != float('inf')]
+    return {
+        'files': len(stats.done),
+        'failed': stats.failed,
+        'skipped': skipped,
+        'seconds': elapsed,
+        'images_per_s': len(stats.done) / elapsed if elapsed > 0 else 0.0,
+        'megapixels_per_s': pixels / 1e6 / elapsed if elapsed > 0 else 0.0,
+        'bytes_in': sum(r['bytes_in'] for r in stats.done),
+        'bytes_out': sum(r['bytes_out'] for r in stats.done),
+        'mean_psnr': sum(finite) / len(finite) if finite else None,
+        'busy': stats.busy,
+        'results': stats.done,
+    }
+
+def print_summary(summary):
+    print(f"\n Immagini compresse: {summary['files']}  (saltate: {summary['skipped']}, "
+          f"errori: {len(summary['failed'])})")
+    print(f" Tempo totale: {summary['seconds']:.2f} s  ->  {summary['images_per_s']:.1f} immagini/s, "
+          f"{summary['megapixels_per_s']:.2f} MP/s")
+    if summary['bytes_in']:
+        print(f" Byte: {summary['bytes_in']} letti, {summary['bytes_out']} scritti "
+              f"({summary['bytes_out'] / summary['bytes_in']:.1%})")
+    if summary['mean_psnr'] is not None:
+        print(f" PSNR medio: {summary['mean_psnr']:.2f} dB")
+    # Tempo occupato per stadio (somma sui thread): lo stadio più carico è il collo di bottiglia
+    busy = ", ".join(f"{name} {seconds:.2f} s" for name, seconds in summary['busy'].items())
+    print(f" Tempo per stadio: {busy}")
+    for path, error in summary['failed']:
+        print(f"   ERRORE {path}: {error}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compressione DCT di molte immagini (pipeline lettura/calcolo/scrittura)")
+    parser.add_argument('inputs', nargs='+', help="cartelle o pattern glob (es. 'foto/*.jpg')")
+    parser.add_argument('-o', '--output-dir', required=True)
+    parser.add_argument('-F', type=int, default=8, help="dimensione dei blocchi")
+    quality = parser.add_mutually_exclusive_group(required=True)
+    quality.add_argument('-d', type=int, help="soglia delle frequenze (k + l < d)")
+    quality.add_argument('--psnr', type=float, help="PSNR obiettivo (dB): il più piccolo d che lo raggiunge")
+    parser.add_argument('--format', choices=FORMATS, default='png')
+    parser.add_argument('--subsampling', choices=list(SUBSAMPLING), default='4:2:0',
+                        help="sottocampionamento della crominanza (immagini a colori)")
+    parser.add_argument('--grey', action='store_true', help="converte tutto in scala di grigi")
+    parser.add_argument('-r', '--recursive', action='store_true')
+    parser.add_argument('--readers', type=int, default=2)
+    parser.add_argument('--workers', type=int, default=None, help="default: numero di CPU")
+    parser.add_argument('--writers', type=int, default=2)
+    parser.add_argument('--queue-size', type=int, default=8, help="elementi massimi tra due stadi")
+    parser.add_argument('--processes', action='store_true', help="calcolo in processi separati")
+    parser.add_argument('--skip-existing', action='store_true', help="salta i file già scritti (ripresa)")
+    parser.add_argument('--no-psnr', action='store_true', help="non misura il PSNR (più veloce)")
+    parser.add_argument('--backend', default=None, help="backend DCT (default autotuning)")
+    parser.add_argument('-v', '--verbose', action='store_true')
+    parser.add_argument('--profile', metavar='PREFISSO',
+                        help="tempi per stadio in PREFISSO.json e traccia Chrome in PREFISSO.trace.json")
+    args = parser.parse_args(argv)
+    if args.profile:
+        profilo.enable()
+
+    paths = collect_inputs(args.inputs, args.recursive)
+    try:
+        output_paths(paths, args.output_dir, args.format)  # nomi di uscita in conflitto: errore subito
+    except ValueError as e:
+        parser.error(str(e))
+    print("=" * 60)
+    print(f"COMPRESSIONE IN LOTTO: {len(paths)} immagini -> {args.output_dir} (.{args.format})")
+    print("=" * 60)
+    summary = run_batch(paths, args.output_dir, args.F, args.d, args.psnr, args.format, args.subsampling,
+                        args.grey, args.readers, args.workers, args.writers, args.queue_size,
+                        args.processes, args.skip_existing, not args.no_psnr, args.backend, args.verbose)
+    print_summary(summary)
+    if args.profile:
+        profilo.print_report()
+        print(" Profilo salvato in: " + ", ".join(profilo.save(args.profile)))
+    return 1 if summary['failed'] else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,156 @@
+# metriche.py - Metriche di qualità (MSE, PSNR, SSIM, mappe di errore per blocco) a strisce
+import numpy as np
+from profilo import stage
+
+PEAK = 255  # valore massimo di un pixel a 8 bit
+
+# Righe elaborate per volta: i temporanei restano O(righe × larghezza)
+CHUNK_ROWS = 256
+
+def _common(original, compressed):
+    """Ritaglia l'originale alla zona compressa (la compressione scarta i bordi avanzati)."""
+    h, w = compressed.shape[:2]
+    return original[:h, :w], compressed
+
+def _squared_errors(a, b):
+    """Somma esatta dei quadrati delle differenze di una striscia (grigio o colore)."""
+    if a.dtype.kind in 'ui' and b.dtype.kind in 'ui':
+        diff = (a.astype(np.int32) - b).ravel()
+        return int(np.einsum('i,i->', diff, diff, dtype=np.int64))
+    diff = (a.astype(np.float64) - b).ravel()
+    return float(np.einsum('i,i->', diff, diff))
+
+def sse(original, compressed, chunk_rows=CHUNK_ROWS):
+    """Somma dei quadrati degli errori, a strisce di `chunk_rows` righe."""
+    original, compressed = _common(original, compressed)
+    with stage('metrics'):
+        return sum(_squared_errors(original[r:r + chunk_rows], compressed[r:r + chunk_rows])
+                   for r in range(0, compressed.shape[0], chunk_rows))
+
+def mse(original, compressed, chunk_rows=CHUNK_ROWS):
+    """Errore quadratico medio tra l'originale (ritagliato) e l'immagine compressa."""
+    n = compressed.size
+    return sse(original, compressed, chunk_rows) / n if n else 0.0
+
+def psnr_from_mse(mse_value, peak=PEAK):
+    """PSNR in dB; infinito per immagini identiche (mse = 0)."""
+    return 10 * np.log10(peak**2 / mse_value) if mse_value > 0 else float('inf')
+
+def psnr(original, compressed, chunk_rows=CHUNK_ROWS):
+    return psnr_from_mse(mse(original, compressed, chunk_rows))
+
+def diagonal_energies(coeffs):
+    """
+    Energia (somma dei quadrati) dei coefficienti DCT di ogni anti-diagonale
+    k + l = t, sommata su tutti i blocchi: vettore di lunghezza 2F - 1.
+    """
+    F = coeffs.shape[-1]
+    flat = coeffs.reshape(-1, F, F)
+    per_frequency = np.einsum('nkl,nkl->kl', flat, flat, dtype=np.float64)
+    diagonal = np.add.outer(np.arange(F), np.arange(F))
+    return np.bincount(diagonal.ravel(), weights=per_frequency.ravel(), minlength=2 * F - 1)
+
+def predicted_mse(energies, d, n_pixels):
+    """
+    MSE previsto nel dominio DCT per la soglia d: con la DCT ortonormale
+    (Parseval) l'errore prima di round/clip è l'energia delle diagonali
+    scartate (k + l >= d) divisa per il numero di pixel.
+    """
+    return float(np.sum(energies[d:])) / n_pixels
+
+def _box_sums(x, win):
+    """Somme su tutte le finestre win×win (solo quelle interamente dentro x) con l'immagine integrale."""
+    S = np.zeros((x.shape[0] + 1, x.shape[1] + 1))
+    np.cumsum(x, axis=0, out=S[1:, 1:])
+    np.cumsum(S[1:, 1:], axis=1, out=S[1:, 1:])
+    return S[win:, win:] - S[:-win, win:] - S[win:, :-win] + S[:-win, :-win]
+
+def ssim(original, compressed, win=7, chunk_rows=CHUNK_ROWS, peak=PEAK):
+    """
+    SSIM medio (Wang et al. 2004) con finestra uniforme win×win e covarianze
+    campionarie, sulle sole finestre interne all'immagine (come skimage con
+    i parametri di default). Le somme locali vengono da immagini integrali
+    calcolate a strisce di `chunk_rows` righe più il bordo della finestra.
+    Per le immagini a colori (h, w, 3) è la media dei tre canali.
+    """
+    original, compressed = _common(original, compressed)
+    if compressed.ndim == 3:
+        return float(np.mean([ssim(original[..., c], compressed[..., c], win, chunk_rows, peak)
+                              for c in range(compressed.shape[2])]))
+    h, w = compressed.shape
+    if h < win or w < win:
+        raise ValueError(f"Immagine più piccola della finestra SSIM ({win}×{win})")
+
+    n = win * win
+    C1 = (0.01 * peak) ** 2
+    C2 = (0.03 * peak) ** 2
+    total = 0.0
+    with stage('metrics'):
+        for r in range(0, h - win + 1, chunk_rows):
+            rows = slice(r, min(r + chunk_rows, h - win + 1) + win - 1)
+            x = original[rows].astype(np.float64)
+            y = compressed[rows].astype(np.float64)
+            mx = _box_sums(x, win) / n
+            my = _box_sums(y, win) / n
+            vx = (_box_sums(x * x, win) / n - mx * mx) * n / (n - 1)
+            vy = (_box_sums(y * y, win) / n - my * my) * n / (n - 1)
+            cov = (_box_sums(x * y, win) / n - mx * my) * n / (n - 1)
+            s = ((2 * mx * my + C1) * (2 * cov + C2)) / ((mx * mx + my * my + C1) * (vx + vy + C2))
+            total += s.sum()
+    return total / ((h - win + 1) * (w - win + 1))
+
+def block_error_map(original, compressed, F, chunk_rows=CHUNK_ROWS):
+    """MSE di ogni blocco F×F (a colori: media dei canali): matrice (righe di blocchi, colonne di blocchi), es. per una heatmap."""
+    original, compressed = _common(original, compressed)
+    rows, cols = compressed.shape[0] // F, compressed.shape[1] // F
+    errors = np.empty((rows, cols))
+    step = max(1, chunk_rows // F)
+    with stage('metrics'):
+        for i in range(0, rows, step):
+            j = min(i + step, rows)
+            diff = (original[i * F:j * F, :cols * F].astype(np.float64)
+                    - compressed[i * F:j * F, :cols * F])
+            errors[i:j] = (diff * diff).reshape(j - i, F, cols, F, -1).mean(axis=(1, 3, 4))
+    return errors
+
+class MetricsAccumulator:
+    """
+    MSE/PSNR (e mappa di errore per blocco) accumulati striscia per striscia,
+    da chiamare dentro un ciclo di compressione a strisce (es. streaming.py)
+    mentre originale e ricostruzione della striscia sono ancora in cache.
+    """
+
+    def __init__(self, F=None):
+        self.F = F
+        self.sse = 0
+        self.pixels = 0
+        self._block_rows = []
+
+    def update(self, original, compressed):
+        original, compressed = _common(original, compressed)
+        with stage('metrics'):
+            self.sse += _squared_errors(original, compressed)
+        self.pixels += compressed.size
+        if self.F is not None:
+            self._block_rows.append(block_error_map(original, compressed, self.F))
+
+    @property
+    def mse(self):
+        return self.sse / self.pixels if self.pixels else 0.0
+
+    @property
+    def psnr(self):
+        return psnr_from_mse(self.mse)
+
+    def block_errors(self):
+        return np.concatenate(self._block_rows) if self._block_rows else np.empty((0, 0))
+
+def quality_report(original, compressed, F=None, with_ssim=True):
+    """Tutte le metriche in un dizionario: mse, psnr, ssim e (se F è dato) la mappa di errore per blocco."""
+    report = {'mse': mse(original, compressed)}
+    report['psnr'] = psnr_from_mse(report['mse'])
+    if with_ssim:
+        report['ssim'] = ssim(original, compressed)
+    if F is not None:
+        report['block_errors'] = block_error_map(original, compressed, F)
+    return report
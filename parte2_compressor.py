@@ -1,12 +1,25 @@
 # parte2_compressor.py
 import tkinter as tk
 from tkinter import filedialog, messagebox, ttk
-import numpy as np
-from PIL import Image, ImageTk
+import math
+import queue
+import threading
 # Rimossi import matplotlib non utilizzati
-from utils import dct2_fast, idct2_fast
+from compressione import compress_blocks, CoefficientCache
+from codifica import save_dctz
+from lavori import CompressionWorker
+from vista import ViewportCompressor, level_for_zoom
+from colore import SUBSAMPLING
+from cache_immagini import load_image
+import profilo
+from profilo import stage
+from metriche import mse as compute_mse, psnr_from_mse
 import os
 
+# Oltre questa dimensione la GUI non calcola la compressione completa:
+# si comprimono solo i tile visibili (statistiche sulla vista corrente)
+FULL_COMPRESSION_PIXELS = 4096 * 4096
+
 class DCTImageCompressor:
     def __init__(self, root):
         self.root = root
@@ -18,8 +31,27 @@ class DCTImageCompressor:
         self.compressed_image = None
         self.image_path = None
         
+        # Coefficienti DCT per (immagine, F) e ricostruzione incrementale per d,
+        # calcolati in un thread di sottofondo: la finestra resta reattiva
+        self.coeff_cache = CoefficientCache()
+        self.worker = CompressionWorker(self.coeff_cache, preview=False)
+        self._job = None
+        self.compressed_params = None  # (F, d) dell'ultima compressione completa
+        
+        # Vista con zoom/pan condivisa dai due pannelli: si comprimono solo i
+        # tile visibili, i vicini vengono calcolati in sottofondo (vista.py)
+        self.viewport = None
+        self.zoom = 1.0
+        self.view_x = self.view_y = 0.0
+        self._drag = None
+        self._prefetch_cancel = None
+        self._pending_tiles = False  # vista con anteprime solo-DC in attesa dei tile
+        self._rendered_tiles = 0
+        
         # Setup GUI
         self.setup_gui()
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
+        self._poll_worker()
         
     def setup_gui(self):
         """Crea l'interfaccia grafica"""
@@ -52,27 +84,44 @@ class DCTImageCompressor:
         # Parametro d (soglia frequenze)
         tk.Label(control_frame, text="Soglia Frequenze (d):", bg='#f0f0f0').pack(side=tk.LEFT, padx=5)
         self.d_var = tk.IntVar(value=8)
-        self.d_spinbox = tk.Spinbox(control_frame, from_=0, to=14, 
-                                    textvariable=self.d_var, width=5)
-        self.d_spinbox.pack(side=tk.LEFT, padx=5)
+        # Slider "live": ogni spostamento aggiorna subito la ricostruzione
+        self.d_scale = tk.Scale(control_frame, from_=0, to=14, orient=tk.HORIZONTAL,
+                                variable=self.d_var, length=180, bg='#f0f0f0',
+                                highlightthickness=0,
+                                command=lambda _: self.update_compression())
+        self.d_scale.pack(side=tk.LEFT, padx=5)
 
         hint = "d=0 → blocchi neri   |   d=2F−2 → elimina solo (F−1,F−1)"
         tk.Label(control_frame, text=hint, bg='#f0f0f0', fg='#555').pack(side=tk.LEFT, padx=8)
         
+        # Modalità qualità obiettivo: il più piccolo d con PSNR >= obiettivo
+        tk.Label(control_frame, text="PSNR obiettivo (dB):", bg='#f0f0f0').pack(side=tk.LEFT, padx=5)
+        self.target_var = tk.StringVar(value="35")
+        tk.Entry(control_frame, textvariable=self.target_var, width=5).pack(side=tk.LEFT)
+        tk.Button(control_frame, text="Trova d", command=self.find_d_for_target).pack(side=tk.LEFT, padx=5)
+        
+        # Sottocampionamento della crominanza (solo immagini a colori)
+        tk.Label(control_frame, text="Crominanza:", bg='#f0f0f0').pack(side=tk.LEFT, padx=5)
+        self.subsampling_var = tk.StringVar(value='4:2:0')
+        subsampling_box = ttk.Combobox(control_frame, textvariable=self.subsampling_var,
+                                       values=list(SUBSAMPLING), width=6, state='readonly')
+        subsampling_box.pack(side=tk.LEFT)
+        subsampling_box.bind('<<ComboboxSelected>>', lambda _: self.update_compression())
+        
         # Label per mostrare la percentuale di compressione
         self.compression_label = tk.Label(control_frame, text="", bg='#f0f0f0', fg='blue')
         self.compression_label.pack(side=tk.LEFT, padx=20)
         
-        # Bottone per comprimere
-        tk.Button(control_frame, text=" Comprimi", 
-                 command=self.compress_image, bg='#2196F3', fg='white',
-                 font=('Arial', 10, 'bold'), padx=20, pady=5).pack(side=tk.LEFT, padx=5, pady=5)
-        
         # Bottone per salvare
         tk.Button(control_frame, text=" Salva Compressa", 
                  command=self.save_compressed, bg='#FF9800', fg='white',
                  font=('Arial', 10, 'bold'), padx=20, pady=5).pack(side=tk.LEFT, padx=5, pady=5)
         
+        # Bottone per interrompere una compressione lunga
+        tk.Button(control_frame, text=" Annulla", 
+                 command=self.cancel_compression, bg='#f44336', fg='white',
+                 font=('Arial', 10, 'bold'), padx=10, pady=5).pack(side=tk.LEFT, padx=5, pady=5)
+        
         # Frame per le immagini
         images_frame = tk.Frame(main_frame, bg='#f0f0f0')
         images_frame.pack(fill=tk.BOTH, expand=True, pady=10)
@@ -82,31 +131,49 @@ class DCTImageCompressor:
                                            bg='white', font=('Arial', 10, 'bold'))
         self.original_frame.pack(side=tk.LEFT, fill=tk.BOTH, expand=True, padx=5)
         
-        self.original_label = tk.Label(self.original_frame, bg='white', 
-                                       text="Nessuna immagine caricata")
-        self.original_label.pack(expand=True)
+        self.original_canvas = tk.Canvas(self.original_frame, bg='white', highlightthickness=0)
+        self.original_canvas.pack(fill=tk.BOTH, expand=True)
+        self.original_canvas.create_text(10, 10, anchor=tk.NW, text="Nessuna immagine caricata")
         
         # Frame immagine compressa
-        self.compressed_frame = tk.LabelFrame(images_frame, text="Immagine Compressa", 
+        self.compressed_frame = tk.LabelFrame(images_frame, text="Immagine Compressa (rotella: zoom, trascina: sposta)", 
                                              bg='white', font=('Arial', 10, 'bold'))
         self.compressed_frame.pack(side=tk.LEFT, fill=tk.BOTH, expand=True, padx=5)
         
-        self.compressed_label = tk.Label(self.compressed_frame, bg='white',
-                                        text="Premi 'Comprimi' per vedere il risultato")
-        self.compressed_label.pack(expand=True)
-        
-        # Status bar
-        self.status_bar = tk.Label(main_frame, text="Pronto", bd=1, 
+        self.compressed_canvas = tk.Canvas(self.compressed_frame, bg='white', highlightthickness=0)
+        self.compressed_canvas.pack(fill=tk.BOTH, expand=True)
+        self.compressed_canvas.create_text(10, 10, anchor=tk.NW, text="Carica un'immagine e muovi lo slider d")
+        
+        # Zoom e pan sincronizzati sui due pannelli
+        for canvas in (self.original_canvas, self.compressed_canvas):
+            canvas.bind('<Configure>', lambda _: self.render_view())
+            canvas.bind('<ButtonPress-1>', self._start_pan)
+            canvas.bind('<B1-Motion>', self._pan)
+            canvas.bind('<MouseWheel>', lambda e: self._zoom_at(e, 1.25 if e.delta > 0 else 0.8))
+            canvas.bind('<Button-4>', lambda e: self._zoom_at(e, 1.25))  # rotella su Linux
+            canvas.bind('<Button-5>', lambda e: self._zoom_at(e, 0.8))
+        
+        # Status bar con barra di avanzamento (righe di blocchi trasformate)
+        status_frame = tk.Frame(main_frame, bg='#e0e0e0')
+        status_frame.pack(side=tk.BOTTOM, fill=tk.X)
+        self.progress = ttk.Progressbar(status_frame, length=200, mode='determinate')
+        self.progress.pack(side=tk.RIGHT, padx=5)
+        self.status_bar = tk.Label(status_frame, text="Pronto", bd=1, 
                                   relief=tk.SUNKEN, anchor=tk.W, bg='#e0e0e0')
-        self.status_bar.pack(side=tk.BOTTOM, fill=tk.X)
+        self.status_bar.pack(side=tk.LEFT, fill=tk.X, expand=True)
     
     def _update_d_max(self):
-        """Aggiorna il valore massimo di d quando F cambia"""
-        F = self.F_var.get()
+        """Aggiorna il valore massimo di d quando F cambia e ricalcola i coefficienti"""
+        try:
+            F = self.F_var.get()
+        except tk.TclError:
+            return  # Spinbox in fase di modifica (valore non ancora valido)
         max_d = max(0, 2 * F - 2)
-        self.d_spinbox.config(to=max_d)
+        self.d_scale.config(to=max_d)
         if self.d_var.get() > max_d:
             self.d_var.set(max_d)
+        if self.original_image is not None:
+            self.compress_image()
         
     def load_image(self):
         """Carica un'immagine BMP"""
@@ -118,22 +185,22 @@ class DCTImageCompressor:
         
         if file_path:
             try:
-                # Carica l'immagine
-                img = Image.open(file_path)
-                
-                # Converti in scala di grigi se necessario
-                if img.mode != 'L':
-                    img = img.convert('L')
-                
-                self.original_image = np.array(img)
+                # Le immagini a colori restano RGB (compressione YCbCr, vedi colore.py);
+                # dal secondo caricamento i pixel sono mappati dalla cache .npy
+                self.original_image = load_image(file_path)
                 self.image_path = file_path
+                self.compressed_image = None
+                self.compressed_params = None
+                self.viewport = None
                 
-                # Mostra l'immagine originale
-                self.display_image(self.original_image, self.original_label, "originale")
+                # Mostra l'immagine originale (intera, adattata al pannello)
+                self._fit_view()
+                self.render_view()
                 
                 # Aggiorna status
-                h, w = self.original_image.shape
-                self.status_bar.config(text=f"Immagine caricata: {os.path.basename(file_path)} - Dimensioni: {w}x{h}")
+                h, w = self.original_image.shape[:2]
+                kind = "RGB" if self.original_image.ndim == 3 else "grigi"
+                self.status_bar.config(text=f"Immagine caricata: {os.path.basename(file_path)} - Dimensioni: {w}x{h} ({kind})")
                 
                 # Aggiorna il massimo valore di d
                 self._update_d_max()
@@ -142,105 +209,232 @@ class DCTImageCompressor:
                 messagebox.showerror("Errore", f"Impossibile caricare l'immagine:\n{str(e)}")
     
     def compress_image(self):
-        """Comprimi l'immagine usando DCT"""
+        """Avvia (o sostituisce) la compressione in sottofondo per i valori correnti di F e d"""
         if self.original_image is None:
             messagebox.showwarning("Attenzione", "Prima carica un'immagine!")
             return
         
         F = self.F_var.get()
-        d = self.d_var.get()
-
-        h, w = self.original_image.shape
+        h, w = self.original_image.shape[:2]
         if h < F or w < F:
+            self.worker.cancel()
+            self._job = None
             messagebox.showwarning(
                 "Attenzione",
                 "L'immagine è più piccola di F. Riduci F o usa un'immagine più grande."
             )
             return
         
-        # Verifica che d sia valido
-        max_d = 2 * F - 2
-        if d > max_d:
-            d = max_d
-            self.d_var.set(d)
+        # Vista: subito i soli tile visibili per i nuovi (F, d); se cambia solo d
+        # i coefficienti dei tile già calcolati restano validi (solo maschera + IDCT)
+        d = min(self.d_var.get(), 2 * F - 2)
+        subsampling = self.subsampling_var.get()
+        view = self.viewport
+        if (view is None or view.image is not self.original_image or view.F != F
+                or view.subsampling != subsampling):
+            self.viewport = ViewportCompressor(self.original_image, F, d, subsampling=subsampling)
+        else:
+            view.set_d(d)
+        self.render_view()
         
-        self.status_bar.config(text=f"Compressione in corso... F={F}, d={d}")
-        self.root.update()
+        if self._too_large():
+            self.worker.cancel()
+            self._job = None
+            self.status_bar.config(text=f"Immagine grande: compressi solo i tile visibili (F={F}, d={d})")
+            return
         
+        # Compressione completa (statistiche e salvataggio) in sottofondo: il lavoro
+        # precedente viene superato e la DCT si ricalcola solo se cambia F (o l'immagine)
+        self._job = self.worker.submit(self.original_image, F, d, subsampling)
+        self.status_bar.config(text=f"Compressione in corso... F={F}, d={d}")
+    
+    def find_d_for_target(self):
+        """Cerca in sottofondo il più piccolo d che raggiunge il PSNR obiettivo"""
+        if self.original_image is None:
+            messagebox.showwarning("Attenzione", "Prima carica un'immagine!")
+            return
+        try:
+            target = float(self.target_var.get())
+        except ValueError:
+            messagebox.showwarning("Attenzione", "PSNR obiettivo non valido")
+            return
+        F = self.F_var.get()
+        h, w = self.original_image.shape[:2]
+        if h < F or w < F:
+            messagebox.showwarning("Attenzione", "L'immagine è più piccola di F.")
+            return
+        if self._too_large():
+            # Come in compress_image: niente coefficienti dell'immagine intera nella GUI
+            messagebox.showwarning("Attenzione", "Immagine troppo grande per la ricerca del d nella GUI: "
+                                   "usa lotto.py --psnr da riga di comando.")
+            return
+        self._job = self.worker.submit_target(self.original_image, F, target, self.subsampling_var.get())
+        self.status_bar.config(text=f"Ricerca del d minimo per PSNR >= {target:g} dB... F={F}")
+    
+    def update_compression(self):
+        """Aggiorna la ricostruzione per il d corrente (aggiunge/toglie diagonali)"""
+        if self.original_image is not None:
+            self.compress_image()
+    
+    def cancel_compression(self):
+        """Interrompe la compressione in corso: resta mostrata l'ultima completata"""
+        if self._job is None:
+            return
+        self.worker.cancel()
+        self._job = None
+        self.progress['value'] = 0
+        self.status_bar.config(text="Compressione annullata")
+    
+    def _poll_worker(self):
+        """Legge i messaggi del thread di compressione (chiamata periodicamente con after)"""
         try:
-            # Esegui la compressione
-            self.compressed_image = self.dct_compress(self.original_image, F, d)
-            
-            # Mostra l'immagine compressa
-            self.display_image(self.compressed_image, self.compressed_label, "compressa")
-            
-            # Calcola e mostra le statistiche
-            self.show_compression_stats(F, d)
-            
-            self.status_bar.config(text=f"Compressione completata! F={F}, d={d}")
-            
-        except Exception as e:
-            messagebox.showerror("Errore", f"Errore durante la compressione:\n{str(e)}")
-            self.status_bar.config(text="Errore nella compressione")
+            while True:
+                kind, job, *payload = self.worker.results.get_nowait()
+                if job != self._job:
+                    continue  # messaggio di un lavoro superato o annullato
+                
+                if kind == 'progress':
+                    done, total = payload
+                    self.progress['value'] = 100 * done / total
+                    unit = "stadi" if self.original_image.ndim == 3 else "righe di blocchi"
+                    self.status_bar.config(text=f"Calcolo DCT dei blocchi... {done}/{total} {unit}")
+                elif kind == 'done':
+                    F, d, image = payload
+                    self._job = None
+                    self.progress['value'] = 0
+                    self.compressed_image = image
+                    self.compressed_params = (F, d)
+                    if self.d_var.get() != d:
+                        # d trovato dalla modalità PSNR obiettivo: lo slider lo segue
+                        self.d_var.set(d)
+                    if self.viewport is not None and self.viewport.F == F:
+                        # La vista mostra proprio il risultato del worker
+                        self.viewport.set_d(d)
+                        self.viewport.set_full(d, image)
+                        self.render_view()
+                    self.show_compression_stats(F, d)
+                    self.status_bar.config(text=f"Compressione completata! F={F}, d={d}")
+                elif kind == 'error':
+                    self._job = None
+                    self.progress['value'] = 0
+                    messagebox.showerror("Errore", f"Errore durante la compressione:\n{payload[0]}")
+                    self.status_bar.config(text="Errore nella compressione")
+        except queue.Empty:
+            pass
+        # Tile arrivati dal thread di prefetch: le anteprime solo-DC diventano definitive
+        if self._pending_tiles and self.viewport is not None and self.viewport.computed != self._rendered_tiles:
+            self.render_view()
+        self.root.after(30, self._poll_worker)
+    
+    def on_close(self):
+        if self._prefetch_cancel is not None:
+            self._prefetch_cancel.set()
+        self.worker.close()
+        if profilo.is_enabled():  # DCT_STAGE_PROFILE=1: tempi per stadio della sessione
+            profilo.save('risultati/profilo_gui')
+        self.root.destroy()
     
     def dct_compress(self, image, F, d):
         """
-        Algoritmo di compressione DCT
+        Algoritmo di compressione DCT (motore vettorizzato in compressione.py)
         """
-        h, w = image.shape
-        
-        # Calcola il numero di blocchi
-        num_blocks_v = h // F
-        num_blocks_h = w // F
-        
-        # Crea l'immagine di output (scarta gli avanzi)
-        compressed = np.zeros((num_blocks_v * F, num_blocks_h * F))
-        
-        # Processa ogni blocco
-        for i in range(num_blocks_v):
-            for j in range(num_blocks_h):
-                # Estrai il blocco
-                block = image[i*F:(i+1)*F, j*F:(j+1)*F].astype(np.float64)
-                
-                # Applica DCT2
-                dct_block = dct2_fast(block)
-                
-                # Elimina le frequenze alte (k + l >= d)
-                for k in range(F):
-                    for l in range(F):
-                        if k + l >= d:
-                            dct_block[k, l] = 0
-                
-                # Applica DCT2 inversa
-                idct_block = idct2_fast(dct_block)
-                
-                # Arrotonda e limita i valori
-                idct_block = np.round(idct_block)
-                idct_block = np.clip(idct_block, 0, 255)
-                
-                # Inserisci il blocco nell'immagine compressa
-                compressed[i*F:(i+1)*F, j*F:(j+1)*F] = idct_block
-        
-        return compressed.astype(np.uint8)
+        return compress_blocks(image, F, d)
     
-    def display_image(self, img_array, label, title):
-        """Mostra un'immagine in un label"""
-        # Converti array in immagine PIL
-        img = Image.fromarray(img_array.astype(np.uint8))
-        
-        # Ridimensiona se troppo grande (mantieni aspect ratio)
-        max_size = (500, 500)
-        img.thumbnail(max_size, Image.Resampling.LANCZOS)
+    def _fit_view(self):
+        """Zoom e posizione per vedere tutta l'immagine nel pannello (senza ingrandire)"""
+        h, w = self.original_image.shape[:2]
+        cw, ch = self._canvas_size()
+        self.zoom = min(cw / w, ch / h, 1.0)
+        self.view_x = (w - cw / self.zoom) / 2
+        self.view_y = (h - ch / self.zoom) / 2
+    
+    def _canvas_size(self):
+        canvas = self.compressed_canvas
+        w, h = canvas.winfo_width(), canvas.winfo_height()
+        return (w, h) if w > 1 and h > 1 else (500, 500)  # finestra non ancora disegnata
+    
+    def _start_pan(self, event):
+        self._drag = (event.x, event.y, self.view_x, self.view_y)
+    
+    def _pan(self, event):
+        if self._drag is None:
+            return
+        x, y, view_x, view_y = self._drag
+        self.view_x = view_x - (event.x - x) / self.zoom
+        self.view_y = view_y - (event.y - y) / self.zoom
+        self.render_view()
+    
+    def _zoom_at(self, event, factor):
+        """Zoom attorno al punto sotto il cursore (che resta fermo sullo schermo)"""
+        x = self.view_x + event.x / self.zoom
+        y = self.view_y + event.y / self.zoom
+        self.zoom = min(max(self.zoom * factor, 1 / 4096), 32.0)
+        self.view_x = x - event.x / self.zoom
+        self.view_y = y - event.y / self.zoom
+        self.render_view()
+    
+    def render_view(self):
+        """
+        Disegna la regione visibile di originale e compressa al livello di dettaglio
+        dello zoom: il lavoro dipende dalla dimensione del pannello, non dell'immagine.
+        """
+        if self.original_image is None:
+            return
+        level = level_for_zoom(self.zoom)
+        s = 2 ** level
+        cw, ch = self._canvas_size()
+        
+        # Regione visibile in coordinate del livello (un pixel ogni s)
+        x0 = max(0, math.floor(self.view_x / s))
+        y0 = max(0, math.floor(self.view_y / s))
+        x1 = math.ceil((self.view_x + cw / self.zoom) / s)
+        y1 = math.ceil((self.view_y + ch / self.zoom) / s)
+        if x1 <= x0 or y1 <= y0:
+            return
         
-        # Converti in PhotoImage
-        photo = ImageTk.PhotoImage(img)
+        original = self.original_image[y0 * s:y1 * s:s, x0 * s:x1 * s:s]
+        self._draw_region(self.original_canvas, original, x0, y0, s)
+        if self.viewport is None:
+            return
         
-        # Aggiorna il label
-        label.config(image=photo, text="")
-        label.image = photo  # Mantieni riferimento
+        # Raffinamento progressivo: i tile senza coefficienti compaiono prima
+        # solo-DC (medie dei blocchi, nessuna DCT sul thread della finestra)
+        self._rendered_tiles = self.viewport.computed
+        compressed, missing = self.viewport.render(level, x0, y0, x1, y1, wait=False)
+        self._pending_tiles = bool(missing)
+        self._draw_region(self.compressed_canvas, compressed, x0, y0, s)
+        if self._too_large() and compressed.size and not missing:
+            self.show_compression_stats(self.viewport.F, self.viewport.d, original, compressed)
+        
+        # In sottofondo prima i tile visibili mancanti, poi quelli attorno alla
+        # vista: pan e zoom successivi li trovano già pronti
+        if self._prefetch_cancel is not None:
+            self._prefetch_cancel.set()
+        self._prefetch_cancel = threading.Event()
+        tiles = missing + [t for t in self.viewport.tiles_in(level, x0, y0, x1, y1, margin=1)
+                           if t not in missing]
+        threading.Thread(target=self.viewport.prefetch, args=(level, tiles, self._prefetch_cancel),
+                         daemon=True).start()
     
-    def show_compression_stats(self, F, d):
-        """Mostra le statistiche di compressione - CORRETTA"""
+    def _draw_region(self, canvas, region, x0, y0, s):
+        """Mostra una regione (coordinate del livello s) alla sua posizione e scala sullo schermo"""
+        from PIL import Image, ImageTk
+        canvas.delete('all')
+        if region.size == 0:
+            return
+        w = max(1, round(region.shape[1] * s * self.zoom))
+        h = max(1, round(region.shape[0] * s * self.zoom))
+        resample = Image.Resampling.NEAREST if self.zoom >= 1 else Image.Resampling.BILINEAR
+        photo = ImageTk.PhotoImage(Image.fromarray(region).resize((w, h), resample))
+        canvas.create_image((x0 * s - self.view_x) * self.zoom, (y0 * s - self.view_y) * self.zoom,
+                            image=photo, anchor=tk.NW)
+        canvas.image = photo  # Mantieni riferimento
+    
+    def show_compression_stats(self, F, d, original=None, compressed=None):
+        """
+        Mostra le statistiche di compressione - CORRETTA
+        (per le immagini grandi PSNR calcolato sulla sola vista corrente)
+        """
         # Calcola il rapporto di compressione teorico
         total_coeffs = F * F
         kept_coeffs = 0
@@ -251,28 +445,31 @@ class DCTImageCompressor:
         
         compression_ratio = (1 - kept_coeffs / total_coeffs) * 100
         
-        # FIX: Calcola MSE usando le dimensioni corrette
-        h_comp, w_comp = self.compressed_image.shape
-        img_cropped = self.original_image[:h_comp, :w_comp]
-        
-        mse = np.mean((img_cropped.astype(float) - self.compressed_image.astype(float)) ** 2)
-        
-        if mse > 0:
-            psnr = 10 * np.log10(255**2 / mse)
-        else:
-            psnr = float('inf')
+        # MSE/PSNR sulla zona compressa (metriche.py ritaglia l'originale)
+        view = compressed is not None
+        if not view:
+            original, compressed = self.original_image, self.compressed_image
+        psnr = psnr_from_mse(compute_mse(original, compressed))
         
         # Aggiorna label
         self.compression_label.config(
             text=f"Compressione: {compression_ratio:.1f}% | "
                  f"Coefficienti: {kept_coeffs}/{total_coeffs} | "
-                 f"PSNR: {psnr:.2f} dB"
+                 f"PSNR{' (vista)' if view else ''}: {psnr:.2f} dB"
         )
     
+    def _too_large(self):
+        """Troppi pixel (h·w, non contando i canali) per la compressione completa nella GUI"""
+        return self.original_image.shape[0] * self.original_image.shape[1] > FULL_COMPRESSION_PIXELS
+    
     def save_compressed(self):
         """Salva l'immagine compressa"""
         if self.compressed_image is None:
-            messagebox.showwarning("Attenzione", "Prima comprimi un'immagine!")
+            if self.original_image is not None and self._too_large():
+                messagebox.showwarning("Attenzione", "Immagine troppo grande per la compressione completa "
+                                       "nella GUI: usa streaming.py (BMP) da riga di comando.")
+            else:
+                messagebox.showwarning("Attenzione", "Prima comprimi un'immagine!")
             return
         
         # Crea cartella risultati se non esiste
@@ -282,13 +479,30 @@ class DCTImageCompressor:
             title="Salva immagine compressa",
             initialdir="risultati/",
             defaultextension=".bmp",
-            filetypes=[("BMP files", "*.bmp"), ("PNG files", "*.png"), ("All files", "*.*")]
+            filetypes=[("BMP files", "*.bmp"), ("PNG files", "*.png"),
+                       ("DCT compressa (coefficienti codificati)", "*.dctz"), ("All files", "*.*")]
         )
         
         if file_path:
             try:
-                img = Image.fromarray(self.compressed_image)
-                img.save(file_path)
+                if file_path.lower().endswith('.dctz'):
+                    if self.original_image.ndim == 3:
+                        messagebox.showwarning("Attenzione", "Il formato .dctz è solo per immagini in "
+                                               "scala di grigi: salva in BMP o PNG.")
+                        return
+                    # Salva davvero i soli coefficienti mantenuti, codificati entropicamente
+                    F, d = self.compressed_params
+                    n_bytes = save_dctz(file_path, self.original_image, F, d)
+                    h, w = self.compressed_image.shape[:2]
+                    messagebox.showinfo(
+                        "Successo",
+                        f"Immagine salvata in:\n{file_path}\n\n"
+                        f"{n_bytes} byte ({8 * n_bytes / (h * w):.2f} bit/pixel, "
+                        f"originale 8 bit/pixel)")
+                    return
+                from PIL import Image
+                with stage('save'):
+                    Image.fromarray(self.compressed_image).save(file_path)
                 messagebox.showinfo("Successo", f"Immagine salvata in:\n{file_path}")
             except Exception as e:
                 messagebox.showerror("Errore", f"Impossibile salvare l'immagine:\n{str(e)}")
@@ -0,0 +1,140 @@
+# profilo.py - Profilazione opzionale per stadi della compressione, con export JSON e Chrome trace
+import json
+import os
+import threading
+import time
+from contextlib import nullcontext
+
+# Stadi strumentati nel motore e negli script (altri nomi sono ammessi)
+STAGES = ('load', 'crop', 'forward', 'mask', 'inverse', 'round_clip', 'metrics', 'encode', 'save')
+
+# Eventi conservati per la traccia; oltre il limite restano solo i totali
+MAX_EVENTS = 1_000_000
+
+_enabled = os.environ.get('DCT_STAGE_PROFILE', '') not in ('', '0')
+_lock = threading.Lock()
+_totals = {}  # nome -> [conteggio, ns totali, ns minimo, ns massimo]
+_events = []  # (nome, inizio ns, durata ns, pid, tid)
+_NULL = nullcontext()
+
+def enable():
+    global _enabled
+    _enabled = True
+
+def disable():
+    global _enabled
+    _enabled = False
+
+def is_enabled():
+    return _enabled
+
+def reset():
+    """Azzera totali ed eventi raccolti."""
+    with _lock:
+        _totals.clear()
+        _events.clear()
+
+def _record(name, start, duration):
+    with _lock:
+        total = _totals.get(name)
+        if total is None:
+            _totals[name] = [1, duration, duration, duration]
+        else:
+            total[0] += 1
+            total[1] += duration
+            total[2] = min(total[2], duration)
+            total[3] = max(total[3], duration)
+        if len(_events) < MAX_EVENTS:
+            _events.append((name, start, duration, os.getpid(), threading.get_ident()))
+
+class _Stage:
+    __slots__ = ('name', 'start')
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        _record(self.name, self.start, time.perf_counter_ns() - self.start)
+
+def stage(name):
+    """
+    Contesto che misura uno stadio: `with stage('forward'): ...`.
+    Con la profilazione disattivata (default) restituisce sempre lo stesso
+    contesto vuoto: il costo è una chiamata e un test, nessuna allocazione.
+    Si attiva con enable() o con la variabile d'ambiente DCT_STAGE_PROFILE=1.
+    """
+    return _Stage(name) if _enabled else _NULL
+
+def report():
+    """Statistiche per stadio in secondi, dal più costoso: {nome: {count, total_s, mean_s, min_s, max_s}}."""
+    with _lock:
+        items = sorted(_totals.items(), key=lambda item: -item[1][1])
+    return {name: {'count': count, 'total_s': total / 1e9, 'mean_s': total / count / 1e9,
+                   'min_s': lo / 1e9, 'max_s': hi / 1e9}
+            for name, (count, total, lo, hi) in items}
+
+def snapshot():
+    """Totali ed eventi grezzi, serializzabili (es. da restituire da un processo worker)."""
+    with _lock:
+        return {'totals': {name: list(t) for name, t in _totals.items()}, 'events': list(_events)}
+
+def merge(data):
+    """Aggiunge ai dati di questo processo quelli di snapshot() di un altro processo."""
+    with _lock:
+        for name, (count, total, lo, hi) in data['totals'].items():
+            mine = _totals.get(name)
+            if mine is None:
+                _totals[name] = [count, total, lo, hi]
+            else:
+                mine[0] += count
+                mine[1] += total
+                mine[2] = min(mine[2], lo)
+                mine[3] = max(mine[3], hi)
+        _events.extend(data['events'][:max(0, MAX_EVENTS - len(_events))])
+
+def run_profiled(func, *args):
+    """
+    Esegue func(*args) con la profilazione attiva e restituisce (risultato,
+    snapshot()): da usare come funzione di un pool di processi, il chiamante
+    unisce i dati del worker con merge().
+    """
+    enable()
+    reset()
+    return func(*args), snapshot()
+
+def chrome_trace():
+    """
+    Eventi nel formato Trace Event di Chrome (eventi completi 'X', tempi in µs),
+    da aprire con chrome://tracing o Perfetto. Gli stadi annidati (es. metrics
+    dentro una funzione più ampia) compaiono uno dentro l'altro.
+    """
+    with _lock:
+        events = list(_events)
+    return {
+        'traceEvents': [{'name': name, 'cat': 'dct', 'ph': 'X', 'ts': start / 1e3, 'dur': duration / 1e3,
+                         'pid': pid, 'tid': tid}
+                        for name, start, duration, pid, tid in events],
+        'displayTimeUnit': 'ms',
+    }
+
+def save(prefix):
+    """Salva <prefix>.json (statistiche per stadio) e <prefix>.trace.json (Chrome trace)."""
+    os.makedirs(os.path.dirname(prefix) or '.', exist_ok=True)
+    with open(prefix + '.json', 'w') as f:
+        json.dump(report(), f, indent=2)
+    with open(prefix + '.trace.json', 'w') as f:
+        json.dump(chrome_trace(), f)
+    return prefix + '.json', prefix + '.trace.json'
+
+def print_report():
+    stats = report()
+    if not stats:
+        return
+    print("\n Profilo per stadio:")
+    for name, s in stats.items():
+        print(f"   {name:12s} {s['count']:8d} chiamate  {s['total_s'] * 1e3:10.1f} ms  "
+              f"(media {s['mean_s'] * 1e6:9.1f} µs, max {s['max_s'] * 1e3:8.2f} ms)")
@@ -0,0 +1,135 @@
+# streaming.py - Compressione a strisce di immagini BMP più grandi della RAM
+import struct
+import sys
+import numpy as np
+from compressione import compress_blocks
+from autotuning import best_backend
+from metriche import MetricsAccumulator
+from profilo import stage
+
+class BMPReader:
+    """
+    Lettura di una BMP non compressa (8 bit con palette o 24 bit) tramite
+    memory-map: i pixel restano su disco e read_rows legge solo le righe
+    richieste, già convertite in scala di grigi come Image.convert('L').
+    """
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            header = f.read(54)
+            if len(header) < 54 or header[:2] != b'BM':
+                raise ValueError(f"{path}: non è un file BMP")
+            pixel_offset, = struct.unpack_from('<I', header, 10)
+            dib_size, width, height, _, bpp, compression = struct.unpack_from('<IiiHHI', header, 14)
+            if compression != 0 or bpp not in (8, 24):
+                raise ValueError(f"{path}: supportate solo BMP non compresse a 8 o 24 bit")
+
+            self.lut = None
+            if bpp == 8:
+                colors_used, = struct.unpack_from('<I', header, 46)
+                f.seek(14 + dib_size)
+                palette = np.frombuffer(f.read(4 * (colors_used or 256)), dtype=np.uint8).reshape(-1, 4)
+                lut = np.zeros(256, dtype=np.uint8)
+                lut[:len(palette)] = _to_gray(palette[:, 2], palette[:, 1], palette[:, 0])
+                self.lut = lut
+
+        self.path = path
+        self.width = width
+        self.height = abs(height)
+        self.bpp = bpp
+        self.bottom_up = height > 0
+        stride = ((bpp * width + 31) // 32) * 4
+        raw = np.memmap(path, dtype=np.uint8, mode='r', offset=pixel_offset,
+                        shape=(self.height, stride))
+        # Vista con le righe nell'ordine dell'immagine (dall'alto in basso)
+        self._raw = raw[::-1] if self.bottom_up else raw
+
+    @property
+    def shape(self):
+        return (self.height, self.width)
+
+    def read_rows(self, start, stop):
+        """Righe [start, stop) in scala di grigi, uint8 di forma (stop-start, larghezza)."""
+        rows = self._raw[start:stop]
+        if self.bpp == 8:
+            return self.lut[rows[:, :self.width]]
+        bgr = rows[:, :3 * self.width].reshape(len(rows), self.width, 3)
+        return _to_gray(bgr[..., 2], bgr[..., 1], bgr[..., 0])
+
+    def close(self):
+        self._raw = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def _to_gray(r, g, b):
+    """Luminanza ITU-R 601-2 con la stessa aritmetica intera di PIL (convert('L'))."""
+    r = np.asarray(r, dtype=np.uint32)
+    g = np.asarray(g, dtype=np.uint32)
+    b = np.asarray(b, dtype=np.uint32)
+    return ((r * 19595 + g * 38470 + b * 7471 + 0x8000) >> 16).astype(np.uint8)
+
+def create_gray_bmp(path, height, width):
+    """
+    Crea una BMP a 8 bit in scala di grigi della dimensione data e restituisce
+    una memory-map uint8 (altezza, larghezza) dei suoi pixel, dall'alto in basso.
+    """
+    stride = ((8 * width + 31) // 32) * 4
+    pixel_offset = 14 + 40 + 256 * 4
+    file_size = pixel_offset + stride * height
+
+    palette = np.repeat(np.arange(256, dtype=np.uint8), 4).reshape(256, 4)
+    palette[:, 3] = 0
+    with open(path, 'wb') as f:
+        f.write(struct.pack('<2sIHHI', b'BM', file_size, 0, 0, pixel_offset))
+        f.write(struct.pack('<IiiHHIIiiII', 40, width, height, 1, 8, 0,
+                            stride * height, 2835, 2835, 256, 0))
+        f.write(palette.tobytes())
+        f.truncate(file_size)
+
+    raw = np.memmap(path, dtype=np.uint8, mode='r+', offset=pixel_offset, shape=(height, stride))
+    return raw[::-1, :width]
+
+def compress_bmp_streaming(src_path, dst_path, F, d, backend=None, dtype=np.float64, metrics=None):
+    """
+    Compressione DCT a strisce di F righe: ogni striscia viene letta dalla
+    BMP mappata in memoria, compressa e scritta subito nella BMP di uscita
+    (anch'essa mappata). La memoria usata è O(F × larghezza), non O(immagine).
+    Con `metrics` (un metriche.MetricsAccumulator) l'errore viene accumulato
+    striscia per striscia nello stesso passaggio, senza rileggere le immagini.
+    Restituisce le dimensioni (h, w) dell'immagine compressa (ritagliata).
+    """
+    with BMPReader(src_path) as reader:
+        h, w = reader.shape
+        num_blocks_v = h // F
+        num_blocks_h = w // F
+        if num_blocks_v == 0 or num_blocks_h == 0:
+            raise ValueError("L'immagine è più piccola di F")
+        if backend is None:
+            # Scelta per l'immagine intera, come compress_blocks (non per striscia)
+            backend = best_backend(F, num_blocks_v * num_blocks_h, dtype=dtype)
+
+        out = create_gray_bmp(dst_path, num_blocks_v * F, num_blocks_h * F)
+        for i in range(num_blocks_v):
+            with stage('load'):
+                strip = reader.read_rows(i * F, (i + 1) * F)
+            compress_blocks(strip, F, d, backend, dtype, out=out[i * F:(i + 1) * F])
+            if metrics is not None:
+                metrics.update(strip, out[i * F:(i + 1) * F])
+        with stage('save'):
+            out.flush()
+        del out
+
+    return num_blocks_v * F, num_blocks_h * F
+
+if __name__ == "__main__":
+    if len(sys.argv) != 5:
+        print("Uso: python streaming.py <input.bmp> <output.bmp> <F> <d>")
+        sys.exit(1)
+    src, dst, F, d = sys.argv[1], sys.argv[2], int(sys.argv[3]), int(sys.argv[4])
+    metrics = MetricsAccumulator()
+    h_new, w_new = compress_bmp_streaming(src, dst, F, d, metrics=metrics)
+    print(f" Immagine compressa ({w_new}x{h_new}) salvata in: {dst} - PSNR {metrics.psnr:.2f} dB")
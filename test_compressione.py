@@ -0,0 +1,628 @@
+# test_compressione.py - Verifica del motore di compressione vettorizzato
+import os
+import numpy as np
+from PIL import Image
+from utils import dct2_fast, idct2_fast, DCT_BACKENDS
+from compressione import compress_blocks, forward_blocks, frequency_mask, CoefficientCache, IncrementalReconstructor
+from compressione import progressive_reconstructions, CompressionWorkspace
+from streaming import BMPReader, compress_bmp_streaming
+from parallelo import compress_parallel, split_bands
+from griglia import ResultStore, run_grid
+from codifica import encode_coefficients, decode_coefficients, encode_image, decode_image, zigzag_order
+from codifica import save_tiled, TiledReader, encode_progressive, decode_progressive
+from metriche import MetricsAccumulator, mse
+
+IMG_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'immagini')
+
+def _load(name):
+    return np.array(Image.open(os.path.join(IMG_DIR, name)).convert('L'))
+
+def _compress_reference(image, F, d):
+    """Versione a cicli blocco per blocco (algoritmo originale)"""
+    h, w = image.shape
+    num_blocks_v = h // F
+    num_blocks_h = w // F
+    compressed = np.zeros((num_blocks_v * F, num_blocks_h * F))
+    for i in range(num_blocks_v):
+        for j in range(num_blocks_h):
+            block = image[i*F:(i+1)*F, j*F:(j+1)*F].astype(np.float64)
+            dct_block = dct2_fast(block)
+            for k in range(F):
+                for l in range(F):
+                    if k + l >= d:
+                        dct_block[k, l] = 0
+            idct_block = idct2_fast(dct_block)
+            # Arrotondamento con i pareggi x.5 per difetto (regola di round_clip)
+            compressed[i*F:(i+1)*F, j*F:(j+1)*F] = np.clip(np.floor(idct_block + 0.5 - 1e-6), 0, 255)
+    return compressed.astype(np.uint8)
+
+def test_compress_blocks_matches_reference():
+    """Il motore vettorizzato deve dare esattamente lo stesso risultato dei cicli"""
+    for name in ['80x80.bmp', '160x160.bmp', 'shoe.bmp']:
+        image = _load(name)
+        for F in [4, 8, 16]:
+            for d in [0, 1, F, 2 * F - 2]:
+                expected = _compress_reference(image, F, d)
+                result = compress_blocks(image, F, d, backend='scipy')
+                assert result.dtype == np.uint8
+                assert result.shape == expected.shape
+                assert np.array_equal(result, expected), f"{name} F={F} d={d}"
+
+def test_compress_blocks_crop():
+    """Le dimensioni non multiple di F vengono ritagliate (avanzi scartati)"""
+    image = np.random.default_rng(0).integers(0, 256, size=(37, 21), dtype=np.uint8)
+    assert compress_blocks(image, 8, 4).shape == (32, 16)
+    assert compress_blocks(image, 32, 4).shape == (32, 0)
+
+def test_coefficient_cache():
+    """La cache riusa la DCT in avanti e rispetta il limite di memoria (LRU)"""
+    image = _load('160x160.bmp')
+    cache = CoefficientCache()
+    for d in range(15):
+        assert np.array_equal(cache.compress(image, 8, d), compress_blocks(image, 8, d))
+    assert (cache.misses, cache.hits) == (1, 14)
+
+    # Spazio per due sole voci: la meno usata di recente viene eliminata
+    entry_bytes = cache.get(image, 8).nbytes
+    cache = CoefficientCache(max_bytes=2 * entry_bytes)
+    other = 255 - image
+    cache.get(image, 8)
+    cache.get(other, 8)
+    cache.get(image, 8)          # image diventa la più recente
+    cache.get(image // 2, 8)     # elimina other
+    assert len(cache) == 2 and cache.nbytes == 2 * entry_bytes
+    misses = cache.misses
+    cache.get(image, 8)
+    assert cache.misses == misses
+    cache.get(other, 8)
+    assert cache.misses == misses + 1
+
+def test_incremental_reconstructor():
+    """Spostare d avanti e indietro dà esattamente la compressione completa"""
+    image = _load('160x160.bmp')
+    for F in [4, 8]:
+        rec = IncrementalReconstructor(forward_blocks(image, F))
+        for d in [1, 2, 3, 6, 5, 2, 2 * F - 2, 0, F, F + 1]:
+            result = rec.set_d(d)
+            expected = compress_blocks(image, F, d)
+            assert np.array_equal(result, expected), f"F={F} d={d}"
+
+def test_backends_agree():
+    """Tutti i backend registrati danno la stessa compressione (stessa regola per i pareggi x.5)"""
+    image = _load('shoe.bmp')
+    for F in [4, 8, 16]:
+        for d in [2, F]:
+            expected = compress_blocks(image, F, d, backend='scipy')
+            for name in DCT_BACKENDS:
+                assert np.array_equal(compress_blocks(image, F, d, backend=name), expected), f"{name} F={F} d={d}"
+
+def test_streaming_matches_engine(tmp_path):
+    """La compressione a strisce da/verso BMP mappate dà lo stesso risultato in memoria"""
+    for name in ['gradient.bmp', 'shoe.bmp']:  # palette 8 bit e 24 bit
+        src = os.path.join(IMG_DIR, name)
+        image = _load(name)
+        with BMPReader(src) as reader:
+            assert np.array_equal(reader.read_rows(0, reader.height), image)
+            assert np.array_equal(reader.read_rows(10, 30), image[10:30])
+
+        dst = str(tmp_path / f"out_{name}")
+        metrics = MetricsAccumulator()
+        shape = compress_bmp_streaming(src, dst, 8, 5, backend='gemm', metrics=metrics)
+        result = np.array(Image.open(dst))
+        assert result.shape == shape
+        assert np.array_equal(result, compress_blocks(image, 8, 5, backend='gemm'))
+        assert np.isclose(metrics.mse, mse(image, result))
+
+def test_parallel_bit_identical():
+    """La compressione multi-processo a bande coincide bit a bit con quella seriale"""
+    image = _load('gradient.bmp')
+    for F, workers in [(8, 2), (16, 3)]:
+        expected = compress_blocks(image, F, F, backend='gemm')
+        result = compress_parallel(image, F, F, workers=workers, backend='gemm')
+        assert np.array_equal(result, expected)
+    assert split_bands(10, 4) == [(0, 2), (2, 5), (5, 8), (8, 10)]
+    assert split_bands(2, 8) == [(0, 1), (1, 2)]
+
+def test_grid_resumable(tmp_path):
+    """La griglia salva i risultati nell'archivio e alla seconda esecuzione non ricalcola nulla"""
+    # File rotto e immagine più piccola della finestra SSIM: segnalati, la griglia prosegue
+    (tmp_path / 'rotta.bmp').write_bytes(b'non una bmp')
+    Image.fromarray(_load('80x80.bmp')[:6, :6]).save(tmp_path / 'piccola.png')
+    images = [('80x80.bmp', os.path.join(IMG_DIR, '80x80.bmp')),
+              ('shoe.bmp', os.path.join(IMG_DIR, 'shoe.bmp')),
+              ('manca.bmp', os.path.join(IMG_DIR, 'manca.bmp')),
+              ('rotta.bmp', str(tmp_path / 'rotta.bmp')),
+              ('piccola.png', str(tmp_path / 'piccola.png'))]
+    d_values_for = lambda F: [1, F, 2 * F - 2]
+    with ResultStore(str(tmp_path / 'store.sqlite')) as store:
+        hashes, new = run_grid(images, [4, 8], d_values_for, store, workers=2)
+        assert set(hashes) == {'80x80.bmp', 'shoe.bmp', 'piccola.png'} and new == 12
+
+        image = _load('shoe.bmp')
+        row = store.get(hashes['shoe.bmp'], 8, 8)
+        compressed = compress_blocks(image, 8, 8)
+        mse = np.mean((image[:256, :256].astype(float) - compressed) ** 2)
+        assert abs(row['mse'] - mse) < 1e-9 and row['kept'] == 36
+        assert 0 < row['ssim'] < 1
+        # Righe di un archivio senza SSIM: contano come mancanti
+        store.conn.execute("UPDATE results SET ssim = NULL WHERE F = 4 AND d = 1")
+        store.conn.commit()
+
+    with ResultStore(str(tmp_path / 'store.sqlite')) as store:
+        _, new = run_grid(images, [4, 8, 16], d_values_for, store, workers=1)
+        assert new == 6 + 2  # le celle con F=16 e quelle senza SSIM
+        assert len(store.rows()) == 18
+
+    # Tabella degli esperimenti: le celle dei job falliti sono saltate, non un errore
+    from esperimenti_finali import table_rows, d_for, D_PERCENTAGES
+    with ResultStore(str(tmp_path / 'tabella.sqlite')) as store:
+        hashes, new = run_grid(images, [4, 16], lambda F: [d_for(F, p) for p in D_PERCENTAGES], store, workers=1)
+        rows = table_rows(store, hashes, [4, 16])
+        assert 'piccola.png' in hashes and {row['Immagine'] for row in rows} == {'80x80', 'shoe'}
+        assert len(rows) == new == 2 * 2 * len(D_PERCENTAGES)
+
+def test_codec_roundtrip():
+    """Codifica/decodifica .dctz: coefficienti quantizzati esatti e file più piccolo dell'originale"""
+    image = _load('shoe.bmp')
+    coeffs = forward_blocks(image, 8, backend='gemm')
+    for d, q in [(0, 1.0), (3, 1.0), (8, 4.0), (14, 0.5), (15, 1.0)]:
+        data = encode_coefficients(coeffs, d, q)
+        decoded, d_read = decode_coefficients(data)
+        expected = np.round(coeffs / q) * q * frequency_mask(8, d)
+        assert d_read == d and np.max(np.abs(decoded - expected)) < 1e-9
+
+    # Tipi di corse e valori con ordine dei byte esplicito (stesso file su ogni piattaforma)
+    from codifica import _HEADER
+    header = _HEADER.unpack_from(encode_coefficients(coeffs, 15, 0.01))
+    assert header[9][:1] in b'<|' and header[10] == b'<i4'
+
+    assert list(zigzag_order(4)) == [0, 1, 4, 8, 5, 2, 3, 6, 9, 12, 13, 10, 7, 11, 14, 15]
+
+    # Con q=1 la ricostruzione differisce di pochissimo da quella senza quantizzazione
+    data = encode_image(image, 8, 8, backend='gemm')
+    decoded = decode_image(data, backend='gemm')
+    assert len(data) < image.size // 4
+    assert np.max(np.abs(decoded.astype(int) - compress_blocks(image, 8, 8, backend='gemm'))) <= 2
+
+def test_tiled_decode_region(tmp_path):
+    """decode_region legge solo le tile necessarie e coincide con la decodifica completa"""
+    image = _load('gradient.bmp')
+    path = str(tmp_path / 'gradient.dctt')
+    save_tiled(path, image, 8, 6, tile_blocks=16, backend='gemm')
+    full = decode_image(encode_image(image, 8, 6, backend='gemm'), backend='gemm')
+    with TiledReader(path, backend='gemm') as reader:
+        assert reader.shape == full.shape
+        for x, y, w, h in [(0, 0, 1000, 600), (130, 77, 300, 200), (-5, -5, 20, 20), (990, 590, 50, 50)]:
+            region = reader.decode_region(x, y, w, h)
+            assert np.array_equal(region, full[max(0, y):y + h, max(0, x):x + w])
+
+def test_progressive_decoding():
+    """Le ricostruzioni progressive arrivano per anti-diagonali e l'ultima è quella completa"""
+    image = _load('shoe.bmp')
+    coeffs = forward_blocks(image, 8, backend='gemm')
+    steps = list(progressive_reconstructions(coeffs, 6, backend='gemm'))
+    assert [d for d, _ in steps] == [1, 2, 3, 4, 5, 6]
+    # Anteprima solo-DC: ogni blocco è costante
+    blocks = steps[0][1].reshape(32, 8, 32, 8)
+    assert np.all(blocks.min(axis=(1, 3)) == blocks.max(axis=(1, 3)))
+
+    data = encode_progressive(coeffs, 10)
+    full = decode_image(encode_coefficients(coeffs, 10), backend='gemm')
+    decoded = list(decode_progressive(data, backend='gemm'))
+    assert [d for d, _ in decoded] == list(range(1, 11))
+    assert np.array_equal(decoded[-1][1], full)
+    # Un prefisso del file basta per le prime diagonali
+    assert 0 < len(list(decode_progressive(data[:len(data) // 3], backend='gemm'))) < 10
+
+def test_float32_within_one_grey_level():
+    """In float32 le ricostruzioni uint8 differiscono al più di 1 livello da quelle float64"""
+    for name in sorted(f for f in os.listdir(IMG_DIR) if f.endswith('.bmp')):
+        image = _load(name)
+        for F in [4, 8, 16]:
+            coeffs32 = forward_blocks(image, F, backend='gemm', dtype=np.float32)
+            assert coeffs32.dtype == np.float32
+            for d in [1, F, 2 * F - 2]:
+                for backend in ['scipy', 'gemm']:
+                    single = compress_blocks(image, F, d, backend, dtype=np.float32)
+                    double = compress_blocks(image, F, d, backend)
+                    assert np.max(np.abs(single.astype(int) - double), initial=0) <= 1, f"{name} F={F} d={d}"
+
+def test_workspace_no_large_allocations():
+    """Il workspace scrive nell'uscita del chiamante, coincide con 'gemm' e non alloca array grandi"""
+    import tracemalloc
+    image = _load('gradient.bmp')
+    for dtype in [np.float64, np.float32]:
+        workspace = CompressionWorkspace(image.shape, 8, dtype)
+        out = np.empty((600, 1000), dtype=np.uint8)
+        for d in [0, 3, 8, 15]:
+            assert workspace.compress(image, d, out) is out
+            assert np.array_equal(out, compress_blocks(image, 8, d, 'gemm', dtype))
+
+    # out= anche sul percorso normale
+    out = np.zeros((600, 1000), dtype=np.uint8)
+    assert compress_blocks(image, 8, 5, 'scipy', out=out) is out
+    assert np.array_equal(out, compress_blocks(image, 8, 5, 'scipy'))
+
+    workspace = CompressionWorkspace(image.shape, 8)
+    workspace.compress(image, 5, out)
+    tracemalloc.start()
+    compress_blocks(image, 8, 6, out=out, workspace=workspace)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    assert peak < image.size  # meno di una sola copia uint8 dell'immagine
+
+    # Workspace non adatto: errore, non un risultato sbagliato
+    for args, kwargs in [((image, 16, 3), {}), ((image[:8], 8, 3), {}),
+                         ((image, 8, 3), {'dtype': np.float32}), ((image, 8, 3), {'backend': 'scipy'})]:
+        try:
+            compress_blocks(*args, workspace=workspace, **kwargs)
+        except ValueError:
+            continue
+        raise AssertionError(f"workspace accettato per {args[1:]} {kwargs}")
+
+def test_benchmark_baseline():
+    """Il confronto con la baseline segnala solo i rallentamenti oltre soglia e rumore"""
+    from benchmark import time_function, compare_with_baseline
+    stats = time_function(np.sort, np.arange(1000), warmup=1, min_time=0.0, min_reps=5)
+    assert stats['reps'] == 5 and stats['q1'] <= stats['median'] <= stats['q3']
+
+    base = {'results': [{'key': 'a', 'median': 1.0, 'iqr': 0.01},
+                        {'key': 'b', 'median': 1.0, 'iqr': 0.01}]}
+    current = [{'key': 'a', 'median': 1.05, 'iqr': 0.01},
+               {'key': 'b', 'median': 1.50, 'iqr': 0.01},
+               {'key': 'c', 'median': 9.00, 'iqr': 0.01}]
+    regressions = compare_with_baseline(current, base, threshold=0.10)
+    assert [key for key, _ in regressions] == ['b']
+
+def test_lazy_imports():
+    """Importare motore, codec e griglia non carica SciPy, PIL né pandas"""
+    import subprocess, sys
+    code = ("import sys, compressione, codifica, griglia, esperimenti_finali, lotto; "
+            "print(sorted(m for m in ('scipy', 'PIL', 'pandas') if m in sys.modules))")
+    out = subprocess.run([sys.executable, '-c', code], cwd=os.path.dirname(IMG_DIR),
+                         capture_output=True, text=True, check=True).stdout
+    assert out.strip() == '[]'
+
+def test_background_worker():
+    """Il worker in sottofondo riporta l'avanzamento, si annulla e restituisce l'ultimo lavoro"""
+    from lavori import CompressionWorker
+    image = _load('gradient.bmp')
+    worker = CompressionWorker(preview=False)
+    try:
+        seen = []
+
+        def messages(job):
+            while True:
+                msg = worker.results.get(timeout=30)
+                seen.append(msg[:2])
+                if msg[1] == job:
+                    yield msg
+                    if msg[0] in ('done', 'error'):
+                        return
+
+        job = worker.submit(image, 4, 3)
+        msgs = list(messages(job))
+        progress = [m[2] for m in msgs if m[0] == 'progress']
+        assert progress == sorted(progress) and progress[-1] == msgs[0][3] == 150
+        kind, _, F, d, compressed = msgs[-1]
+        assert (kind, F, d) == ('done', 4, 3)
+        assert np.array_equal(compressed, compress_blocks(image, 4, 3, 'gemm'))
+
+        # Un nuovo lavoro supera quello in corso; annullato, un lavoro non produce risultati
+        first = worker.submit(image, 8, 5)
+        second = worker.submit(image, 8, 9)
+        kind, _, F, d, compressed = list(messages(second))[-1]
+        assert (kind, F, d) == ('done', 8, 9) and first < second
+        cancelled = worker.submit(image, 16, 7)
+        worker.cancel()
+        last = worker.submit(image, 8, 2)
+        list(messages(last))
+        assert ('done', cancelled) not in seen
+    finally:
+        worker.close()
+
+def test_viewport_tiles():
+    """La vista calcola solo i tile visibili e coincide con la compressione dell'immagine intera"""
+    from vista import ViewportCompressor, level_for_zoom
+    assert [level_for_zoom(z) for z in [4, 1, 0.6, 0.5, 0.3, 0.25, 0.1]] == [0, 0, 0, 1, 1, 2, 3]
+    image = _load('gradient.bmp')
+    view = ViewportCompressor(image, 8, 6, tile_blocks=4, backend='gemm', max_tiles=50)
+    full = compress_blocks(image, 8, 6, 'gemm')
+    assert view.level_shape(0) == full.shape
+
+    region = view.render(0, 100, 50, 300, 150)
+    assert np.array_equal(region, full[50:150, 100:300])
+    assert view.computed == len(view.tiles_in(0, 100, 50, 300, 150)) == 4 * 7
+    view.render(0, 110, 60, 290, 140)  # stessa zona: tutto dalla cache
+    assert view.computed == 28
+
+    # Vista rimpicciolita: immagine decimata, ritagliata oltre il bordo
+    region = view.render(2, 0, 0, 10**6, 10**6)
+    assert np.array_equal(region, compress_blocks(image[::4, ::4], 8, 6, 'gemm'))
+    view.prefetch(0, view.tiles_in(0, 0, 0, 10**6, 10**6))
+    assert len(view._tiles) == 50
+
+    # Cambiare d non rifà la DCT in avanti dei tile (coefficienti in cache)
+    computed = view.computed
+    view.set_d(3)
+    assert np.array_equal(view.render(0, 100, 50, 300, 150), compress_blocks(image, 8, 3, 'gemm')[50:150, 100:300])
+    assert view.computed == computed
+
+    # Senza attesa: anteprima solo-DC dei tile mancanti, poi quelli definitivi
+    view = ViewportCompressor(image, 8, 6, tile_blocks=4, backend='gemm')
+    region, missing = view.render(0, 0, 0, 64, 32, wait=False)
+    assert view.computed == 0 and missing == [(0, 0), (0, 1)]
+    assert np.array_equal(region, compress_blocks(image[:32, :64], 8, 1, 'gemm'))
+    view.prefetch(0, missing)
+    region, missing = view.render(0, 0, 0, 64, 32, wait=False)
+    assert missing == [] and np.array_equal(region, full[:32, :64])
+    # Risultato dell'immagine intera già calcolato (worker): i tile ne sono ritagli
+    view.set_full(6, full)
+    assert view.ready(0, 5, 5) and np.array_equal(view.render(0, 150, 150, 200, 190), full[150:190, 150:200])
+
+def test_quality_metrics():
+    """Metriche a strisce uguali alle formule dirette; immagini identiche: PSNR infinito, SSIM 1"""
+    from metriche import psnr, ssim, block_error_map
+    image = _load('160x160.bmp')
+    compressed = compress_blocks(image[:150, :157], 8, 4, 'scipy')
+    h, w = compressed.shape
+    diff = image[:h, :w].astype(float) - compressed
+    assert np.isclose(mse(image, compressed, chunk_rows=7), np.mean(diff ** 2))
+    assert psnr(image, image) == float('inf') and np.isclose(ssim(image, image), 1.0)
+    assert np.isclose(ssim(image, compressed, chunk_rows=5), ssim(image, compressed))
+    assert 0 < ssim(image, compressed) < 1
+
+    errors = block_error_map(image, compressed, 8, chunk_rows=16)
+    assert errors.shape == (h // 8, w // 8) and np.isclose(errors.mean(), np.mean(diff ** 2))
+    assert np.isclose(errors[2, 3], np.mean(diff[16:24, 24:32] ** 2))
+
+    acc = MetricsAccumulator(F=8)
+    for r in range(0, h, 8):
+        acc.update(image[r:r + 8], compressed[r:r + 8])
+    assert np.isclose(acc.mse, np.mean(diff ** 2)) and np.allclose(acc.block_errors(), errors)
+
+def test_target_psnr():
+    """Il d trovato è il più piccolo che raggiunge il PSNR obiettivo (anche dal worker)"""
+    from compressione import d_for_target_psnr
+    from lavori import CompressionWorker
+    from metriche import psnr
+    image = _load('shoe.bmp')
+    cache = CoefficientCache(backend='scipy')
+    for target in [20, 30, 45, 70]:
+        d, compressed, actual = cache.compress_to_psnr(image, 8, target)
+        assert actual >= target and np.array_equal(compressed, cache.compress(image, 8, d))
+        assert d == 0 or psnr(image, cache.compress(image, 8, d - 1)) < target
+    d, _, actual = d_for_target_psnr(cache.get(image, 8), image, 1000, d_max=10, backend='scipy')
+    assert d == 10 and actual < 1000  # obiettivo irraggiungibile: d_max
+
+    worker = CompressionWorker(preview=False)
+    try:
+        job = worker.submit_target(image, 8, 30)
+        while True:
+            msg = worker.results.get(timeout=30)
+            if msg[0] == 'done' and msg[1] == job:
+                break
+        assert msg[3] == cache.compress_to_psnr(image, 8, 30)[0]
+    finally:
+        worker.close()
+
+def test_rate_distortion_curve():
+    """La curva in un passaggio coincide con le compressioni complete per ogni d"""
+    from compressione import rate_distortion_curve
+    from metriche import psnr
+    image = _load('shoe.bmp')
+    F = 8
+    curve = rate_distortion_curve(image, F, backend='scipy', exact=True)
+    assert list(curve['d']) == list(range(2 * F - 1))
+    coeffs = forward_blocks(image, F, backend='scipy')
+    for d in curve['d']:
+        assert curve['kept'][d] == frequency_mask(F, d).sum()
+        # Previsione = errore prima di round/clip (Parseval)
+        unrounded = idct2_fast(coeffs * frequency_mask(F, d))
+        blocks = image[:256, :256].reshape(32, 8, 32, 8).swapaxes(1, 2)
+        assert np.isclose(curve['mse'][d], np.mean((blocks - unrounded) ** 2))
+        assert abs(curve['psnr_exact'][d] - psnr(image, compress_blocks(image, F, d, 'scipy'))) < 0.05
+
+def test_adaptive_d():
+    """d per blocco: rispetta il budget, raggiunge il PSNR con meno coefficienti del d globale, .dcta senza perdite"""
+    from adattivo import allocate_d, adaptive_mask, compress_adaptive, reconstruct_adaptive
+    from codifica import encode_adaptive, decode_adaptive
+    from metriche import psnr
+    image = _load('shoe.bmp')
+    F = 8
+    coeffs = forward_blocks(image, F, backend='scipy')
+    d_map = allocate_d(coeffs, budget=5000)
+    assert d_map.shape == coeffs.shape[:2] and adaptive_mask(F, d_map).sum() <= 5000
+    # Budget illimitato: si scartano solo coefficienti nulli
+    unlimited = reconstruct_adaptive(coeffs, allocate_d(coeffs, budget=10**9), 'scipy')
+    assert np.array_equal(unlimited, compress_blocks(image, F, 2 * F - 1, 'scipy'))
+    # d uniforme: stessa ricostruzione di compress_blocks
+    uniform = np.full(coeffs.shape[:2], 6)
+    assert np.array_equal(reconstruct_adaptive(coeffs, uniform, 'scipy'), compress_blocks(image, F, 6, 'scipy'))
+
+    d, _, _ = CoefficientCache(backend='scipy').compress_to_psnr(image, F, 35)
+    compressed, d_map = compress_adaptive(image, F, target_psnr=35, backend='scipy', coeffs=coeffs)
+    assert psnr(image, compressed) >= 35
+    assert adaptive_mask(F, d_map).sum() < d_map.size * frequency_mask(F, d).sum()
+
+    decoded, decoded_map = decode_adaptive(encode_adaptive(coeffs, d_map), backend='scipy')
+    assert np.array_equal(decoded_map, d_map)
+    assert np.abs(decoded.astype(int) - compressed).max() <= 1
+
+def test_color_compression():
+    """RGB -> YCbCr -> RGB, crominanza sottocampionata in un solo lotto di blocchi, vista e worker a colori"""
+    from colore import rgb_to_ycbcr, ycbcr_to_rgb, compress_color, color_d_for_target_psnr, SUBSAMPLING
+    from lavori import CompressionWorker
+    from vista import ViewportCompressor
+    from metriche import psnr
+    from colore import load_image
+    grey = _load('shoe.bmp')
+    # BMP a 24 bit con R == G == B: caricati in grigio (h, w), veri colori in RGB
+    assert load_image(os.path.join(IMG_DIR, 'deer.bmp')).shape == (661, 1011)
+    assert np.array_equal(load_image(os.path.join(IMG_DIR, 'prova.bmp')), _load('prova.bmp'))
+    assert load_image(os.path.join(IMG_DIR, 'shoe.bmp')).shape == (260, 260, 3)
+    image = np.stack([grey, np.roll(grey, 40, axis=1), 255 - grey.T], axis=-1)[:250, :243]
+    assert np.abs(ycbcr_to_rgb(rgb_to_ycbcr(image)).astype(int) - image).max() <= 1
+
+    # Grigio replicato sui tre canali: crominanza costante, stessa compressione del grigio
+    F = 8
+    same = compress_color(np.repeat(grey[..., None], 3, axis=-1), F, 6, backend='scipy')
+    assert np.abs(same.astype(int) - compress_blocks(grey, F, 6, 'scipy')[..., None]).max() <= 1
+
+    full = compress_color(image, F, 2 * F - 1, subsampling='4:4:4', backend='scipy')
+    assert full.shape == (248, 240, 3) and np.abs(full.astype(int) - image[:248, :240]).max() <= 1
+    results = {mode: psnr(image, compress_color(image, F, 10, subsampling=mode, backend='scipy'))
+               for mode in SUBSAMPLING}
+    assert results['4:4:4'] > results['4:2:2'] > results['4:2:0'] > 25
+    # d separato per la crominanza
+    assert psnr(image, compress_color(image, F, 10, d_chroma=2, backend='scipy')) < results['4:2:0']
+
+    view = ViewportCompressor(image, F, 10, tile_blocks=4, backend='scipy')
+    assert np.array_equal(view.render(0, 0, 0, 64, 96), compress_color(image[:96, :64], F, 10, backend='scipy'))
+    worker = CompressionWorker(preview=False)
+    try:
+        # Avanzamento per stadi; cambiando solo d la DCT in avanti non si ripete
+        for d, stages in [(10, [(0, 2), (1, 2)]), (4, [(1, 2)])]:
+            job = worker.submit(image, F, d, '4:2:2')
+            progress = []
+            while True:
+                msg = worker.results.get(timeout=30)
+                if msg[0] != 'progress':
+                    break
+                progress.append(msg[2:])
+            assert progress == stages
+            assert msg[:4] == ('done', job, F, d) and np.array_equal(msg[4], compress_color(image, F, d, subsampling='4:2:2'))
+        # PSNR obiettivo: stesso d della ricerca diretta, coefficienti riusati
+        job = worker.submit_target(image, F, 30, '4:2:2')
+        msg = worker.results.get(timeout=30)
+        assert msg[:2] == ('progress', job) and msg[2:] == (1, 2)
+        msg = worker.results.get(timeout=30)
+        assert msg[:4] == ('done', job, F, color_d_for_target_psnr(image, F, 30, '4:2:2')[0])
+    finally:
+        worker.close()
+
+def test_batch_pipeline(tmp_path):
+    """Pipeline in lotto: stessi risultati delle funzioni dirette, errori isolati, ripresa"""
+    from lotto import main, run_batch, collect_inputs, output_paths
+    from codifica import load_dctz, encode_image, decode_image
+    from PIL import Image
+    src = tmp_path / 'in' / 'sub'
+    src.mkdir(parents=True)
+    grey = _load('shoe.bmp')
+    for i in range(5):
+        Image.fromarray(np.roll(grey, 10 * i, axis=1)).save(src / f'img{i}.png')
+    (src / 'rotta.png').write_bytes(b'non un png')
+    paths = collect_inputs([str(tmp_path / 'in')], recursive=True)
+    assert len(paths) == 6
+
+    summary = run_batch(paths, str(tmp_path / 'out'), 8, d=6, fmt='dctz', workers=2, queue_size=1,
+                        backend='scipy')
+    assert summary['files'] == 5 and len(summary['failed']) == 1 and 'rotta' in summary['failed'][0][0]
+    decoded = load_dctz(str(tmp_path / 'out' / 'img3.dctz'), backend='scipy')
+    expected = decode_image(encode_image(np.roll(grey, 30, axis=1), 8, 6, backend='scipy'), backend='scipy')
+    assert np.array_equal(decoded, expected)
+
+    assert main([str(src / 'img*.png'), '-o', str(tmp_path / 'out'), '--format', 'dctz', '-d', '6',
+                 '--skip-existing']) == 0
+    summary = run_batch(paths[:2], str(tmp_path / 'png'), 8, target_psnr=35, readers=1, writers=1)
+    assert summary['files'] == 2 and all(r['psnr'] >= 35 for r in summary['results'])
+    # .dctz: il PSNR verificato è quello del file scritto (coefficienti quantizzati)
+    from metriche import psnr
+    summary = run_batch(paths[:2], str(tmp_path / 'z'), 8, target_psnr=45, fmt='dctz', backend='scipy')
+    for r in summary['results']:
+        written = load_dctz(r['output'], backend='scipy')
+        assert r['psnr'] == psnr(np.asarray(Image.open(r['path'])), written) >= 45
+
+    # Stesso nome con estensioni diverse: le uscite conservano l'estensione di origine
+    same = tmp_path / 'stesso'
+    same.mkdir()
+    Image.fromarray(grey).save(same / 'a.bmp')
+    Image.fromarray(255 - grey).save(same / 'a.png')
+    Image.fromarray(grey).save(same / 'b.png')
+    paths = collect_inputs([str(same)])
+    assert [os.path.basename(p) for p in output_paths(paths, 'out', 'png')] == ['a.bmp.png', 'a.png.png', 'b.png']
+    for _ in range(2):  # la seconda volta con --skip-existing: tutti già fatti, nessuno perso
+        assert main([str(same), '-o', str(tmp_path / 'stesso_out'), '-d', '6', '--skip-existing']) == 0
+    assert np.array_equal(np.asarray(Image.open(tmp_path / 'stesso_out' / 'a.png.png')),
+                          compress_blocks(255 - grey, 8, 6))
+
+def test_image_cache(tmp_path):
+    """Cache dei pixel decodificati: .npy mappato al secondo caricamento, chiave con mtime, spazio limitato"""
+    import shutil
+    from cache_immagini import ImageCache
+    src = tmp_path / 'shoe.bmp'
+    shutil.copy(os.path.join(IMG_DIR, 'shoe.bmp'), src)
+    cache = ImageCache(str(tmp_path / 'cache'), max_bytes=100_000)
+    first = cache.load(str(src))
+    second = cache.load(str(src))
+    assert isinstance(second, np.memmap) and not second.flags.writeable
+    assert np.array_equal(first, _load('shoe.bmp')) and np.array_equal(second, first)
+    assert (cache.hits, cache.misses) == (1, 1)
+    assert cache.load(str(src), color=True).shape == (260, 260, 3)
+
+    # File modificato: nuova chiave, nuova decodifica
+    Image.fromarray(255 - first).save(src)
+    os.utime(src, ns=(10**18, 10**18))
+    assert np.array_equal(cache.load(str(src)), 255 - first) and cache.misses == 3
+    # Limite di spazio: la voce meno recente è eliminata (quella a colori non ci sta)
+    assert cache.size() <= 100_000 and len(os.listdir(tmp_path / 'cache')) == 1
+    assert isinstance(ImageCache('off').load(str(src)), np.ndarray) and not os.path.exists('off')
+
+def test_profiling(tmp_path):
+    """Profilazione per stadi: nulla se disattivata, tempi del motore e dei worker della griglia, traccia Chrome"""
+    import json
+    import profilo
+    from griglia import ResultStore, run_grid
+    image = _load('160x160.bmp')
+    assert profilo.stage('forward') is profilo.stage('mask')  # disattivata: contesto vuoto condiviso
+    compress_blocks(image, 8, 4)
+    assert profilo.report() == {}
+
+    profilo.enable()
+    try:
+        compress_blocks(image, 8, 4, 'scipy')
+        stats = profilo.report()
+        assert all(stats[s]['count'] == 1 for s in ('crop', 'forward', 'mask', 'inverse', 'round_clip'))
+        profilo.reset()
+        with ResultStore(str(tmp_path / 'profilo.sqlite')) as store:
+            run_grid([('160', os.path.join(IMG_DIR, '160x160.bmp'))], [4, 8], lambda F: [2, 4], store, workers=2)
+        stats = profilo.report()
+        assert stats['forward']['count'] == 2 and stats['inverse']['count'] == 4 and stats['metrics']['count'] >= 8
+        summary, trace = profilo.save(str(tmp_path / 'profilo'))
+        events = json.load(open(trace))['traceEvents']
+        assert len(events) == sum(s['count'] for s in json.load(open(summary)).values())
+        assert all(e['ph'] == 'X' and e['dur'] >= 0 for e in events)
+    finally:
+        profilo.disable()
+        profilo.reset()
+
+if __name__ == "__main__":
+    os.environ['DCT_IMAGE_CACHE'] = 'off'  # come la fixture di conftest.py: niente ~/.cache
+    test_compress_blocks_matches_reference()
+    test_compress_blocks_crop()
+    test_coefficient_cache()
+    test_incremental_reconstructor()
+    test_backends_agree()
+    test_parallel_bit_identical()
+    test_codec_roundtrip()
+    test_progressive_decoding()
+    test_float32_within_one_grey_level()
+    test_workspace_no_large_allocations()
+    test_benchmark_baseline()
+    test_lazy_imports()
+    test_background_worker()
+    test_viewport_tiles()
+    test_quality_metrics()
+    test_target_psnr()
+    test_rate_distortion_curve()
+    test_adaptive_d()
+    test_color_compression()
+    import tempfile, pathlib
+    with tempfile.TemporaryDirectory() as tmp:
+        test_streaming_matches_engine(pathlib.Path(tmp))
+        test_grid_resumable(pathlib.Path(tmp))
+        test_tiled_decode_region(pathlib.Path(tmp))
+        test_batch_pipeline(pathlib.Path(tmp))
+        test_image_cache(pathlib.Path(tmp))
+        test_profiling(pathlib.Path(tmp))
+    print("TEST PASSED")
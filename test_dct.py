@@ -1,7 +1,7 @@
 # test_dct.py - Verifica della correttezza della DCT
 import numpy as np
 from scipy.fft import dct  # <-- per il test 1D
-from utils import dct2_naive, dct2_fast, idct2_fast
+from utils import dct2_naive, dct2_fast, idct2_fast, dct2_gemm, idct2_gemm, DCT_BACKENDS
 
 def test_dct_implementation():
     """
@@ -72,5 +72,35 @@ def test_dct_implementation():
     else:
         print("\nTEST CHECK (controlla scalatura/type o arrotondamenti)")
 
+def test_dct_gemm_backend():
+    """La DCT2 a matrici (base in cache, pile di blocchi) coincide con la fast"""
+    rng = np.random.default_rng(0)
+    for N in [4, 8, 16, 32]:
+        blocks = rng.uniform(0, 255, size=(5, 7, N, N))
+        coeffs = dct2_gemm(blocks)
+        assert np.max(np.abs(coeffs - dct2_fast(blocks))) < 1e-10
+        assert np.max(np.abs(idct2_gemm(coeffs) - idct2_fast(coeffs))) < 1e-10
+        assert np.max(np.abs(idct2_gemm(coeffs) - blocks)) < 1e-10
+
+        # Un singolo blocco N×N funziona come prima
+        assert np.max(np.abs(dct2_gemm(blocks[0, 0]) - dct2_naive(blocks[0, 0]))) < 1e-10
+
+def test_registered_backends():
+    """Ogni backend registrato (DCT2, IDCT2) coincide con dct2_fast/idct2_fast"""
+    rng = np.random.default_rng(1)
+    for name, (forward, inverse) in DCT_BACKENDS.items():
+        for N in [3, 4, 8, 16]:
+            blocks = rng.uniform(0, 255, size=(6, N, N))
+            coeffs = forward(blocks)
+            assert np.max(np.abs(coeffs - dct2_fast(blocks))) < 1e-10, name
+            assert np.max(np.abs(inverse(coeffs) - blocks)) < 1e-10, name
+
+            # Precisione singola: stesso tipo in uscita, errore da float32
+            coeffs32 = forward(blocks, dtype=np.float32)
+            assert coeffs32.dtype == np.float32 and inverse(coeffs32).dtype == np.float32, name
+            assert np.max(np.abs(inverse(coeffs32) - blocks)) < 1e-3, name
+
 if __name__ == "__main__":
     test_dct_implementation()
+    test_dct_gemm_backend()
+    test_registered_backends()
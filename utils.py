@@ -1,16 +1,23 @@
 # utils.py - Funzioni di supporto per il progetto
+import importlib.util
 import numpy as np
-from scipy.fft import dct as _dct, idct as _idct
+from functools import lru_cache
 import time
 
 # ---------- DCT "fatta in casa" O(N^3) via matrici di base ----------
-def _dct_matrix(N: int) -> np.ndarray:
-    """Matrice DCT-II ortonormale (come a lezione)."""
+@lru_cache(maxsize=32)
+def _dct_matrix(N: int, dtype=np.float64) -> np.ndarray:
+    """
+    Matrice DCT-II ortonormale (come a lezione).
+    Calcolata una sola volta per (N, dtype) e restituita in sola lettura.
+    """
     k = np.arange(N)[:, None]       # righe
     i = np.arange(N)[None, :]       # colonne
     D = np.cos((np.pi*(2*i + 1)*k)/(2*N)).astype(np.float64)
     D[0, :] *= 1/np.sqrt(N)
     D[1:, :] *= np.sqrt(2/N)
+    D = D.astype(dtype)
+    D.flags.writeable = False
     return D
 
 def dct2_naive(X: np.ndarray) -> np.ndarray:
@@ -33,22 +40,128 @@ def idct2_naive(C: np.ndarray) -> np.ndarray:
     return D.T @ C @ D
 
 # ---------- DCT/IDCT veloci (SciPy) con stessa scalatura ----------
-def dct2_fast(block: np.ndarray) -> np.ndarray:
-    """DCT2 veloce (Type-II, norm='ortho') per righe e colonne."""
-    X = np.asarray(block, dtype=np.float64)
-    return _dct(_dct(X, axis=0, type=2, norm='ortho'), axis=1, type=2, norm='ortho')
+# scipy.fft si importa al primo uso: importarlo costa più di numpy stesso e
+# molti processi brevi (CLI, worker) usano solo il backend 'gemm' o 'numpy_fft'
+HAVE_SCIPY = importlib.util.find_spec('scipy') is not None
+
+def _scipy_fft():
+    import scipy.fft
+    return scipy.fft
+
+def dct2_fast(block: np.ndarray, dtype=np.float64) -> np.ndarray:
+    """
+    DCT2 veloce (Type-II, norm='ortho') per righe e colonne.
+    Lavora sugli ultimi due assi: accetta anche pile di blocchi (..., F, F).
+    `dtype` sceglie la precisione del calcolo (float64 o float32).
+    """
+    X = np.asarray(block, dtype=dtype)
+    _dct = _scipy_fft().dct
+    return _dct(_dct(X, axis=-2, type=2, norm='ortho'), axis=-1, type=2, norm='ortho')
+
+def idct2_fast(C: np.ndarray, dtype=None) -> np.ndarray:
+    """IDCT2 veloce coerente (anche su pile di blocchi (..., F, F))."""
+    if dtype is not None:
+        C = np.asarray(C, dtype=dtype)
+    _idct = _scipy_fft().idct
+    return _idct(_idct(C, axis=-2, type=2, norm='ortho'), axis=-1, type=2, norm='ortho')
+
+def _inverse_dtype(C, dtype):
+    """Precisione della IDCT: quella richiesta, altrimenti float32 solo se lo sono i coefficienti."""
+    if dtype is not None:
+        return dtype
+    return np.float32 if np.asarray(C).dtype == np.float32 else np.float64
+
+# ---------- DCT/IDCT a matrici (GEMM) su pile di blocchi ----------
+def dct2_gemm(blocks: np.ndarray, dtype=np.float64) -> np.ndarray:
+    """
+    DCT2 ortonormale come prodotto matriciale D @ X @ D.T con la base in cache.
+    Su una pila di blocchi (..., F, F) diventa due matmul a lotti (BLAS):
+    per F piccoli (4-32) è in genere più veloce di due passate FFT.
+    """
+    X = np.asarray(blocks, dtype=dtype)
+    N, M = X.shape[-2:]
+    assert N == M, "La DCT2 a matrici assume blocchi quadrati N×N."
+    D = _dct_matrix(N, X.dtype)
+    return D @ X @ D.T
+
+def idct2_gemm(C: np.ndarray, dtype=None) -> np.ndarray:
+    """IDCT2 a matrici coerente: D.T @ C @ D su pile di blocchi (..., F, F)."""
+    C = np.asarray(C, dtype=_inverse_dtype(C, dtype))
+    N, M = C.shape[-2:]
+    assert N == M, "La IDCT2 a matrici assume blocchi quadrati N×N."
+    D = _dct_matrix(N, C.dtype)
+    return D.T @ C @ D
+
+# ---------- DCT/IDCT via FFT di NumPy (senza SciPy) ----------
+def _dct_last_axis(X: np.ndarray) -> np.ndarray:
+    """DCT-II ortonormale lungo l'ultimo asse con una FFT di lunghezza N (Makhoul)."""
+    N = X.shape[-1]
+    v = np.concatenate([X[..., ::2], X[..., 1::2][..., ::-1]], axis=-1)
+    V = np.fft.fft(v, axis=-1)
+    k = np.arange(N)
+    C = (V * np.exp(-1j * np.pi * k / (2 * N))).real
+    scale = np.full(N, np.sqrt(2 / N))
+    scale[0] = np.sqrt(1 / N)
+    return C * scale
+
+def _idct_last_axis(C: np.ndarray) -> np.ndarray:
+    """DCT-III ortonormale (inversa della precedente) lungo l'ultimo asse."""
+    N = C.shape[-1]
+    k = np.arange(N)
+    scale = np.full(N, np.sqrt(N / 2))
+    scale[0] = np.sqrt(N)
+    U = C * scale
+    U_rev = np.concatenate([np.zeros_like(U[..., :1]), U[..., :0:-1]], axis=-1)  # U[N-k], U[N] = 0
+    V = np.exp(1j * np.pi * k / (2 * N)) * (U - 1j * U_rev)
+    v = np.fft.ifft(V, axis=-1).real
+    X = np.empty_like(v)
+    X[..., ::2] = v[..., :(N + 1) // 2]
+    X[..., 1::2] = v[..., (N + 1) // 2:][..., ::-1]
+    return X
+
+def dct2_numpy(blocks: np.ndarray, dtype=np.float64) -> np.ndarray:
+    """DCT2 ortonormale solo con numpy.fft (stessa scalatura di dct2_fast, anche su pile)."""
+    X = np.asarray(blocks, dtype=dtype)
+    Y = _dct_last_axis(X)
+    Y = np.swapaxes(_dct_last_axis(np.swapaxes(Y, -1, -2)), -1, -2)
+    return Y.astype(X.dtype, copy=False)
+
+def idct2_numpy(C: np.ndarray, dtype=None) -> np.ndarray:
+    """IDCT2 ortonormale solo con numpy.fft."""
+    C = np.asarray(C, dtype=_inverse_dtype(C, dtype))
+    X = _idct_last_axis(C)
+    X = np.swapaxes(_idct_last_axis(np.swapaxes(X, -1, -2)), -1, -2)
+    return X.astype(C.dtype, copy=False)
+
+# ---------- Registro dei backend DCT ----------
+# Ogni backend è una coppia (DCT2, IDCT2) che lavora su pile di blocchi (..., F, F);
+# la DCT2 accetta `dtype` (float64 o float32), la IDCT2 conserva il tipo dei coefficienti
+DCT_BACKENDS = {}
+
+def register_backend(name, forward, inverse):
+    """Registra (o sostituisce) un backend DCT con nome `name`."""
+    DCT_BACKENDS[name] = (forward, inverse)
+
+def get_backend(name):
+    """Restituisce la coppia (DCT2, IDCT2) del backend `name`."""
+    try:
+        return DCT_BACKENDS[name]
+    except KeyError:
+        raise ValueError(f"Backend DCT sconosciuto: {name!r} "
+                         f"(disponibili: {', '.join(DCT_BACKENDS)})") from None
 
-def idct2_fast(C: np.ndarray) -> np.ndarray:
-    """IDCT2 veloce coerente."""
-    return _idct(_idct(C, axis=0, type=2, norm='ortho'), axis=1, type=2, norm='ortho')
+if HAVE_SCIPY:
+    register_backend('scipy', dct2_fast, idct2_fast)
+register_backend('gemm', dct2_gemm, idct2_gemm)
+register_backend('numpy_fft', dct2_numpy, idct2_numpy)
 
 # ---------- Utility timing ----------
 def measure_time(func, *args, n_iterations=3):
     """Misura il tempo medio di esecuzione di una funzione."""
     times = []
     for _ in range(n_iterations):
-        start = time.time()
+        start = time.perf_counter()
         func(*args)
-        end = time.time()
+        end = time.perf_counter()
         times.append(end - start)
     return np.mean(times)
@@ -0,0 +1,205 @@
+# vista.py - Compressione pigra guidata dalla vista (zoom/pan) a tile con cache
+import math
+import threading
+from collections import OrderedDict
+import numpy as np
+from compressione import forward_blocks, reconstruct_blocks, round_clip
+from colore import forward_color, reconstruct_color
+from autotuning import best_backend
+
+def level_for_zoom(zoom):
+    """
+    Livello di dettaglio per un fattore di zoom (pixel schermo per pixel immagine):
+    il livello L usa un pixel ogni 2^L, il più grossolano che non scende sotto
+    la risoluzione dello schermo.
+    """
+    level = 0
+    while zoom * 2 ** (level + 1) <= 1:
+        level += 1
+    return level
+
+class ViewportCompressor:
+    """
+    Compressione DCT calcolata solo per i tile che servono alla vista.
+
+    L'immagine compressa è divisa in tile di `tile_blocks`×`tile_blocks`
+    blocchi F×F. I coefficienti DCT di un tile, che non dipendono da d, sono
+    calcolati al primo uso e tenuti in una cache LRU (al più `max_bytes`);
+    i tile ricostruiti per il d corrente in una seconda cache di al più
+    `max_tiles` tile. Cambiare d con set_d costa solo maschera + IDCT dei
+    tile visibili, senza rifare la DCT in avanti. Al livello 0 ogni tile
+    coincide con la stessa zona di compress_blocks sull'immagine intera; ai
+    livelli L > 0, per le viste rimpicciolite, si comprime l'immagine
+    decimata di 2^L (anteprima): il lavoro resta proporzionale allo schermo.
+    Le immagini a colori (h, w, 3) passano per forward_color/reconstruct_color
+    con il sottocampionamento `subsampling` (tile pari di blocchi: la
+    crominanza resta allineata tranne al più sui tile di bordo).
+    È thread-safe: i tile si possono calcolare in sottofondo con prefetch,
+    mentre render(..., wait=False) mostra subito un'anteprima solo-DC dei
+    tile non ancora pronti (raffinamento progressivo).
+    """
+
+    def __init__(self, image, F, d, tile_blocks=32, backend=None, max_tiles=512, subsampling='4:2:0',
+                 max_bytes=256 * 1024**2):
+        self.image = image
+        self.F = F
+        self.d = d
+        self.subsampling = subsampling
+        self.tile = tile_blocks * F
+        self.backend = backend or best_backend(F, tile_blocks * tile_blocks)
+        self.max_tiles = max_tiles
+        self.max_bytes = max_bytes
+        self.computed = 0
+        self.nbytes = 0
+        self._coeffs = OrderedDict()  # (livello, ty, tx) -> (coefficienti, layout del colore o None)
+        self._tiles = OrderedDict()   # (livello, ty, tx) -> (d, tile uint8)
+        self._full = None             # (d, immagine compressa intera) già calcolata altrove
+        self._lock = threading.Lock()
+
+    def set_d(self, d):
+        """Nuova soglia: i tile sono ricostruiti al prossimo uso dai coefficienti in cache."""
+        self.d = d
+
+    def set_full(self, d, image):
+        """
+        Compressione dell'immagine intera per la soglia d (es. il risultato
+        del worker): al livello 0 i tile con lo stesso d ne sono ritagli.
+        """
+        self._full = (d, image)
+
+    def level_shape(self, level):
+        """Dimensioni (ritagliate ai blocchi interi) dell'immagine compressa al livello dato."""
+        s = 2 ** level
+        h, w = (-(-n // s) for n in self.image.shape[:2])
+        return (h // self.F) * self.F, (w // self.F) * self.F
+
+    def tiles_in(self, level, x0, y0, x1, y1, margin=0):
+        """Tile (ty, tx) che coprono la regione [x0, x1) × [y0, y1) del livello, più `margin` tile attorno."""
+        h, w = self.level_shape(level)
+        rows, cols = -(-h // self.tile), -(-w // self.tile)
+        ty0 = max(0, math.floor(y0 / self.tile) - margin)
+        tx0 = max(0, math.floor(x0 / self.tile) - margin)
+        ty1 = min(rows, math.ceil(y1 / self.tile) + margin)
+        tx1 = min(cols, math.ceil(x1 / self.tile) + margin)
+        return [(ty, tx) for ty in range(ty0, ty1) for tx in range(tx0, tx1)]
+
+    def _source(self, level, ty, tx):
+        """Pixel originali (decimati di 2^livello) coperti dal tile."""
+        s = 2 ** level
+        h, w = self.level_shape(level)
+        r0, c0 = ty * self.tile, tx * self.tile
+        r1, c1 = min(r0 + self.tile, h), min(c0 + self.tile, w)
+        return np.asarray(self.image[r0 * s:r1 * s:s, c0 * s:c1 * s:s])
+
+    def ready(self, level, ty, tx):
+        """Vero se il tile si ottiene senza DCT in avanti (coefficienti o tile già pronti)."""
+        key = (level, ty, tx)
+        full = self._full
+        with self._lock:
+            entry = self._tiles.get(key)
+            return (key in self._coeffs or (entry is not None and entry[0] == self.d)
+                    or (level == 0 and full is not None and full[0] == self.d))
+
+    def coefficients(self, level, ty, tx):
+        """
+        Coefficienti DCT del tile (indipendenti da d) e layout dei piani per
+        il colore (None in scala di grigi), dalla cache se già calcolati.
+        """
+        key = (level, ty, tx)
+        with self._lock:
+            entry = self._coeffs.get(key)
+            if entry is not None:
+                self._coeffs.move_to_end(key)
+                return entry
+
+        source = self._source(level, ty, tx)
+        if source.ndim == 3:
+            entry = forward_color(source, self.F, self.subsampling, self.backend)
+        else:
+            entry = (forward_blocks(source, self.F, self.backend), None)
+        entry[0].flags.writeable = False
+
+        with self._lock:
+            if key not in self._coeffs:
+                self._coeffs[key] = entry
+                self.nbytes += entry[0].nbytes
+                self.computed += 1
+            # Tiene sempre almeno l'ultimo tile calcolato, anche se da solo supera il limite
+            while self.nbytes > self.max_bytes and len(self._coeffs) > 1:
+                _, (old, _) = self._coeffs.popitem(last=False)
+                self.nbytes -= old.nbytes
+        return entry
+
+    def get_tile(self, level, ty, tx):
+        """Tile compresso (uint8) in posizione (ty, tx) del livello per il d corrente."""
+        key = (level, ty, tx)
+        d = self.d
+        with self._lock:
+            entry = self._tiles.get(key)
+            if entry is not None and entry[0] == d:
+                self._tiles.move_to_end(key)
+                return entry[1]
+
+        full = self._full
+        if level == 0 and full is not None and full[0] == d:
+            r0, c0 = ty * self.tile, tx * self.tile
+            tile = full[1][r0:r0 + self.tile, c0:c0 + self.tile]
+        else:
+            coeffs, layout = self.coefficients(level, ty, tx)
+            if layout is None:
+                tile = reconstruct_blocks(coeffs, d, self.backend)
+            else:
+                tile = reconstruct_color(coeffs, layout, d, backend=self.backend)
+        tile.flags.writeable = False
+
+        with self._lock:
+            self._tiles[key] = (d, tile)
+            self._tiles.move_to_end(key)
+            while len(self._tiles) > self.max_tiles:
+                self._tiles.popitem(last=False)
+        return tile
+
+    def dc_preview(self, level, ty, tx):
+        """
+        Anteprima solo-DC del tile (media di ogni blocco F×F, canale per
+        canale) senza nessuna DCT: è ciò che mostra la decodifica progressiva
+        prima delle diagonali successive.
+        """
+        source = self._source(level, ty, tx)
+        F = self.F
+        rows, cols = source.shape[0] // F, source.shape[1] // F
+        blocks = source[:rows * F, :cols * F].reshape((rows, F, cols, F) + source.shape[2:])
+        means = round_clip(blocks.mean(axis=(1, 3))).astype(np.uint8)
+        return np.repeat(np.repeat(means, F, axis=0), F, axis=1)
+
+    def render(self, level, x0, y0, x1, y1, wait=True):
+        """
+        Regione [x0, x1) × [y0, y1) del livello (ritagliata all'immagine),
+        calcolando solo i tile visibili. Con wait=False i tile senza
+        coefficienti in cache sono mostrati con dc_preview e non calcolati:
+        restituisce allora (regione, tile mancanti), da completare in
+        sottofondo con prefetch e ridisegnare.
+        """
+        h, w = self.level_shape(level)
+        x0, y0 = max(0, int(x0)), max(0, int(y0))
+        x1, y1 = min(w, int(x1)), min(h, int(y1))
+        out = np.zeros((max(0, y1 - y0), max(0, x1 - x0)) + self.image.shape[2:], dtype=np.uint8)
+        missing = []
+        for ty, tx in self.tiles_in(level, x0, y0, x1, y1):
+            if wait or self.ready(level, ty, tx):
+                tile = self.get_tile(level, ty, tx)
+            else:
+                tile = self.dc_preview(level, ty, tx)
+                missing.append((ty, tx))
+            r0, c0 = ty * self.tile, tx * self.tile
+            a, b = max(y0, r0), min(y1, r0 + tile.shape[0])
+            c, e = max(x0, c0), min(x1, c0 + tile.shape[1])
+            out[a - y0:b - y0, c - x0:e - x0] = tile[a - r0:b - r0, c - c0:e - c0]
+        return out if wait else (out, missing)
+
+    def prefetch(self, level, tiles, cancelled=None):
+        """Calcola in anticipo i tile indicati (es. i vicini della vista); si ferma se `cancelled` è impostato."""
+        for ty, tx in tiles:
+            if cancelled is not None and cancelled.is_set():
+                return
+            self.get_tile(level, ty, tx)